@@ -0,0 +1,114 @@
+"""Time the snippets menu build on a synthetic tree of thousands of snippets.
+
+The synthetic tree has the same layout as this repository: several r_*.yml and
+py_*.yml configs in a build directory, which refer to SQL and code snippet files
+in sibling directories. Each SQL snippet is shared by one R and one Python config.
+
+It compares a full build in this process (--jobs 1), a full build on a pool of
+processes, and an incremental build in which nothing changed.
+
+Usage, from the `build` directory:
+  python3 benchmark_snippets_menu_build.py --num_snippets 1000 5000 --jobs 8
+"""
+
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import generate_jupyter_snippets_menu_extension_config as generator
+
+NUM_CONFIGS_PER_LANGUAGE = 4
+
+SQL = '''
+SELECT
+  person_id,
+  measurement_concept_id,
+  value_as_number
+FROM
+  `{{CDR}}.measurement`
+WHERE
+  measurement_concept_id = {{MEASUREMENT_CONCEPT_ID}}  -- Synthetic snippet %d
+'''
+
+CODE = '''
+# Synthetic snippet %d
+summary = df.groupby(['sex_at_birth']).agg(count=('person_id', 'nunique'))
+summary
+'''
+
+
+def create_synthetic_tree(root, num_snippets, padding_lines=0):
+  """Create snippet files and configs, with half SQL snippets and half code snippets.
+
+  Args:
+    root: The folder in which to create the build and snippet folders.
+    num_snippets: The number of snippet files.
+    padding_lines: The number of comment lines to add to each snippet, to make it larger.
+  """
+  padding = {extension: ''.join('{} Padding line {} of a large generated snippet.\n'.format(comment, j)
+                               for j in range(padding_lines))
+             for extension, comment in (('sql', '--'), ('py', '#'))}
+  os.makedirs(os.path.join(root, 'build'))
+  os.makedirs(os.path.join(root, 'synthetic-snippets'))
+  entries = []
+  for i in range(num_snippets):
+    extension = 'sql' if i % 2 else 'py'
+    name = 'snippet_{:06d}.{}'.format(i, extension)
+    with open(os.path.join(root, 'synthetic-snippets', name), 'w') as f:
+      f.write((SQL if extension == 'sql' else CODE) % i + padding[extension])
+    entries.append('    - {}: synthetic-snippets/{}\n'.format(name, name))
+
+  per_config = (len(entries) + NUM_CONFIGS_PER_LANGUAGE - 1) // NUM_CONFIGS_PER_LANGUAGE
+  for language in ('r', 'py'):
+    for c in range(NUM_CONFIGS_PER_LANGUAGE):
+      config = 'synthetic_{}_snippets_menu_config'.format(c)
+      with open(os.path.join(root, 'build', '{}_{}.yml'.format(language, config)), 'w') as f:
+        f.write('Synthetic snippets {}:\n  - Documentation: https://example.com\n'
+                '  - divider: divider\n  - Snippets:\n'.format(c))
+        f.writelines(entries[c * per_config:(c + 1) * per_config])
+      with open(os.path.join(root, 'build', '{}_{}.smoke_test_setup'.format(language, config)), 'w') as f:
+        f.write('# Smoke test setup\n')
+
+
+def time_build(jobs, force):
+  manifest = generator.load_manifest(generator.MANIFEST_FILE)
+  sources = generator.SourceFiles(previous_stats=manifest['files'])
+  start = time.perf_counter()
+  if jobs > 1:
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+  else:
+    executor = generator.InlineExecutor()
+  with executor:
+    built = generator.build(generator.get_build_targets(), manifest, sources, executor, force=force)
+  manifest['files'] = sources.stats
+  generator.save_manifest(generator.MANIFEST_FILE, manifest)
+  return time.perf_counter() - start, len(built)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_snippets', type=int, nargs='+', default=[1000, 5000])
+  parser.add_argument('--jobs', type=int, default=os.cpu_count())
+  args = parser.parse_args()
+
+  print('{:>9}{:>12}{:>12}{:>14}'.format('snippets', 'jobs=1', 'jobs={}'.format(args.jobs), 'incremental'))
+  cwd = os.getcwd()
+  for num_snippets in args.num_snippets:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      create_synthetic_tree(tmpdirname, num_snippets)
+      os.chdir(os.path.join(tmpdirname, 'build'))
+      try:
+        serial_seconds, _ = time_build(jobs=1, force=True)
+        parallel_seconds, _ = time_build(jobs=args.jobs, force=True)
+        incremental_seconds, num_built = time_build(jobs=args.jobs, force=False)
+        assert num_built == 0
+      finally:
+        os.chdir(cwd)
+    print('{:>9}{:>11.2f}s{:>11.2f}s{:>13.2f}s'.format(
+        num_snippets, serial_seconds, parallel_seconds, incremental_seconds))
+
+
+if __name__ == '__main__':
+  main()
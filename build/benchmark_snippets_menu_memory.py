@@ -0,0 +1,62 @@
+"""Measure the peak memory of the snippets menu build as the configs grow.
+
+Each build runs in a fresh process, in this process's pool-free mode (--jobs 1),
+on a synthetic tree of large snippets from benchmark_snippets_menu_build. The
+peak resident set size of the default build grows with the total size of the
+snippets, while that of the streaming build (--stream) stays flat.
+
+Usage, from the `build` directory:
+  python3 benchmark_snippets_menu_memory.py --num_snippets 1000 4000 16000 --padding_lines 100
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark_snippets_menu_build import create_synthetic_tree
+
+BUILD_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MEASURE_BUILD = '''
+import resource, sys
+sys.path.insert(0, {build_dir!r})
+sys.argv = ['generate_jupyter_snippets_menu_extension_config.py', '--jobs', '1', '--force'] + {args!r}
+import generate_jupyter_snippets_menu_extension_config as generator
+generator.main()
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+'''
+
+
+def measure_peak_rss_mb(args):
+  result = subprocess.run([sys.executable, '-c', MEASURE_BUILD.format(build_dir=BUILD_DIR, args=args)],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, encoding='utf-8')
+  # On Linux, ru_maxrss is in kilobytes.
+  return int(result.stderr.split()[-1]) / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_snippets', type=int, nargs='+', default=[1000, 4000, 16000])
+  parser.add_argument('--padding_lines', type=int, default=100)
+  args = parser.parse_args()
+
+  print('{:>9}{:>12}{:>12}{:>12}'.format('snippets', 'source', 'default', 'streaming'))
+  for num_snippets in args.num_snippets:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      create_synthetic_tree(tmpdirname, num_snippets, padding_lines=args.padding_lines)
+      source_dir = os.path.join(tmpdirname, 'synthetic-snippets')
+      source_mb = sum(os.path.getsize(os.path.join(source_dir, f)) for f in os.listdir(source_dir)) / 2 ** 20
+      cwd = os.getcwd()
+      os.chdir(os.path.join(tmpdirname, 'build'))
+      try:
+        default_mb = measure_peak_rss_mb([])
+        streaming_mb = measure_peak_rss_mb(['--stream'])
+      finally:
+        os.chdir(cwd)
+    print('{:>9}{:>10.1f}MB{:>10.1f}MB{:>10.1f}MB'.format(num_snippets, source_mb, default_mb, streaming_mb))
+
+
+if __name__ == '__main__':
+  main()
@@ -3,18 +3,43 @@
 Additionally, create smoke test scripts for both R and Python that include all
 the snippets.
 
+The build is incremental: a manifest of the content hashes of each config's
+inputs and outputs is kept in MANIFEST_FILE, and a config whose inputs and
+outputs are unchanged since the previous build is skipped. Within one run, each
+source file is read at most once and each query template is compiled once per
+process.
+
+The configs which need to be rebuilt are built as a small dependency graph:
+
+  YAML -> resolved menu tree and snippet files -> rendered snippet code -> JSON and smoke test
+
+Each config is parsed, its snippet files are rendered in batches shared with the
+other configs, and its JSON and smoke test are written, all on a pool of
+processes, with each step starting as soon as the steps it depends on are done.
+
 See also: https://jupyter-contrib-nbextensions.readthedocs.io/en/latest/nbextensions/snippets_menu/readme.html
 """
 
+import argparse
+import concurrent.futures
 import glob
+import hashlib
 import jinja2
 import json
 import os
+import string
 import yaml
 
 # Input file directory.
 SNIPPETS_ROOT = '../'
 
+# The content hashes from the previous build, relative to the build directory.
+MANIFEST_FILE = '.snippets_menu_manifest.json'
+MANIFEST_VERSION = 1
+
+# The number of snippet files rendered by each task on the pool of processes.
+RENDER_BATCH_SIZE = 64
+
 R_QUERY_TEMPLATE = '''
 {{ dataframe }} <- bq_table_download(bq_project_query(
     BILLING_PROJECT_ID, page_size = 25000,
@@ -26,23 +51,91 @@ head({{ dataframe }})
 '''
 
 PY_QUERY_TEMPLATE = """
-{{ dataframe }} = pd.io.gbq.read_gbq(f'''
+{{ dataframe }} = run_query('''
 {{ query }}
-''',
-  dialect='standard')
+'''{% for parameter in parameters %},
+  {{ parameter }}={{ parameter }}{% endfor %})
 
 {{ dataframe }}.head()
 """
 
+# The C implementation of the YAML parser is much faster, when it is available.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Compiled query templates, keyed by their source.
+_TEMPLATES = {}
+
+
+def get_template(query_template):
+  """Compile the query template on first use."""
+  if query_template not in _TEMPLATES:
+    _TEMPLATES[query_template] = jinja2.Template(query_template)
+  return _TEMPLATES[query_template]
+
+
+def get_file_stats(path, contents):
+  """Compute the manifest record for a file: its modification time, size and content hash."""
+  stat = os.stat(path)
+  return [stat.st_mtime_ns, stat.st_size, hashlib.sha256(contents.encode('utf-8')).hexdigest()]
+
 
-def generate_config(d, query_template, smoke_test_fh):
-  """Given a dictionary, convert that to snippets menu configuration."""
+class SourceFiles(object):
+  """Read each file at most once per run, and fingerprint files for the manifest.
+
+  A file whose modification time and size are unchanged since the previous build
+  is assumed to have the same content hash, so that it need not be read at all.
+  """
+
+  def __init__(self, previous_stats=None):
+    self._previous_stats = previous_stats or {}
+    self._contents = {}
+    self.stats = {}
+
+  def read(self, path):
+    if path not in self._contents:
+      with open(path, 'r') as f:
+        self._contents[path] = f.read()
+    return self._contents[path]
+
+  def get_hash(self, path):
+    """Retrieve the content hash of the file, or None if it does not exist."""
+    if path in self.stats:
+      return self.stats[path][2]
+    try:
+      stat = os.stat(path)
+    except FileNotFoundError:
+      return None
+    previous = self._previous_stats.get(path)
+    if previous and previous[:2] == [stat.st_mtime_ns, stat.st_size]:
+      content_hash = previous[2]
+    else:
+      content_hash = hashlib.sha256(self.read(path).encode('utf-8')).hexdigest()
+    self.stats[path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+    return content_hash
+
+  def get_cached(self, path):
+    """Retrieve the contents of the file if it was already read, or else None."""
+    return self._contents.get(path)
+
+  def update(self, stats):
+    """Record the manifest records of files which were read or written by another process."""
+    for path in stats:
+      self._contents.pop(path, None)
+    self.stats.update(stats)
+
+
+def resolve_config(d, snippets):
+  """Given a dictionary, convert that to snippets menu configuration.
+
+  The code of each snippet file is left as None, to be filled in once it has been
+  rendered. Each such snippet is appended to snippets as a tuple of its name, its
+  file and its configuration, in the order in which they appear in the menu.
+  """
   for key, value in d.items():
     if isinstance(value, list):
       return {
           'name': key,
-          'sub-menu': [generate_config(x, query_template, smoke_test_fh)
-                       for x in value]
+          'sub-menu': [resolve_config(x, snippets) for x in value]
       }
 
     if value == 'divider':
@@ -55,22 +148,12 @@ def generate_config(d, query_template, smoke_test_fh):
       }
 
     if os.path.isfile(os.path.join(SNIPPETS_ROOT, value)):
-      if value.endswith('.sql'):
-        # Render SQL to snippets in the desired language.
-        sql = open(os.path.join(SNIPPETS_ROOT, value), 'r').read()
-        dataframe_name = os.path.splitext(os.path.basename(value))[0] + '_df'
-        code = jinja2.Template(query_template).render(
-            {'dataframe': dataframe_name, 'query': sql})
-      else:
-        # It's a non-sql file, just read it in.
-        code = open(os.path.join(SNIPPETS_ROOT, value), 'r').read()
-
-      smoke_test_fh.write('#---[ This is snippet: {} ]---\n{}\n\n'.format(key,
-                                                                          code))
-      return {
+      snippet = {
           'name': key,
-          'snippet': code
+          'snippet': None
       }
+      snippets.append((key, value, snippet))
+      return snippet
 
     # Its not a file, so we will use the value directly.
     return {
@@ -79,38 +162,471 @@ def generate_config(d, query_template, smoke_test_fh):
     }
 
 
-def render_files(config_file, query_template, output_file,
-                 smoke_test_setup_file, smoke_test_file):
-  """Use configuration to drive the autogeneration of snippets and tests."""
-  with open(config_file, 'r') as f:
-    config = yaml.safe_load(f.read())
+def read_file(path, contents=None):
+  """Read the file, unless its contents were already read, and compute its manifest record."""
+  if contents is None:
+    with open(path, 'r') as f:
+      contents = f.read()
+  return contents, get_file_stats(path, contents)
+
+
+def load_config(config_file, contents=None, verbose=False):
+  """Parse a config and resolve its menu tree.
+
+  Args:
+    config_file: The YAML file of the config.
+    contents: The contents of the file, if they were already read.
+    verbose: Whether to also return the config as YAML, for printing.
+  Returns:
+    A tuple of the menu tree and the snippet files from resolve_config, the
+    manifest records of the files which were read, and the YAML or None.
+  """
+  contents, stats = read_file(config_file, contents)
+  config = yaml.load(contents, Loader=SafeLoader)
+  snippets = []
+  snippets_config = resolve_config(config, snippets)
+  return snippets_config, snippets, {config_file: stats}, yaml.dump(config) if verbose else None
+
+
+def get_query_parameters(query):
+  """List the names of the placeholders in the query, such as CDR, in order of first appearance."""
+  parameters = []
+  try:
+    for _, name, _, _ in string.Formatter().parse(query):
+      if name is not None and name not in parameters:
+        parameters.append(name)
+  except ValueError:
+    pass  # Unbalanced braces, which the query template will pass through as-is.
+  return parameters
+
+
+def render_query_snippet(value, query_template, contents):
+  """Render SQL to a snippet in the desired language."""
+  dataframe_name = os.path.splitext(os.path.basename(value))[0] + '_df'
+  return get_template(query_template).render(
+      {'dataframe': dataframe_name, 'query': contents, 'parameters': get_query_parameters(contents)})
+
+
+def render_snippets(batch):
+  """Render a batch of snippet files.
+
+  Args:
+    batch: A list of tuples of the snippet file, relative to SNIPPETS_ROOT, the
+      query template, and the contents of the file if they were already read.
+  Returns:
+    A tuple of the rendered code of each snippet, in the same order as the batch,
+    and the manifest records of the files which were read.
+  """
+  codes = []
+  stats = {}
+  for value, query_template, contents in batch:
+    path = os.path.join(SNIPPETS_ROOT, value)
+    contents, stats[path] = read_file(path, contents)
+    if value.endswith('.sql'):
+      codes.append(render_query_snippet(value, query_template, contents))
+    else:
+      # It's a non-sql file, just read it in.
+      codes.append(contents)
+  return codes, stats
 
-  print(yaml.dump(config))
 
+def write_config(snippets_config, smoke_test_snippets, smoke_test_setup,
+                 output_file, smoke_test_file):
+  """Write the JSON configuration and the smoke test for one config.
+
+  Returns:
+    The manifest records of the files which were written.
+  """
+  parts = [smoke_test_setup]
+  for key, code in smoke_test_snippets:
+    parts.append('#---[ This is snippet: {} ]---\n{}\n\n'.format(key, code))
+  parts.append('\nprint("Smoke test complete!")')
+  smoke_test = ''.join(parts)
   with open(smoke_test_file, 'w') as f:
-    with open(smoke_test_setup_file, 'r') as setup_f:
-      f.write(setup_f.read())
-    snippets_config = generate_config(config, query_template, f)
-    f.write('\nprint("Smoke test complete!")')
+    f.write(smoke_test)
 
+  output = json.dumps(snippets_config)
   with open(output_file, 'w') as f:
-    json.dump(snippets_config, f)
-
-for r_yaml in glob.glob('r_*.yml'):
-  render_files(
-    config_file=r_yaml,
-    query_template=R_QUERY_TEMPLATE,
-    output_file=r_yaml.replace('.yml', '.json'),
-    smoke_test_setup_file=r_yaml.replace('.yml', '.smoke_test_setup'),
-    smoke_test_file=r_yaml.replace('.yml', '_smoke_test.R'),
-    )
-
-for py_yaml in glob.glob('py_*.yml'):
-  render_files(
-    config_file=py_yaml,
-    query_template=PY_QUERY_TEMPLATE,
-    output_file=py_yaml.replace('.yml', '.json'),
-    smoke_test_setup_file=py_yaml.replace('.yml', '.smoke_test_setup'),
-    smoke_test_file=py_yaml.replace('.yml', '_smoke_test.py'),
-    )
-    
+    f.write(output)
+  return {smoke_test_file: get_file_stats(smoke_test_file, smoke_test),
+          output_file: get_file_stats(output_file, output)}
+
+
+class HashingWriter(object):
+  """Write text to a file, computing its manifest record along the way."""
+
+  def __init__(self, f):
+    self._f = f
+    self._sha256 = hashlib.sha256()
+
+  def write(self, text):
+    self._f.write(text)
+    self._sha256.update(text.encode('utf-8'))
+
+  def get_file_stats(self):
+    self._f.flush()
+    stat = os.fstat(self._f.fileno())
+    return [stat.st_mtime_ns, stat.st_size, self._sha256.hexdigest()]
+
+
+class HashingReader(object):
+  """Read text from a file, computing its manifest record along the way."""
+
+  def __init__(self, f):
+    self._f = f
+    self._sha256 = hashlib.sha256()
+
+  def read(self, size=-1):
+    text = self._f.read(size)
+    self._sha256.update(text.encode('utf-8'))
+    return text
+
+  def get_file_stats(self):
+    # Include anything after the part that was parsed, such as trailing comments.
+    while self.read(65536):
+      pass
+    stat = os.fstat(self._f.fileno())
+    return [stat.st_mtime_ns, stat.st_size, self._sha256.hexdigest()]
+
+
+def render_snippet(value, query_template):
+  """Render one snippet file, returning its code and its manifest record."""
+  path = os.path.join(SNIPPETS_ROOT, value)
+  contents, stats = read_file(path)
+  if value.endswith('.sql'):
+    return render_query_snippet(value, query_template, contents), stats
+  # It's a non-sql file, just read it in.
+  return contents, stats
+
+
+def get_scalar(loader, event):
+  """Construct the value of a YAML scalar event, with the same type as yaml.safe_load would give it."""
+  node = yaml.ScalarNode(loader.resolve(yaml.ScalarNode, event.value, event.implicit),
+                         event.value, event.start_mark, event.end_mark, style=event.style)
+  value = loader.construct_object(node)
+  # The loader remembers each constructed object until the end of the document. These are not needed again.
+  loader.constructed_objects = {}
+  return value
+
+
+def skip_rest_of_mapping(loader):
+  """Consume the events up to and including the end of the current mapping."""
+  depth = 0
+  while True:
+    event = loader.get_event()
+    if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+      depth += 1
+    elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+      if not depth:
+        return
+      depth -= 1
+
+
+def stream_config(loader, query_template, json_fh, smoke_test_fh):
+  """Write the snippets menu configuration for a config one entry at a time.
+
+  The output is the same as json.dump of the configuration from resolve_config,
+  but the config is read as a stream of YAML parser events and the menu tree is
+  walked with a stack instead of recursion. Neither the parsed config nor the
+  code of more than one snippet is held in memory at once.
+
+  Args:
+    loader: A YAML loader positioned at the start of the config.
+    query_template: The template with which to render SQL snippets.
+    json_fh: The file to which to write the JSON configuration.
+    smoke_test_fh: The file to which to write the snippets for the smoke test.
+  Returns:
+    A tuple of the snippet files, relative to SNIPPETS_ROOT, in menu order, and
+    the manifest records of the files which were read.
+  """
+  snippet_files = []
+  stats = {}
+  loader.get_event()  # The start of the stream.
+  loader.get_event()  # The start of the document.
+  # For each enclosing sub-menu, whether its next entry is its first.
+  stack = []
+  while True:
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+      raise ValueError('YAML aliases are not supported when streaming: {}'.format(event.start_mark))
+    if stack:
+      if isinstance(event, yaml.SequenceEndEvent):
+        json_fh.write(']}')
+        stack.pop()
+        # Like resolve_config, only the first entry of each dictionary is used.
+        skip_rest_of_mapping(loader)
+        if not stack:
+          break
+        continue
+      if not stack[-1]:
+        json_fh.write(', ')
+      stack[-1] = False
+    if not isinstance(event, yaml.MappingStartEvent):
+      raise ValueError('Expected a dictionary: {}'.format(event.start_mark))
+
+    event = loader.get_event()
+    if isinstance(event, yaml.MappingEndEvent):
+      json_fh.write('null')
+    else:
+      key = get_scalar(loader, event)
+      event = loader.get_event()
+      if isinstance(event, yaml.SequenceStartEvent):
+        json_fh.write('{{"name": {}, "sub-menu": ['.format(json.dumps(key)))
+        stack.append(True)
+        continue
+      if not isinstance(event, yaml.ScalarEvent):
+        raise ValueError('Expected a list or a string: {}'.format(event.start_mark))
+      value = get_scalar(loader, event)
+      if value == 'divider':
+        json_fh.write(json.dumps('---'))
+      elif value.startswith('http'):
+        json_fh.write('{{"name": {}, "external-link": {}}}'.format(json.dumps(key), json.dumps(value)))
+      elif os.path.isfile(os.path.join(SNIPPETS_ROOT, value)):
+        code, file_stats = render_snippet(value, query_template)
+        stats[os.path.join(SNIPPETS_ROOT, value)] = file_stats
+        snippet_files.append(value)
+        smoke_test_fh.write('#---[ This is snippet: {} ]---\n{}\n\n'.format(key, code))
+        json_fh.write('{{"name": {}, "snippet": {}}}'.format(json.dumps(key), json.dumps(code)))
+      else:
+        # Its not a file, so we will use the value directly.
+        json_fh.write('{{"name": {}, "snippet": {}}}'.format(json.dumps(key), json.dumps(value)))
+      skip_rest_of_mapping(loader)
+    if not stack:
+      break
+  return snippet_files, stats
+
+
+def stream_config_files(config_file, query_template, output_file,
+                        smoke_test_setup_file, smoke_test_file, verbose=False):
+  """Write the JSON configuration and smoke test of a config incrementally.
+
+  Each output is written to a temporary file which replaces it once complete.
+
+  Returns:
+    A tuple of the snippet files, relative to SNIPPETS_ROOT, and the manifest
+    records of the files which were read or written.
+  """
+  setup, setup_stats = read_file(smoke_test_setup_file)
+  if verbose:
+    with open(config_file, 'r') as f:
+      print(yaml.dump(yaml.load(f, Loader=SafeLoader)))
+
+  with open(config_file, 'r') as config_f:
+    # Hash the config as the parser reads it, so that it is read only once.
+    config_fh = HashingReader(config_f)
+    loader = SafeLoader(config_fh)
+    try:
+      with open(smoke_test_file + '.tmp', 'w') as smoke_test_f, open(output_file + '.tmp', 'w') as output_f:
+        smoke_test_fh = HashingWriter(smoke_test_f)
+        json_fh = HashingWriter(output_f)
+        smoke_test_fh.write(setup)
+        snippet_files, stats = stream_config(loader, query_template, json_fh, smoke_test_fh)
+        smoke_test_fh.write('\nprint("Smoke test complete!")')
+        stats[smoke_test_file] = smoke_test_fh.get_file_stats()
+        stats[output_file] = json_fh.get_file_stats()
+    finally:
+      loader.dispose()
+    stats[config_file] = config_fh.get_file_stats()
+  os.replace(smoke_test_file + '.tmp', smoke_test_file)
+  os.replace(output_file + '.tmp', output_file)
+  stats[smoke_test_setup_file] = setup_stats
+  return snippet_files, stats
+
+
+class InlineExecutor(concurrent.futures.Executor):
+  """Run each task immediately in the calling process, for builds too small to be worth a pool."""
+
+  def submit(self, fn, *args, **kwargs):
+    future = concurrent.futures.Future()
+    try:
+      future.set_result(fn(*args, **kwargs))
+    except Exception as e:  # pylint: disable=broad-except
+      future.set_exception(e)
+    return future
+
+
+def load_manifest(manifest_file):
+  """Load the manifest of the previous build, or an empty one if there is none."""
+  try:
+    with open(manifest_file, 'r') as f:
+      manifest = json.load(f)
+    if manifest.get('version') == MANIFEST_VERSION:
+      return manifest
+  except (OSError, ValueError):
+    pass  # A missing or corrupt manifest means everything is rebuilt.
+  return {'version': MANIFEST_VERSION, 'files': {}, 'configs': {}}
+
+
+def save_manifest(manifest_file, manifest):
+  temp_file = manifest_file + '.tmp'
+  with open(temp_file, 'w') as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+  os.replace(temp_file, manifest_file)
+
+
+def is_up_to_date(entry, sources):
+  """Whether the inputs and outputs recorded for a config all still have the same content hashes."""
+  if not entry:
+    return False
+  for path, content_hash in list(entry['inputs'].items()) + list(entry['outputs'].items()):
+    if sources.get_hash(path) != content_hash:
+      return False
+  return True
+
+
+def get_build_targets():
+  """Retrieve the files and query template of each config in the build directory."""
+  targets = []
+  for pattern, query_template, smoke_test_suffix in (
+      ('r_*.yml', R_QUERY_TEMPLATE, '_smoke_test.R'),
+      ('py_*.yml', PY_QUERY_TEMPLATE, '_smoke_test.py')):
+    for config_file in glob.glob(pattern):
+      targets.append({
+          'config_file': config_file,
+          'query_template': query_template,
+          'output_file': config_file.replace('.yml', '.json'),
+          'smoke_test_setup_file': config_file.replace('.yml', '.smoke_test_setup'),
+          'smoke_test_file': config_file.replace('.yml', smoke_test_suffix),
+      })
+  return targets
+
+
+def build(targets, manifest, sources, executor, force=False, verbose=False, stream=False):
+  """Rebuild the configs whose inputs or outputs changed since the previous build.
+
+  Each step of the dependency graph is a task on the executor, submitted as soon
+  as the tasks it depends on are done: each config is loaded, the snippets it
+  needs which are not already rendered are rendered in batches, and the config is
+  written once the last of its snippets is rendered.
+
+  When streaming, each config is instead a single task which renders and writes
+  one snippet at a time, so that memory use does not grow with the total size of
+  the snippets. Snippets shared between configs are then rendered once per config.
+
+  Args:
+    targets: The files and query template of each config, from get_build_targets.
+    manifest: The manifest of the previous build. It is updated in place.
+    sources: The source files for this run.
+    executor: The pool on which to run the tasks.
+    force: Whether to rebuild every config, even if its inputs and outputs are unchanged.
+    verbose: Whether to print each config as it is rebuilt.
+    stream: Whether to write the outputs of each config incrementally.
+  Returns:
+    The config files which were rebuilt.
+  """
+  stale = [t for t in targets
+           if force or not is_up_to_date(manifest['configs'].get(t['config_file']), sources)]
+
+  tasks = {}  # The kind and index, or batch, of each task which is not done yet.
+  resolved = [None] * len(stale)
+  snippet_files = [None] * len(stale)
+  num_pending = [0] * len(stale)
+  waiting = {}  # The configs waiting for each snippet which is not rendered yet.
+  codes = {}
+
+  def write(i):
+    target = stale[i]
+    snippets_config, snippets = resolved[i]
+    smoke_test_snippets = []
+    for key, value, snippet in snippets:
+      snippet['snippet'] = codes[(value, target['query_template'])]
+      smoke_test_snippets.append((key, snippet['snippet']))
+    future = executor.submit(
+        write_config, snippets_config, smoke_test_snippets,
+        sources.read(target['smoke_test_setup_file']),
+        target['output_file'], target['smoke_test_file'])
+    tasks[future] = ('write', i)
+
+  for i, target in enumerate(stale):
+    if stream:
+      tasks[executor.submit(stream_config_files, verbose=verbose, **target)] = ('stream', i)
+    else:
+      future = executor.submit(load_config, target['config_file'],
+                               sources.get_cached(target['config_file']), verbose)
+      tasks[future] = ('load', i)
+
+  while tasks:
+    done, _ = concurrent.futures.wait(tasks, return_when=concurrent.futures.FIRST_COMPLETED)
+    for future in done:
+      kind, payload = tasks.pop(future)
+      if kind == 'load':
+        i = payload
+        snippets_config, snippets, stats, dump = future.result()
+        sources.update(stats)
+        if dump:
+          print(dump)
+        resolved[i] = (snippets_config, snippets)
+        snippet_files[i] = [value for _, value, _ in snippets]
+        keys = [(value, stale[i]['query_template']) for _, value, _ in snippets]
+        keys = [key for key in dict.fromkeys(keys) if key not in codes]
+        unscheduled = [key for key in keys if key not in waiting]
+        for key in keys:
+          waiting.setdefault(key, []).append(i)
+        num_pending[i] = len(keys)
+        for b in range(0, len(unscheduled), RENDER_BATCH_SIZE):
+          batch = unscheduled[b:b + RENDER_BATCH_SIZE]
+          future = executor.submit(render_snippets, [
+              (value, query_template, sources.get_cached(os.path.join(SNIPPETS_ROOT, value)))
+              for value, query_template in batch])
+          tasks[future] = ('render', batch)
+        if not num_pending[i]:
+          write(i)
+      elif kind == 'render':
+        batch_codes, stats = future.result()
+        codes.update(zip(payload, batch_codes))
+        sources.update(stats)
+        for key in payload:
+          for i in waiting.pop(key):
+            num_pending[i] -= 1
+            if not num_pending[i]:
+              write(i)
+      elif kind == 'stream':
+        snippet_files[payload], stats = future.result()
+        sources.update(stats)
+      else:
+        sources.update(future.result())
+
+  for target, files in zip(stale, snippet_files):
+    # The query templates are part of this script, so it is an input too.
+    inputs = ([target['config_file'], target['smoke_test_setup_file'], __file__]
+              + [os.path.join(SNIPPETS_ROOT, value) for value in files])
+    outputs = [target['output_file'], target['smoke_test_file']]
+    manifest['configs'][target['config_file']] = {
+        'inputs': {path: sources.get_hash(path) for path in inputs},
+        'outputs': {path: sources.get_hash(path) for path in outputs},
+    }
+  return [target['config_file'] for target in stale]
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--force', action='store_true',
+                      help='Rebuild every config, even if its inputs are unchanged.')
+  parser.add_argument('--verbose', action='store_true',
+                      help='Print each config as it is rebuilt.')
+  parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                      help='The number of processes to use. Use 1 to build in this process.')
+  parser.add_argument('--stream', action='store_true',
+                      help='Write each config one snippet at a time, to bound memory use for large configs.')
+  args = parser.parse_args()
+
+  manifest = load_manifest(MANIFEST_FILE)
+  sources = SourceFiles(previous_stats=manifest['files'])
+  targets = get_build_targets()
+  if args.jobs > 1:
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs)
+  else:
+    executor = InlineExecutor()
+  with executor:
+    built = build(targets, manifest, sources, executor, force=args.force, verbose=args.verbose,
+                  stream=args.stream)
+  for target in targets:
+    print('{}: {}'.format(target['config_file'],
+                          'built' if target['config_file'] in built else 'unchanged'))
+  manifest['files'] = sources.stats
+  save_manifest(MANIFEST_FILE, manifest)
+
+
+if __name__ == '__main__':
+  main()
@@ -3,7 +3,8 @@
 # It also assumes that you got your demographics dataframe from Dataset Builder
 
 # Note: This snippet calculates current age and does not take into account whether the person is already dead
+# Tip: pass a second column, such as measurement_df['measurement_datetime'], to calculate the age at that time instead.
 
 
 ## -----[ CHANGE THE DATAFRAME NAME(S) `YOUR_DATASET_NAME_person_df` TO MATCH YOURS FROM DATASET BUILDER] -----
-YOUR_DATASET_NAME_person_df['age'] = pd.to_datetime('today').year - YOUR_DATASET_NAME_person_df['date_of_birth'].dt.year
+YOUR_DATASET_NAME_person_df['age'] = age_in_years(YOUR_DATASET_NAME_person_df['date_of_birth'])
@@ -4,10 +4,13 @@
 # In the example below, it joins Demographics '_person_df' and Measurements '_measurement_df' using
 # any columns they have in common, which in this case should only be 'person_id'.
 #
+# To save memory, ids are stored as int32 where they fit and repeated strings, such as concept names,
+# as categoricals. To keep only some of the columns, pass them as columns=['person_id', ...].
+#
 # See also https://pandas.pydata.org/pandas-docs/version/0.25.1/reference/api/pandas.merge.html
 
 
 ## -----[ CHANGE THE DATAFRAME NAME(S) TO MATCH YOURS FROM DATASET BUILDER] -----
-measurement_df = pd.merge(left=YOUR_DATASET_NAME_person_df, right=YOUR_DATASET_NAME_measurement_df, how='inner')
+measurement_df = join_dataframes(YOUR_DATASET_NAME_person_df, YOUR_DATASET_NAME_measurement_df, report=True)
 
 measurement_df.shape
@@ -6,6 +6,81 @@ import plotnine
 from plotnine import *  # Provides a ggplot-like interface to matplotlib.
 from IPython.display import display
 
+try:
+  # Summarize survey data with one pass over the dataframe, shared by all the summaries of it.
+  from terra_widgets.survey_summary import summarize_survey_module
+  from terra_widgets.survey_summary import summarize_survey_question
+except ImportError:
+  def summarize_survey_module(df, module=None, denominator=None, exact=True):
+    """Count the participants of each question of the module."""
+    if isinstance(df, str):
+      df = pd.read_csv(df) if df.endswith(('.csv', '.csv.gz')) else pd.read_parquet(df)
+    if module:
+      df = df[df['survey'].str.lower() == module.lower()].copy()
+    data = (df.groupby(['survey','question_concept_id','question'])['person_id'].nunique()
+                .reset_index()
+                .rename(columns={'person_id':'n_participant'}))
+    if denominator:
+      data['response_rate'] = round(100*data['n_participant']/denominator,2)
+    return data
+
+  def summarize_survey_question(df, question_concept_id, denominator=None, exact=True):
+    """Count the participants of each answer to the question, returning the question and the counts."""
+    if isinstance(df, str):
+      df = pd.read_csv(df) if df.endswith(('.csv', '.csv.gz')) else pd.read_parquet(df)
+    df = df.loc[df['question_concept_id'] == question_concept_id].copy()
+    new_df = df.groupby(['answer_concept_id', 'answer'])['person_id']\
+           .nunique()\
+           .reset_index()\
+           .rename(columns=dict(person_id='n_participant'))\
+           .assign(answer_concept_id = lambda x: np.int32(x.answer_concept_id))
+    if denominator:
+      new_df['response_rate'] = round(100*new_df['n_participant']/denominator,2)
+    question = df['question'].iloc[0] if len(df) else None
+    return question, new_df
+
+try:
+  # Join dataframes with smaller dtypes and without copying the columns which are not needed.
+  from terra_widgets.dataframe_join import join_dataframes
+except ImportError:
+  def join_dataframes(left, right, on=None, columns=None, report=False):
+    """Inner join two dataframes on the columns they have in common."""
+    data = pd.merge(left=left, right=right, how='inner', on=on)
+    return data[columns] if columns else data
+
+try:
+  # Summarize every row of a dataframe in one pass, with the correlations of a random sample of them.
+  from terra_widgets.dataframe_summary import summarize_dataframe
+except ImportError:
+  import types
+
+  def summarize_dataframe(df, sample_size=10000, stratify_by=None, time_budget_seconds=None):
+    """Describe each column of the dataframe, with the correlations of a random sample of its rows."""
+    if stratify_by:
+      per_stratum = max(sample_size // max(df[stratify_by].nunique(dropna=False), 1), 1)
+      sample = df.groupby(stratify_by, dropna=False, group_keys=False).apply(
+          lambda group: group.sample(n=min(len(group), per_stratum), random_state=0))
+    else:
+      sample = df.sample(n=min(sample_size, len(df)), random_state=0)
+    numeric = sample.select_dtypes('number')
+    return types.SimpleNamespace(statistics=df.describe(include='all').T, sample=sample,
+                                 correlations={'pearson': numeric.corr(), 'spearman': numeric.corr(method='spearman')})
+
+try:
+  # Compute exact ages from the year, month and day of each date, for whole columns at once.
+  from terra_widgets.age import age_in_years
+except ImportError:
+  def age_in_years(birth_datetime, as_of=None):
+    """Compute the age in whole years of each participant, as of today or of the time of an event."""
+    birth = pd.to_datetime(birth_datetime)
+    if isinstance(as_of, pd.Series):
+      as_of = pd.to_datetime(as_of)
+      year, month, day = as_of.dt.year, as_of.dt.month, as_of.dt.day
+    else:
+      as_of = pd.Timestamp('today') if as_of is None else pd.Timestamp(as_of)
+      year, month, day = as_of.year, as_of.month, as_of.day
+    return (year - birth.dt.year) - ((month * 100 + day) < (birth.dt.month * 100 + birth.dt.day))
+
 ## Plot setup.
 theme_set(theme_bw(base_size = 11)) # Default theme for plots.
 
@@ -1,8 +1,20 @@
 # Use snippet 'summarize_a_dataframe' to display summary statistics for a dataframe.
 # It assumes snippet 'Setup' has been executed.
+#
+# The statistics of each column are computed over all of its rows. The quantiles and the numbers of
+# distinct values are close estimates. The correlations are computed on a random sample of the rows.
+# To sample an equal number of rows of each value of a column, set stratify_by to it, such as 'sex_at_birth'.
+# To summarize a random subset of the rows of a very large dataframe within about a minute, set
+# time_budget_seconds = 60.
 # See also https://towardsdatascience.com/exploring-your-data-with-just-1-line-of-python-4b35ce21a82d
 
 
 ## -----[ CHANGE THE DATAFRAME NAME(S) TO MATCH YOURS FROM DATASET BUILDER] -----
-YOUR_DATASET_NAME_person_df.loc[:10000,:].profile_report()  # Examine up to the first 10,000 rows. Larger
-                                                            # dataframes can be profiled, but it takes more time.
+summary = summarize_dataframe(YOUR_DATASET_NAME_person_df, sample_size=10000, stratify_by=None,
+                              time_budget_seconds=None)
+
+display(summary.statistics)
+display(summary.correlations['spearman'])
+
+summary.sample.profile_report()  # Profile the sampled rows in detail, including the interactions
+                                 # between columns. Larger samples can be profiled, but it takes more time.
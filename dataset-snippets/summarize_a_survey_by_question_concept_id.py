@@ -1,27 +1,24 @@
 # Use snippet 'summarize_a_survey_module' to output a table and a graph of 
 # participant counts by response for one question_concept_id
 # The snippet assumes that a dataframe containing survey questions and answers already exists
+# For survey data too large for memory, set survey_df to the path of Parquet or CSV files of it
+# instead, such as f'{os.environ["WORKSPACE_BUCKET"]}/data/survey/', which is read in batches.
 # The snippet also assumes that setup has been run
 
-# Update the next 3 lines
+# Update the next 4 lines
 survey_df = YOUR_DATASET_NAME_survey_df
 question_concept_id = 1585940
 denominator = None # e.g: 200000
+exact = True # Set to False for files of the whole cohort: the counts are then estimated to within
+              # about 1%, in memory which does not grow with the files, as exact counts' memory does.
 
 ####################################################################################
 #                           DON'T CHANGE FROM HERE
 ####################################################################################
-def summarize_a_question_concept_id(df, question_concept_id, denominator=None):
-    df = df.loc[df['question_concept_id'] == question_concept_id].copy()
-    new_df = df.groupby(['answer_concept_id', 'answer'])['person_id']\
-           .nunique()\
-           .reset_index()\
-           .rename(columns=dict(person_id='n_participant'))\
-           .assign(answer_concept_id = lambda x: np.int32(x.answer_concept_id))
-    if denominator:
-        new_df['response_rate'] = round(100*new_df['n_participant']/denominator,2)
-    if question_concept_id in df['question_concept_id'].unique():
-        print(f"Distribution of response to {df.loc[df['question_concept_id'] == question_concept_id, 'question'].unique()[0]}")
+def summarize_a_question_concept_id(df, question_concept_id, denominator=None, exact=True):
+    question, new_df = summarize_survey_question(df, question_concept_id, denominator, exact=exact)
+    if question is not None:
+        print(f"Distribution of response to {question}")
         # show table
         display(new_df)
         # show graph
@@ -33,6 +30,6 @@ def summarize_a_question_concept_id(df, question_concept_id, denominator=None):
     else:
         print("There is an error with your question_concept_id")
 
-summarize_a_question_concept_id(survey_df, question_concept_id, denominator)    
+summarize_a_question_concept_id(survey_df, question_concept_id, denominator, exact)    
 
 
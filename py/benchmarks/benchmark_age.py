@@ -0,0 +1,97 @@
+"""Compare ways to compute the ages of participants at the times of their measurements.
+
+A synthetic measurement dataframe, as from Dataset Builder joined with demographics, has a
+date_of_birth and a measurement_datetime for each row, both UTC timestamps. Each method computes
+the age in whole years at each measurement:
+
+* year difference: the year of measurement_datetime minus the year of date_of_birth, as the
+  add_age_to_demographics.py snippet did. Fast, but wrong until each birthday.
+* apply: a Python function of each row, as users often write. Timed on the first rows only and
+  scaled up to all of them.
+* pandas .dt fields: the year, month and day of each column from pandas.Series.dt, as the fallback
+  in snippets_setup.py does.
+* age_in_years, numpy: terra_widgets.age on datetime64 columns.
+* age_in_years, Arrow: terra_widgets.age on the same columns as Arrow timestamps.
+
+The last column is the percentage of the ages which differ from those of age_in_years.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_age.py --num_rows 10000000 30000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from terra_widgets import age
+
+APPLY_ROWS = 200000
+
+
+def make_measurement_df(num_rows: int):
+  rng = np.random.default_rng(0)
+  birth_seconds = rng.integers(-30 * 365 * 86400, 30 * 365 * 86400, num_rows)
+  measurement_seconds = birth_seconds + rng.integers(18 * 365 * 86400, 60 * 365 * 86400, num_rows)
+  epoch = pd.Timestamp('1970-01-01', tz='UTC')
+  return pd.DataFrame({
+      'date_of_birth': epoch + pd.to_timedelta(birth_seconds, unit='s'),
+      'measurement_datetime': epoch + pd.to_timedelta(measurement_seconds, unit='s'),
+  })
+
+
+def year_difference(df):
+  return df['measurement_datetime'].dt.year - df['date_of_birth'].dt.year
+
+
+def apply_rows(df):
+
+  def row_age(row):
+    birth, as_of = row['date_of_birth'], row['measurement_datetime']
+    return as_of.year - birth.year - ((as_of.month, as_of.day) < (birth.month, birth.day))
+
+  return df.apply(row_age, axis=1)
+
+
+def dt_fields(df):
+  birth, as_of = df['date_of_birth'].dt, df['measurement_datetime'].dt
+  return (as_of.year - birth.year) - ((as_of.month * 100 + as_of.day) < (birth.month * 100 + birth.day))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[10000000, 30000000])
+  args = parser.parse_args()
+
+  print(f'{"rows":>10}{"method":>36}{"seconds":>10}{"rows/second":>14}{"wrong":>10}')
+  for num_rows in args.num_rows:
+    df = make_measurement_df(num_rows)
+    start = time.perf_counter()
+    expected = age.age_in_years(df['date_of_birth'], df['measurement_datetime']).to_numpy()
+    age_seconds = time.perf_counter() - start
+
+    def report(method, seconds, ages):
+      wrong = (np.asarray(ages) != expected[:len(ages)]).mean()
+      print(f'{num_rows:>10}{method:>36}{seconds:>10.2f}{num_rows / seconds:>14,.0f}{100 * wrong:>9.2f}%')
+
+    for method, function in [('year difference', year_difference), ('pandas .dt fields', dt_fields)]:
+      start = time.perf_counter()
+      ages = function(df)
+      report(method, time.perf_counter() - start, ages)
+    del ages
+    start = time.perf_counter()
+    ages = apply_rows(df.iloc[:APPLY_ROWS])
+    report(f'apply, scaled from {APPLY_ROWS:,} rows', (time.perf_counter() - start) * num_rows / APPLY_ROWS, ages)
+    report('age_in_years, numpy', age_seconds, expected)
+
+    birth = df['date_of_birth'].astype('timestamp[us, tz=UTC][pyarrow]')
+    as_of = df['measurement_datetime'].astype('timestamp[us, tz=UTC][pyarrow]')
+    del df
+    start = time.perf_counter()
+    ages = age.age_in_years(birth, as_of)
+    report('age_in_years, Arrow', time.perf_counter() - start, ages)
+    del birth, as_of, ages
+
+
+if __name__ == '__main__':
+  main()
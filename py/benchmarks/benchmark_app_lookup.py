@@ -0,0 +1,98 @@
+"""Compare looking up Cromwell app details one at a time versus concurrently in check_for_app.
+
+A local stub Leonardo server lists the apps and serves their details, sleeping before each
+detail response to simulate network and server latency. Only the last app listed belongs to
+the workspace, which is the worst case for the previous one-at-a-time lookups.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_app_lookup.py --num_apps 1 10 50 --latency_ms 200
+"""
+
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+# py_cromwell_setup is a script next to the terra_widgets package rather than part of it.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import py_cromwell_setup  # pylint: disable=wrong-import-position
+from terra_widgets import auth  # pylint: disable=wrong-import-position
+
+PROJECT = 'fake-project'
+OWNER = 'a@researchallofus.org'
+WORKSPACE_NAMESPACE = 'aou-rw-target'
+
+
+class StubLeonardoHandler(http.server.BaseHTTPRequestHandler):
+  """Serve the list of apps and, after a delay, the details of each one."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    parts = self.path.split('?')[0].strip('/').split('/')
+    num_apps = self.server.num_apps
+    if len(parts) == 5:
+      body = [{'appName': f'app-{i}', 'appType': 'CROMWELL', 'status': 'RUNNING',
+               'auditInfo': {'creator': OWNER}} for i in range(num_apps)]
+    else:
+      time.sleep(self.server.latency_seconds)
+      index = int(parts[5].split('-')[1])
+      namespace = WORKSPACE_NAMESPACE if index == num_apps - 1 else f'aou-rw-other-{index}'
+      body = {'status': 'RUNNING',
+              'customEnvironmentVariables': {'WORKSPACE_NAMESPACE': namespace},
+              'proxyUrls': {'cromwell-service': f'https://leonardo/proxy/{parts[5]}/swagger/'}}
+    data = json.dumps(body).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+def time_check_for_app(env, max_workers):
+  start = time.perf_counter()
+  app_name, _, proxy_url = py_cromwell_setup.check_for_app(env, max_workers=max_workers)
+  assert app_name and proxy_url
+  return time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_apps', type=int, nargs='+', default=[1, 10, 50])
+  parser.add_argument('--latency_ms', type=float, default=200.0)
+  parser.add_argument('--max_workers', type=int, default=py_cromwell_setup.MAX_CONCURRENT_APP_LOOKUPS)
+  args = parser.parse_args()
+
+  server = http.server.ThreadingHTTPServer(('localhost', 0), StubLeonardoHandler)
+  server.latency_seconds = args.latency_ms / 1000
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  auth.set_token_cache(auth.AccessTokenCache(
+      fetch_token_fn=lambda account: auth.AccessToken(token='fake-token', expires_at=float('inf'))))
+  env = {'leonardo_url': f'http://localhost:{server.server_address[1]}',
+         'google_project': PROJECT,
+         'owner_email': OWNER,
+         'user_email': OWNER,
+         'workspace_namespace': WORKSPACE_NAMESPACE}
+
+  print(f'{"apps":>6}{"serial":>12}{"concurrent":>12}{"speedup":>10}')
+  try:
+    for num_apps in args.num_apps:
+      server.num_apps = num_apps
+      serial_seconds = time_check_for_app(env, max_workers=1)
+      concurrent_seconds = time_check_for_app(env, max_workers=args.max_workers)
+      print(f'{num_apps:>6}{serial_seconds:>11.2f}s{concurrent_seconds:>11.2f}s'
+            f'{serial_seconds / concurrent_seconds:>9.1f}x')
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+  main()
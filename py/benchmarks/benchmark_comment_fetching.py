@@ -0,0 +1,88 @@
+"""Compare reading comment files with a new multiprocessing Pool versus the shared ConcurrentFetcher.
+
+Synthetic comment files are written to a local folder. Reading from Cloud Storage is dominated
+by network latency, which is simulated by sleeping before each read.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_comment_fetching.py --num_files 1000 10000 --latency_ms 20
+"""
+
+import argparse
+import functools
+import multiprocessing
+import os
+import tempfile
+import time
+
+from terra_widgets.concurrent_fetch import ConcurrentFetcher
+from terra_widgets.storage import LocalBackend
+
+BUCKET = 'gs://fc-fake-bucket'
+
+
+def create_comment_files(root: str, num_files: int):
+  """Create comment files laid out like those in the HTML snapshots folder."""
+  backend = LocalBackend(root=root)
+  paths = []
+  for i in range(num_files):
+    path = f'{BUCKET}/reports/user{i % 10}@x.org/2020{i % 12 + 1:02d}01/{i:06d}/notebook.comment.txt'
+    local_path = backend.local_path(path)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, 'w') as f:
+      f.write(f'Comment number {i} about the changes made to this notebook.\n')
+    paths.append(path)
+  return backend, paths
+
+
+def read_comment_file(latency_seconds, local_path):
+  time.sleep(latency_seconds)
+  with open(local_path, 'r') as fh:
+    return local_path, fh.readlines()
+
+
+def time_multiprocess_pool(backend, paths, latency_seconds):
+  """The previous implementation: a new pool of 8 processes each time a workspace is chosen.
+
+  The widget used the `multiprocess` package, which can pickle closures; the standard library's
+  multiprocessing Pool is the same pool of processes, given a module-level function instead.
+  """
+  start = time.perf_counter()
+  with multiprocessing.Pool(8) as p:
+    results = list(p.imap(functools.partial(read_comment_file, latency_seconds),
+                          [backend.local_path(f) for f in paths]))
+  assert len(results) == len(paths)
+  return time.perf_counter() - start
+
+
+def time_concurrent_fetcher(fetcher, backend, paths, latency_seconds):
+  def get_comment(f, timeout):
+    time.sleep(latency_seconds)
+    return backend.read_bytes(f, timeout=timeout).decode('utf-8').splitlines()
+
+  start = time.perf_counter()
+  results = fetcher.fetch_all(paths, get_comment)
+  assert not [r for r in results if r.error]
+  return time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_files', type=int, nargs='+', default=[1000, 10000])
+  parser.add_argument('--latency_ms', type=float, default=20.0)
+  parser.add_argument('--max_concurrency', type=int, default=32)
+  args = parser.parse_args()
+  latency_seconds = args.latency_ms / 1000
+
+  # Like in the widget, the fetcher and its threads are created once and reused.
+  fetcher = ConcurrentFetcher(max_concurrency=args.max_concurrency)
+  print(f'{"files":>8}{"Pool(8)":>12}{"fetcher":>12}{"speedup":>10}')
+  for num_files in args.num_files:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      backend, paths = create_comment_files(tmpdirname, num_files)
+      pool_seconds = time_multiprocess_pool(backend, paths, latency_seconds)
+      fetcher_seconds = time_concurrent_fetcher(fetcher, backend, paths, latency_seconds)
+    print(f'{num_files:>8}{pool_seconds:>11.2f}s{fetcher_seconds:>11.2f}s{pool_seconds / fetcher_seconds:>9.1f}x')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,132 @@
+"""Compare joining the person and measurement dataframes from Dataset Builder.
+
+Synthetic person and measurement dataframes, as from Dataset Builder, have strings as object
+columns, with concept names repeated on many rows. Each method runs in a fresh Python process,
+reporting its time, the peak resident set size of the process and the memory of the result:
+
+* merge: pandas.merge of the whole dataframes, as the join_dataframes.py snippet did.
+* join_dataframes: terra_widgets.dataframe_join.join_dataframes of the whole dataframes.
+* join_dataframes columns: the same, for only the columns the measurement plot snippets use.
+
+The peak RSS includes the dataframes being joined, which are the same for each method.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_dataframe_join.py --num_rows 1000000 10000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROWS_PER_PERSON = 20
+NUM_CONCEPTS = 50
+NUM_UNITS = 10
+
+RUN_METHOD = '''
+import json, sys, time
+import pandas as pd
+sys.path.insert(0, {benchmarks_dir!r})
+from benchmark_dataframe_join import make_dataframes, PLOT_COLUMNS
+from terra_widgets import dataframe_join
+
+method, num_rows = sys.argv[1], int(sys.argv[2])
+person_df, measurement_df = make_dataframes(num_rows)
+input_mb = dataframe_join.memory_usage_mb(person_df) + dataframe_join.memory_usage_mb(measurement_df)
+start = time.perf_counter()
+if method == 'merge':
+  measurement_df = pd.merge(left=person_df, right=measurement_df, how='inner')
+elif method == 'join_dataframes':
+  measurement_df = dataframe_join.join_dataframes(person_df, measurement_df)
+else:
+  measurement_df = dataframe_join.join_dataframes(person_df, measurement_df, columns=PLOT_COLUMNS)
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'input_mb': input_mb, 'rows': len(measurement_df),
+                  'result_mb': dataframe_join.memory_usage_mb(measurement_df)}}))
+'''
+
+PLOT_COLUMNS = ['person_id', 'date_of_birth', 'sex_at_birth', 'standard_concept_name', 'measurement_datetime',
+                'value_as_number', 'unit_concept_name']
+
+
+def make_dataframes(num_rows: int):
+  """Make person and measurement dataframes with the columns of those from Dataset Builder."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  rng = np.random.default_rng(0)
+  num_people = max(num_rows // ROWS_PER_PERSON, 1)
+
+  def strings(values, num_values):
+    return pd.Series(np.array(values, dtype=object)[rng.integers(0, len(values), num_values)], dtype=object)
+
+  person_df = pd.DataFrame({
+      'person_id': rng.permutation(num_people).astype(np.int64) + 1000000,
+      'gender_concept_id': rng.choice([45878463, 45880669], num_people),
+      'gender': strings(['Female', 'Male', 'Gender Identity: Non Binary'], num_people),
+      'date_of_birth': (pd.Timestamp('1940-01-01', tz='UTC')
+                        + pd.to_timedelta(rng.integers(0, 25000, num_people), unit='D')),
+      'race_concept_id': rng.choice([8515, 8516, 8527], num_people),
+      'race': strings(['Asian', 'Black or African American', 'White'], num_people),
+      'ethnicity_concept_id': rng.choice([38003563, 38003564], num_people),
+      'ethnicity': strings(['Hispanic or Latino', 'Not Hispanic or Latino'], num_people),
+      'sex_at_birth_concept_id': rng.choice([45878463, 45880669], num_people),
+      'sex_at_birth': strings(['Female', 'Male', 'No matching concept'], num_people),
+  })
+  concepts = rng.integers(0, NUM_CONCEPTS, num_rows)
+  units = rng.integers(0, NUM_UNITS, num_rows)
+  measurement_df = pd.DataFrame({
+      'person_id': rng.integers(0, num_people, num_rows) + 1000000,
+      'measurement_concept_id': concepts + 3000000,
+      'standard_concept_name': pd.Series(np.array([f'Synthetic lab {i} [Mass/volume] in Serum or Plasma'
+                                                   for i in range(NUM_CONCEPTS)], dtype=object)[concepts]),
+      'standard_concept_code': pd.Series(np.array([f'{i}-{i % 10}' for i in range(NUM_CONCEPTS)],
+                                                  dtype=object)[concepts]),
+      'standard_vocabulary': strings(['LOINC'], num_rows),
+      'measurement_datetime': (pd.Timestamp('2000-01-01', tz='UTC')
+                               + pd.to_timedelta(rng.integers(0, 7000 * 86400, num_rows), unit='s')),
+      'measurement_type_concept_id': np.full(num_rows, 44818702),
+      'measurement_type_concept_name': strings(['Lab result'], num_rows),
+      'value_as_number': rng.normal(100, 15, num_rows),
+      'unit_concept_id': units + 8500,
+      'unit_concept_name': pd.Series(np.array([f'unit {i}' for i in range(NUM_UNITS)], dtype=object)[units]),
+      'range_low': np.full(num_rows, 70.0),
+      'range_high': np.full(num_rows, 130.0),
+      'visit_occurrence_id': rng.integers(0, num_rows // 5, num_rows),
+      'visit_occurrence_concept_name': strings(['Outpatient Visit', 'Inpatient Visit', 'Emergency Room Visit'],
+                                               num_rows),
+  })
+  return person_df, measurement_df
+
+
+def measure(method: str, num_rows: int):
+  """Run the method in a new process, returning its results and its peak RSS in MB."""
+  code = RUN_METHOD.format(benchmarks_dir=os.path.dirname(os.path.abspath(__file__)))
+  process = subprocess.Popen([sys.executable, '-c', code, method, str(num_rows)],
+                             stdout=subprocess.PIPE, encoding='utf-8')
+  output = process.stdout.read()
+  _, status, rusage = os.wait4(process.pid, 0)
+  # Let the Popen object know that the process was already reaped.
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+  if process.returncode != 0:
+    raise RuntimeError(f'The {method} method failed.')
+  # On Linux ru_maxrss is in kilobytes.
+  return json.loads(output), rusage.ru_maxrss / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[1000000, 10000000])
+  args = parser.parse_args()
+
+  print(f'{"rows":>10}{"method":>26}{"seconds":>10}{"peak RSS":>12}{"inputs":>12}{"result":>12}')
+  for num_rows in args.num_rows:
+    for method in ('merge', 'join_dataframes', 'join_dataframes columns'):
+      result, rss_mb = measure(method, num_rows)
+      print(f'{num_rows:>10}{method:>26}{result["seconds"]:>10.1f}{rss_mb:>9.0f} MB'
+            f'{result["input_mb"]:>9.0f} MB{result["result_mb"]:>9.0f} MB')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,95 @@
+"""Compare summarizing the columns of a large dataframe with pandas and with summarize_dataframe.
+
+A synthetic measurement dataframe, as from Dataset Builder, is ordered by measurement_datetime, as
+query results often are, so its first rows are the oldest measurements. Each method computes the
+statistics of every column:
+
+* pandas, first 10,000 rows: describe() and nunique() of the rows which the summarize_a_dataframe.py
+  snippet profiled.
+* pandas, all rows: describe() and nunique() of every row, which are exact.
+* summarize_dataframe: terra_widgets.dataframe_summary, in one pass over every row with sketches.
+* summarize_dataframe with a time budget: the same, over a random subset of the rows.
+
+The errors are those of the median value_as_number, in its standard deviations, and of the median
+measurement_datetime, in days, and the largest relative error of the numbers of distinct values.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_dataframe_summary.py --num_rows 1000000 10000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from terra_widgets import dataframe_summary
+
+NUM_CONCEPTS = 50
+ROWS_PER_PERSON = 20
+
+
+def make_measurement_df(num_rows: int):
+  rng = np.random.default_rng(0)
+  seconds = np.sort(rng.integers(0, 7000 * 86400, num_rows))
+  concepts = rng.integers(0, NUM_CONCEPTS, num_rows)
+  # Values drift upwards over the years, so the oldest measurements are not typical.
+  value = rng.normal(100, 15, num_rows) + seconds / (7000 * 86400) * 30
+  value[rng.random(num_rows) < 0.05] = np.nan
+  names = np.array([f'Synthetic lab {i}' for i in range(NUM_CONCEPTS)], dtype=object)
+  return pd.DataFrame({
+      'person_id': rng.integers(0, max(num_rows // ROWS_PER_PERSON, 1), num_rows) + 1000000,
+      'measurement_concept_id': concepts + 3000000,
+      'standard_concept_name': pd.Series(names[concepts], dtype=object),
+      'measurement_datetime': pd.Timestamp('2000-01-01', tz='UTC') + pd.to_timedelta(seconds, unit='s'),
+      'value_as_number': value,
+      'unit_concept_name': pd.Series(np.array(['mg/dL', 'g/dL', None], dtype=object)[
+          rng.integers(0, 3, num_rows)], dtype=object),
+  })
+
+
+def pandas_summary(df):
+  """Return the median value, median datetime and numbers of distinct values of each column."""
+  described = df.describe(include='all')
+  return (described.loc['50%', 'value_as_number'], described.loc['50%', 'measurement_datetime'],
+          df.nunique())
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[1000000, 10000000])
+  parser.add_argument('--time_budget_seconds', type=float, default=1.0)
+  args = parser.parse_args()
+
+  print(f'{"rows":>10}{"method":>40}{"seconds":>10}{"median error":>14}{"datetime error":>16}'
+        f'{"distinct error":>16}')
+  for num_rows in args.num_rows:
+    df = make_measurement_df(num_rows)
+    start = time.perf_counter()
+    exact = pandas_summary(df)
+    exact_seconds = time.perf_counter() - start
+    std = df['value_as_number'].std()
+
+    def report(method, seconds, median, median_datetime, distinct):
+      median_error = abs(median - exact[0]) / std
+      datetime_error = abs(median_datetime - exact[1]) / pd.Timedelta(days=1)
+      distinct_error = (abs(distinct - exact[2]) / exact[2]).max()
+      print(f'{num_rows:>10}{method:>40}{seconds:>10.2f}{median_error:>14.4f}{datetime_error:>12.1f} days'
+            f'{100 * distinct_error:>15.1f}%')
+
+    start = time.perf_counter()
+    first_rows = pandas_summary(df.loc[:10000, :])
+    report('pandas, first 10,000 rows', time.perf_counter() - start, *first_rows)
+    report('pandas, all rows', exact_seconds, *exact)
+    for method, budget in [('summarize_dataframe', None),
+                           (f'summarize_dataframe, {args.time_budget_seconds:g}s budget', args.time_budget_seconds)]:
+      start = time.perf_counter()
+      summary = dataframe_summary.summarize_dataframe(df, time_budget_seconds=budget)
+      seconds = time.perf_counter() - start
+      statistics = summary.statistics
+      report(method, seconds, statistics.loc['value_as_number', '50%'],
+             statistics.loc['measurement_datetime', '50%'], statistics['distinct'].astype(np.float64))
+    del df
+
+
+if __name__ == '__main__':
+  main()
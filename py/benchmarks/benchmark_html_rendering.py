@@ -0,0 +1,72 @@
+"""Compare rendering notebooks to HTML in-process versus one `jupyter nbconvert` per notebook.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_html_rendering.py --num_notebooks 30
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import nbformat
+
+from terra_widgets.html_rendering import render_notebooks
+
+
+def create_notebooks(folder: str, num_notebooks: int, num_cells: int):
+  """Create synthetic notebooks with a mix of markdown, code and outputs."""
+  paths = []
+  for i in range(num_notebooks):
+    notebook = nbformat.v4.new_notebook()
+    for j in range(num_cells):
+      notebook.cells.append(nbformat.v4.new_markdown_cell(f'## Section {j}\nSome text describing the analysis.'))
+      cell = nbformat.v4.new_code_cell(f'df_{j} = compute_something({j})\ndf_{j}.head()')
+      cell.outputs.append(nbformat.v4.new_output('stream', name='stdout', text='result\n' * 20))
+      notebook.cells.append(cell)
+    path = os.path.join(folder, f'notebook_{i}.ipynb')
+    nbformat.write(notebook, path)
+    paths.append(path)
+  return paths
+
+
+def time_subprocess_per_notebook(paths):
+  start = time.perf_counter()
+  for path in paths:
+    subprocess.run(['jupyter', 'nbconvert', '--to', 'html', '--ExtractOutputPreprocessor.enabled=False', path],
+                   capture_output=True, check=True)
+  return time.perf_counter() - start
+
+
+def time_in_process(paths, max_workers):
+  start = time.perf_counter()
+  results = list(render_notebooks(paths, max_workers=max_workers))
+  elapsed = time.perf_counter() - start
+  errors = [r for r in results if r.error]
+  if errors:
+    raise RuntimeError(f'{len(errors)} notebooks failed to render, for example: {errors[0].error}')
+  return elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_notebooks', type=int, default=30)
+  parser.add_argument('--num_cells', type=int, default=20)
+  parser.add_argument('--max_workers', type=int, default=None)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmpdirname:
+    paths = create_notebooks(tmpdirname, args.num_notebooks, args.num_cells)
+    subprocess_seconds = time_subprocess_per_notebook(paths)
+    serial_seconds = time_in_process(paths, max_workers=1)
+    parallel_seconds = time_in_process(paths, max_workers=args.max_workers)
+
+  print(f'Rendered {args.num_notebooks} notebooks of {2 * args.num_cells} cells each.')
+  print(f'{"subprocess per notebook":<28}{subprocess_seconds:8.2f}s')
+  print(f'{"in-process, serial":<28}{serial_seconds:8.2f}s  ({subprocess_seconds / serial_seconds:.1f}x)')
+  print(f'{"in-process, process pool":<28}{parallel_seconds:8.2f}s  ({subprocess_seconds / parallel_seconds:.1f}x)')
+
+
+if __name__ == '__main__':
+  main()
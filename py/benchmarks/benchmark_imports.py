@@ -0,0 +1,57 @@
+"""Measure the startup time and memory of the storage backend compared to TensorFlow.
+
+Each import is run in a fresh Python process, several times, reporting the median wall-clock
+time and the peak resident set size of the process.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_imports.py --repeats 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORTS = [
+    ('nothing (interpreter startup)', 'pass'),
+    ('tensorflow (previous backend)', 'import tensorflow'),
+    ('google.cloud.storage (new backend)', 'import google.cloud.storage'),
+    ('terra_widgets.storage', 'import terra_widgets.storage'),
+    ('terra_widgets.html_snapshots', 'import terra_widgets.html_snapshots'),
+]
+
+
+def measure(statement: str):
+  """Run the statement in a new process, returning its wall-clock seconds and peak RSS in MB, or None on failure."""
+  start = time.perf_counter()
+  process = subprocess.Popen([sys.executable, '-c', statement], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  _, status, rusage = os.wait4(process.pid, 0)
+  elapsed = time.perf_counter() - start
+  # Let the Popen object know that the process was already reaped.
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+  if process.returncode != 0:
+    return None
+  # On Linux ru_maxrss is in kilobytes.
+  return elapsed, rusage.ru_maxrss / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--repeats', type=int, default=5)
+  args = parser.parse_args()
+
+  print(f'{"import":<38}{"seconds":>10}{"peak RSS":>12}')
+  for name, statement in IMPORTS:
+    measurements = [measure(statement) for _ in range(args.repeats)]
+    if None in measurements:
+      print(f'{name:<38}{"failed (is it installed?)":>22}')
+      continue
+    seconds = statistics.median(m[0] for m in measurements)
+    rss = statistics.median(m[1] for m in measurements)
+    print(f'{name:<38}{seconds:>10.2f}{rss:>9.0f} MB')
+
+
+if __name__ == '__main__':
+  main()
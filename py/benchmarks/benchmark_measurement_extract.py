@@ -0,0 +1,111 @@
+"""Compare running the measurement SQL snippets on the whole measurement table versus on an extract.
+
+A synthetic CDR is written to a local DuckDB database, which stands in for BigQuery, with
+measurements spread evenly over many measurement concepts, only one of which is of interest.
+The row-level and most recent measurement snippets are run for several units of the measurement
+of interest, as a notebook does when exploring them, first on the whole measurement table and
+then after extract_measurements_of_interest.
+
+DuckDB does not report bytes processed, so the rows of the measurement table or extract which
+are scanned are reported instead. On BigQuery, use get_query_log() for the bytes processed.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_measurement_extract.py --num_rows 1000000 10000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from terra_widgets import query_runner
+
+CDR = 'fake-project.fake_cdr'
+NUM_CONCEPTS = 100
+NUM_UNITS = 4
+
+CREATE_CDR = '''
+CREATE SCHEMA IF NOT EXISTS "{cdr}";
+CREATE OR REPLACE TABLE "{cdr}"."person" AS
+SELECT
+  i::BIGINT AS person_id,
+  TIMESTAMPTZ '1950-01-01 00:00:00+00' + TO_DAYS((i % 18000)::INTEGER) AS birth_datetime,
+  (8507 + i % 2)::BIGINT AS sex_at_birth_concept_id
+FROM range({num_people}) AS t(i);
+CREATE OR REPLACE TABLE "{cdr}"."concept" AS
+SELECT
+  i::BIGINT AS concept_id,
+  CASE WHEN i = 0 THEN 'Hemoglobin A1c' ELSE 'Synthetic lab ' || i::VARCHAR END AS concept_name
+FROM range({num_concepts}) AS t(i)
+UNION ALL SELECT 8507, 'MALE' UNION ALL SELECT 8508, 'FEMALE';
+CREATE OR REPLACE TABLE "{cdr}"."measurement" AS
+SELECT
+  i::BIGINT AS measurement_id,
+  (i // 20)::BIGINT AS person_id,
+  (i % {num_concepts})::BIGINT AS measurement_concept_id,
+  (9000 + (i // {num_concepts}) % {num_units})::BIGINT AS unit_concept_id,
+  DATE '2000-01-01' + (i % 7000)::INTEGER AS measurement_date,
+  TIMESTAMPTZ '2000-01-01 08:00:00+00' + TO_DAYS((i % 7000)::INTEGER) AS measurement_datetime,
+  44818702::BIGINT AS measurement_type_concept_id,
+  NULL::BIGINT AS operator_concept_id,
+  (4.0 + (i % 500) / 100.0)::DOUBLE AS value_as_number,
+  NULL::BIGINT AS value_as_concept_id,
+  4.0::DOUBLE AS range_low,
+  5.6::DOUBLE AS range_high
+FROM range({num_rows}) AS t(i);
+CREATE OR REPLACE TABLE "{cdr}"."measurement_ext" AS
+SELECT measurement_id, 'EHR site' || (measurement_id % 50)::VARCHAR AS src_id FROM "{cdr}"."measurement";
+'''
+
+SNIPPETS = ['measurement_of_interest.sql', 'most_recent_measurement_of_interest.sql']
+
+
+def run_snippets(runner, snippets, values):
+  start = time.perf_counter()
+  for sql in snippets:
+    for unit_concept_id in range(9000, 9000 + NUM_UNITS):
+      runner.run(sql, MEASUREMENT_CONCEPT_ID=0, UNIT_CONCEPT_ID=unit_concept_id, **values)
+  return time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[1000000, 10000000])
+  args = parser.parse_args()
+
+  import duckdb  # pylint: disable=import-outside-toplevel
+
+  sql_snippets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sql-snippets')
+  snippets = []
+  for file_name in SNIPPETS:
+    with open(os.path.join(sql_snippets_dir, file_name)) as f:
+      snippets.append(f.read())
+  num_queries = len(snippets) * NUM_UNITS
+
+  print(f'{"rows":>10}{"whole table":>14}{"extract":>10}{"  measurement rows scanned (whole table / extract)"}')
+  for num_rows in args.num_rows:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      connection = duckdb.connect(os.path.join(tmpdirname, 'cdr.duckdb'))
+      connection.execute('SET enable_progress_bar = false')
+      connection.execute(CREATE_CDR.format(cdr=CDR, num_rows=num_rows, num_people=num_rows // 20,
+                                           num_concepts=NUM_CONCEPTS, num_units=NUM_UNITS))
+      # Every other person is in the cohort.
+      values = {'CDR': CDR, 'COHORT_QUERY': f'SELECT person_id FROM `{CDR}.person` WHERE MOD(person_id, 2) = 0'}
+      runner = query_runner.QueryRunner(engine=query_runner.DuckDBEngine(connection), use_cache=False)
+
+      whole_table_seconds = run_snippets(runner, snippets, values)
+      start = time.perf_counter()
+      extract = runner.create_extract(query_runner.MEASUREMENTS_OF_INTEREST_EXTRACT_QUERY, replaces='measurement',
+                                      covered_columns={'MEASUREMENT_CONCEPT_ID': 'measurement_concept_id'},
+                                      MEASUREMENT_OF_INTEREST='hemoglobin', **values)
+      run_snippets(runner, snippets, values)
+      extract_seconds = time.perf_counter() - start
+      assert all(entry.extract == extract.table for entry in runner.query_log[-num_queries:])
+      extract_rows = runner.query_log[-num_queries - 1].num_rows
+      connection.close()
+    print(f'{num_rows:>10}{whole_table_seconds:>13.2f}s{extract_seconds:>9.2f}s'
+          f'  {num_rows * num_queries:>12,} / {num_rows + extract_rows * num_queries:,}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,116 @@
+"""Compare ways of downloading a large row-level query result, such as measurement_of_interest.sql.
+
+A synthetic table of row-level measurements is written to a local DuckDB database, which stands
+in for BigQuery. Each method runs in a fresh Python process, reporting its time, the memory of
+the resulting dataframe and the peak resident set size of the process:
+
+* rows: page through the result as rows of Python objects and build a dataframe from them, as
+  happens when results are downloaded as pages of JSON rows.
+* arrow: terra_widgets.query_runner, which converts Arrow record batches to a dataframe with
+  categoricals and datetime64 columns.
+* parquet: terra_widgets.query_runner.download, which streams the record batches to a Parquet
+  file without building a dataframe.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_query_download.py --num_rows 1000000 5000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CDR = 'fake-project.fake_cdr'
+
+CREATE_MEASUREMENTS = '''
+CREATE SCHEMA IF NOT EXISTS "{cdr}";
+CREATE OR REPLACE TABLE "{cdr}"."measurement_of_interest" AS
+SELECT
+  (i // 20)::BIGINT AS person_id,
+  TIMESTAMPTZ '1950-01-01 00:00:00+00' + TO_DAYS(((i // 20) % 18000)::INTEGER) AS birth_datetime,
+  ['FEMALE', 'MALE', 'No matching concept'][1 + (i // 20) % 3] AS sex_at_birth,
+  'EHR site' || (i % 50)::VARCHAR AS src_id,
+  3004410::BIGINT AS measurement_concept_id,
+  DATE '2000-01-01' + (i % 7000)::INTEGER AS measurement_date,
+  TIMESTAMPTZ '2000-01-01 08:00:00+00' + TO_DAYS((i % 7000)::INTEGER) AS measurement_datetime,
+  44818702::BIGINT AS measurement_type_concept_id,
+  NULL::BIGINT AS operator_concept_id,
+  4.0 + (i % 500) / 100.0 AS value_as_number,
+  NULL::BIGINT AS value_as_concept_id,
+  8554::BIGINT AS unit_concept_id,
+  4.0::DOUBLE AS range_low,
+  5.6::DOUBLE AS range_high
+FROM range({num_rows}) AS t(i)
+'''
+
+QUERY = 'SELECT * FROM `{CDR}.measurement_of_interest` ORDER BY person_id'
+
+RUN_METHOD = '''
+import json, sys, time
+import duckdb
+import pandas as pd
+from terra_widgets import query_runner
+
+method, database, destination = sys.argv[1:]
+connection = duckdb.connect(database, read_only=True)
+connection.execute('SET enable_progress_bar = false')
+runner = query_runner.QueryRunner(engine=query_runner.DuckDBEngine(connection), use_cache=False)
+start = time.perf_counter()
+frame_mb = 0.0
+if method == 'rows':
+  # Page through the result as rows of Python objects.
+  query = query_runner.render_query({query!r}, {{'CDR': {cdr!r}}}, runner.engine)
+  reader, _ = runner.engine.execute(query.sql, query.parameters, batch_size=25000)
+  rows = []
+  for batch in reader:
+    rows.extend(zip(*[column.to_pylist() for column in batch.columns]))
+  df = pd.DataFrame.from_records(rows, columns=reader.schema.names)
+  del rows
+  frame_mb = df.memory_usage(deep=True).sum() / 2**20
+elif method == 'arrow':
+  df = runner.run({query!r}, CDR={cdr!r})
+  frame_mb = df.memory_usage(deep=True).sum() / 2**20
+else:
+  runner.download({query!r}, destination, CDR={cdr!r})
+print(json.dumps({{'seconds': time.perf_counter() - start, 'frame_mb': frame_mb}}))
+'''
+
+
+def measure(method: str, database: str, destination: str):
+  """Run the method in a new process, returning its seconds, dataframe MB and peak RSS in MB."""
+  statement = RUN_METHOD.format(query=QUERY, cdr=CDR)
+  process = subprocess.Popen([sys.executable, '-c', statement, method, database, destination],
+                             stdout=subprocess.PIPE, encoding='utf-8')
+  output = process.stdout.read()
+  _, status, rusage = os.wait4(process.pid, 0)
+  # Let the Popen object know that the process was already reaped.
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+  if process.returncode != 0:
+    raise RuntimeError(f'The {method} method failed.')
+  result = json.loads(output)
+  # On Linux ru_maxrss is in kilobytes.
+  return result['seconds'], result['frame_mb'], rusage.ru_maxrss / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[1000000, 5000000])
+  args = parser.parse_args()
+
+  import duckdb  # pylint: disable=import-outside-toplevel
+
+  print(f'{"rows":>10}{"method":>10}{"seconds":>10}{"dataframe":>12}{"peak RSS":>12}')
+  for num_rows in args.num_rows:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      database = os.path.join(tmpdirname, 'cdr.duckdb')
+      with duckdb.connect(database) as connection:
+        connection.execute(CREATE_MEASUREMENTS.format(cdr=CDR, num_rows=num_rows))
+      for method in ('rows', 'arrow', 'parquet'):
+        seconds, frame_mb, rss_mb = measure(method, database, os.path.join(tmpdirname, 'result.parquet'))
+        print(f'{num_rows:>10}{method:>10}{seconds:>10.2f}{frame_mb:>9.0f} MB{rss_mb:>9.0f} MB')
+
+
+if __name__ == '__main__':
+  main()
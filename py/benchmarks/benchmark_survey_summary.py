@@ -0,0 +1,103 @@
+"""Compare summarizing every module and question of a large survey dataframe.
+
+A synthetic survey dataframe, as from Dataset Builder, has modules of questions each with a few
+answers. Every module and every question is summarized, as the snippets
+summarize_a_survey_module.py and summarize_a_survey_by_question_concept_id.py would be:
+
+* snippets: the previous implementation of the snippets, which filters the whole dataframe for
+  each module or question.
+* summarizer: terra_widgets.survey_summary, which encodes the dataframe once and counts the
+  participants of all questions and answers in one pass. Its time includes that pass.
+
+The string columns are categoricals so that 50 million rows fit in the memory of a standard VM.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_survey_summary.py --num_rows 5000000 50000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from terra_widgets import survey_summary
+
+NUM_MODULES = 10
+QUESTIONS_PER_MODULE = 30
+ANSWERS_PER_QUESTION = 5
+ROWS_PER_PERSON = 125
+
+
+def summarize_a_module(df, module=None, denominator=None):
+  """The previous implementation of summarize_a_survey_module.py."""
+  if module:
+    df = df[df['survey'].str.lower() == module.lower()].copy()
+  data = (df.groupby(['survey', 'question_concept_id', 'question'], observed=True)['person_id'].nunique()
+          .reset_index()
+          .rename(columns={'person_id': 'n_participant'}))
+  if denominator:
+    data['response_rate'] = round(100*data['n_participant']/denominator, 2)
+  return data
+
+
+def summarize_a_question_concept_id(df, question_concept_id, denominator=None):
+  """The previous implementation of summarize_a_survey_by_question_concept_id.py, without the display."""
+  df = df.loc[df['question_concept_id'] == question_concept_id].copy()
+  new_df = (df.groupby(['answer_concept_id', 'answer'], observed=True)['person_id']
+            .nunique()
+            .reset_index()
+            .rename(columns=dict(person_id='n_participant'))
+            .assign(answer_concept_id=lambda x: np.int32(x.answer_concept_id)))
+  if denominator:
+    new_df['response_rate'] = round(100*new_df['n_participant']/denominator, 2)
+  if question_concept_id in df['question_concept_id'].unique():
+    return df.loc[df['question_concept_id'] == question_concept_id, 'question'].unique()[0], new_df
+  return None, new_df
+
+
+def make_survey_df(num_rows: int):
+  rng = np.random.default_rng(0)
+  num_questions = NUM_MODULES * QUESTIONS_PER_MODULE
+  questions = rng.integers(0, num_questions, num_rows, dtype=np.int32)
+  answers = questions * ANSWERS_PER_QUESTION + rng.integers(0, ANSWERS_PER_QUESTION, num_rows, dtype=np.int32)
+  return pd.DataFrame({
+      'person_id': rng.integers(1000000, 1000000 + max(num_rows // ROWS_PER_PERSON, 1), num_rows),
+      'survey': pd.Categorical.from_codes(questions // QUESTIONS_PER_MODULE,
+                                          [f'Module {i}' for i in range(NUM_MODULES)]),
+      'question_concept_id': questions.astype(np.int64) + 1585000,
+      'question': pd.Categorical.from_codes(questions, [f'Question {i}?' for i in range(num_questions)]),
+      'answer_concept_id': answers.astype(np.int64) + 1586000,
+      'answer': pd.Categorical.from_codes(answers, [f'Answer {i}' for i in range(num_questions * ANSWERS_PER_QUESTION)]),
+  })
+
+
+def summarize_all(survey_df, summarize_module, summarize_question):
+  start = time.perf_counter()
+  modules = [summarize_module(survey_df, f'module {i}') for i in range(NUM_MODULES)]
+  questions = [summarize_question(survey_df, 1585000 + i) for i in range(NUM_MODULES * QUESTIONS_PER_MODULE)]
+  return time.perf_counter() - start, modules, questions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[5000000, 50000000])
+  args = parser.parse_args()
+
+  print(f'{"rows":>10}{"snippets":>12}{"summarizer":>12}')
+  for num_rows in args.num_rows:
+    survey_df = make_survey_df(num_rows)
+    snippets_seconds, expected_modules, expected_questions = summarize_all(
+        survey_df, summarize_a_module, summarize_a_question_concept_id)
+    summarizer_seconds, modules, questions = summarize_all(
+        survey_df, survey_summary.summarize_survey_module, survey_summary.summarize_survey_question)
+    for actual, expected in zip(modules, expected_modules):
+      pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+    for (question, actual), (expected_question, expected) in zip(questions, expected_questions):
+      assert question == expected_question
+      pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+    print(f'{num_rows:>10}{snippets_seconds:>11.1f}s{summarizer_seconds:>11.1f}s')
+    del survey_df
+
+
+if __name__ == '__main__':
+  main()
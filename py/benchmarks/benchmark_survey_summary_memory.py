@@ -0,0 +1,110 @@
+"""Compare the peak memory of summarizing survey data from Parquet files as they grow.
+
+Synthetic survey data, as from Dataset Builder, is written to a Parquet file. Each method runs
+in a fresh Python process, reporting its time and the peak resident set size of the process:
+
+* dataframe: read the whole file into a dataframe, as the snippets assume, and summarize it.
+* exact: terra_widgets.survey_summary reading the file in batches, merging the distinct
+  (group, person_id) pairs of each batch.
+* sketch: the same, estimating the participants of each group with a HyperLogLog sketch.
+
+Usage, from the `py` directory after `pip install -e .`:
+  python3 benchmarks/benchmark_survey_summary_memory.py --num_rows 2000000 8000000 32000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+NUM_MODULES = 10
+QUESTIONS_PER_MODULE = 30
+ANSWERS_PER_QUESTION = 5
+ROWS_PER_PERSON = 125
+ROWS_PER_WRITE = 1000000
+
+RUN_METHOD = '''
+import json, sys, time
+import pandas as pd
+from terra_widgets import survey_summary
+
+method, path = sys.argv[1:]
+start = time.perf_counter()
+if method == 'dataframe':
+  summarizer = survey_summary.SurveySummarizer(pd.read_parquet(path))
+else:
+  summarizer = survey_summary.SurveySummarizer(path, exact=method == 'exact')
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'n_participant': int(summarizer.question_counts['n_participant'].sum())}))
+'''
+
+
+def write_survey(path: str, num_rows: int):
+  """Write the synthetic survey data a million rows at a time, so that it need not fit in memory."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pyarrow as pa  # pylint: disable=import-outside-toplevel
+  import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+  rng = np.random.default_rng(0)
+  num_questions = NUM_MODULES * QUESTIONS_PER_MODULE
+  modules = np.array([f'Module {i}' for i in range(NUM_MODULES)], dtype=object)
+  question_texts = np.array([f'Question {i}?' for i in range(num_questions)], dtype=object)
+  answer_texts = np.array([f'Answer {i}' for i in range(num_questions * ANSWERS_PER_QUESTION)], dtype=object)
+  num_people = max(num_rows // ROWS_PER_PERSON, 1)
+  writer = None
+  for start in range(0, num_rows, ROWS_PER_WRITE):
+    size = min(ROWS_PER_WRITE, num_rows - start)
+    questions = rng.integers(0, num_questions, size)
+    answers = questions * ANSWERS_PER_QUESTION + rng.integers(0, ANSWERS_PER_QUESTION, size)
+    table = pa.table({
+        'person_id': rng.integers(1000000, 1000000 + num_people, size),
+        'survey': modules[questions // QUESTIONS_PER_MODULE],
+        'question_concept_id': questions + 1585000,
+        'question': question_texts[questions],
+        'answer_concept_id': answers + 1586000,
+        'answer': answer_texts[answers],
+    })
+    if writer is None:
+      writer = pq.ParquetWriter(path, table.schema)
+    writer.write_table(table)
+  writer.close()
+
+
+def measure(method: str, path: str):
+  """Run the method in a new process, returning its seconds, participant total and peak RSS in MB."""
+  process = subprocess.Popen([sys.executable, '-c', RUN_METHOD, method, path],
+                             stdout=subprocess.PIPE, encoding='utf-8')
+  output = process.stdout.read()
+  _, status, rusage = os.wait4(process.pid, 0)
+  # Let the Popen object know that the process was already reaped.
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+  if process.returncode != 0:
+    raise RuntimeError(f'The {method} method failed.')
+  result = json.loads(output)
+  # On Linux ru_maxrss is in kilobytes.
+  return result['seconds'], result['n_participant'], rusage.ru_maxrss / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--num_rows', type=int, nargs='+', default=[2000000, 8000000, 32000000])
+  parser.add_argument('--max_dataframe_rows', type=int, default=8000000,
+                      help='Skip the dataframe method for more rows than this, which would not fit in memory.')
+  args = parser.parse_args()
+
+  print(f'{"rows":>10}{"method":>11}{"seconds":>10}{"peak RSS":>12}{"participants":>14}')
+  for num_rows in args.num_rows:
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      path = os.path.join(tmpdirname, 'survey.parquet')
+      write_survey(path, num_rows)
+      for method in ('dataframe', 'exact', 'sketch'):
+        if method == 'dataframe' and num_rows > args.max_dataframe_rows:
+          continue
+        seconds, n_participant, rss_mb = measure(method, path)
+        print(f'{num_rows:>10}{method:>11}{seconds:>10.1f}{rss_mb:>9.0f} MB{n_participant:>14,}')
+
+
+if __name__ == '__main__':
+  main()
@@ -1,52 +1,90 @@
+import argparse
+import concurrent.futures
 import os
+import random
 import subprocess
 import json
+import time
 import requests
 from pathlib import Path
 
-def check_for_app(env):
+try:
+    from terra_widgets.auth import authorized_get
+except ImportError:
+    # This script is also pasted into notebooks as a snippet, where terra_widgets may not be installed.
+    # The script finishes well within the lifetime of a token, so fetch one token per account and reuse
+    # one keep-alive session for all requests.
+    _session = requests.Session()
+    _tokens = {}
+
+    def authorized_get(url, account=None, timeout=60, **kwargs):
+        if account not in _tokens:
+            command = ['gcloud', 'auth', 'print-access-token'] + ([account] if account else [])
+            _tokens[account] = subprocess.run(command, capture_output=True, check=True, encoding='utf-8').stdout.strip()
+        headers = {**kwargs.pop('headers', {}), 'Authorization': f'Bearer {_tokens[account]}'}
+        return _session.get(url, headers=headers, timeout=timeout, **kwargs)
+
+# Each app detail lookup is one HTTP round trip, so look up several at once.
+MAX_CONCURRENT_APP_LOOKUPS = 8
+
+# Settings for --wait. A new CROMWELL app usually takes several minutes to reach RUNNING.
+DEFAULT_WAIT_DEADLINE_SECONDS = 20 * 60
+DEFAULT_INITIAL_POLL_INTERVAL_SECONDS = 5
+DEFAULT_MAX_POLL_INTERVAL_SECONDS = 60
+# The app will not become RUNNING from any of these.
+FAILED_APP_STATUSES = ['DELETED', 'DELETING', 'ERROR']
+
+def check_for_app(env, max_workers=MAX_CONCURRENT_APP_LOOKUPS):
     list_apps_url = f'{env["leonardo_url"]}/api/google/v1/apps/{env["google_project"]}'
-    r = requests.get(
+    r = authorized_get(
         list_apps_url,
+        account=env['user_email'],
         params={
           'includeDeleted': 'false'
-        },
-        headers = {
-            'Authorization': f'Bearer {env["token"]}'
         }
     )
     r.raise_for_status()
 
-    for potential_app in r.json():
+    # CROMWELL apps in the correct google project and owned by the user. Now just check the workspace.
+    potential_apps = [
+        potential_app for potential_app in r.json()
         if potential_app['appType'] == 'CROMWELL' and (
                 str(potential_app['auditInfo']['creator']) == env['owner_email']
                 or str(potential_app['auditInfo']['creator']) == env['user_email']
-        ) :
-            potential_app_name = potential_app['appName']
-            potential_app_status = potential_app['status']
-
-            # We found a CROMWELL app in the correct google project and owned by the user. Now just check the workspace:
-            _, workspace_namespace,  proxy_url = get_app_details(env, potential_app_name)
+        )
+    ]
+    if not potential_apps:
+        return None, None, None
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(potential_apps)))
+    futures = {executor.submit(get_app_details, env, potential_app['appName']): potential_app
+               for potential_app in potential_apps}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            _, workspace_namespace, proxy_urls = future.result()
             if workspace_namespace == env['workspace_namespace']:
-                return potential_app_name, potential_app_status, proxy_url['cromwell-service']
+                potential_app = futures[future]
+                return potential_app['appName'], potential_app['status'], (proxy_urls or {}).get('cromwell-service')
+    finally:
+        # Stop as soon as the app is found: drop the lookups which have not started yet.
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
 
     return None, None, None
 
 def get_app_details(env, app_name):
     get_app_url = f'{env["leonardo_url"]}/api/google/v1/apps/{env["google_project"]}/{app_name}'
-    print('start')
-    r = requests.get(
+    r = authorized_get(
         get_app_url,
+        account=env['user_email'],
         params={
             'includeDeleted': 'true',
             'role': 'creator'
-        },
-        headers={
-            'Authorization': f'Bearer {env["token"]}'
         }
     )
     if r.status_code == 404:
-        return 'DELETED', None, None, None
+        return 'DELETED', None, None
     else:
         r.raise_for_status()
     result_json = r.json()
@@ -104,7 +142,85 @@ def find_app_status(env):
         print(f'Existing CROMWELL app found (app_name={app_name}; app_status={app_status}).')
         exit(1)
 
-def main():
+def get_poll_interval(attempt, initial_interval_seconds, max_interval_seconds):
+    """Exponential backoff with jitter, so that many users waiting at once do not poll in lockstep."""
+    interval = min(initial_interval_seconds * 2 ** attempt, max_interval_seconds)
+    return interval * random.uniform(0.5, 1.0)
+
+def wait_for_app(env,
+                 deadline_seconds=DEFAULT_WAIT_DEADLINE_SECONDS,
+                 initial_interval_seconds=DEFAULT_INITIAL_POLL_INTERVAL_SECONDS,
+                 max_interval_seconds=DEFAULT_MAX_POLL_INTERVAL_SECONDS,
+                 sleep=time.sleep,
+                 clock=time.monotonic):
+    """Poll the CROMWELL app until it is RUNNING, writing the cromshell config as soon as its proxy URL appears.
+
+    Returns a tuple of the final app status and a dictionary of metrics: the number of polls and
+    the seconds until the app was found, until its proxy URL appeared and until it was RUNNING.
+    The status is None if the app was never found and 'TIMEOUT' if the deadline passed first.
+    """
+    start = clock()
+    metrics = {'polls': 0, 'seconds_to_app': None, 'seconds_to_proxy_url': None, 'seconds_to_running': None}
+    app_name, app_status, proxy_url = None, None, None
+    attempt = 0
+    while True:
+        metrics['polls'] += 1
+        if app_name is None:
+            app_name, app_status, proxy_url = check_for_app(env)
+            if app_name is not None:
+                metrics['seconds_to_app'] = clock() - start
+                print(f'Found CROMWELL app (app_name={app_name}; app_status={app_status}).')
+        else:
+            app_status, _, proxy_urls = get_app_details(env, app_name)
+            proxy_url = (proxy_urls or {}).get('cromwell-service')
+
+        if proxy_url and metrics['seconds_to_proxy_url'] is None:
+            metrics['seconds_to_proxy_url'] = clock() - start
+            configure_cromwell(env, proxy_url)
+        if app_status == 'RUNNING' and proxy_url:
+            metrics['seconds_to_running'] = clock() - start
+            return app_status, metrics
+        if app_status in FAILED_APP_STATUSES:
+            return app_status, metrics
+
+        remaining = deadline_seconds - (clock() - start)
+        if remaining <= 0:
+            return 'TIMEOUT', metrics
+        interval = min(get_poll_interval(attempt, initial_interval_seconds, max_interval_seconds), remaining)
+        print(f'app_status={app_status}; checking again in {interval:.0f}s')
+        sleep(interval)
+        attempt += 1
+
+def wait_for_app_status(env, deadline_seconds, initial_interval_seconds, max_interval_seconds):
+    print(f'Waiting up to {deadline_seconds:.0f}s for the CROMWELL app to be RUNNING')
+    app_status, metrics = wait_for_app(env,
+                                       deadline_seconds=deadline_seconds,
+                                       initial_interval_seconds=initial_interval_seconds,
+                                       max_interval_seconds=max_interval_seconds)
+    print('; '.join(f'{k}={v:.1f}' if isinstance(v, float) else f'{k}={v}' for k, v in metrics.items()))
+    if app_status == 'RUNNING':
+        print('CROMWELL app is RUNNING and cromshell is configured.')
+    elif app_status is None or app_status == 'TIMEOUT':
+        print(f'CROMWELL app was not RUNNING after {deadline_seconds:.0f}s. '
+              'If it does not exist, please create cromwell server from workbench')
+        exit(1)
+    else:
+        print(f'CROMWELL app will not become RUNNING (app_status={app_status}).')
+        exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Configure cromshell to use the CROMWELL app of this workspace.')
+    parser.add_argument('--wait', action='store_true',
+                        help='Poll until the app is RUNNING, instead of checking its status once.')
+    parser.add_argument('--deadline_seconds', type=float, default=DEFAULT_WAIT_DEADLINE_SECONDS,
+                        help='How long to wait for the app to be RUNNING.')
+    parser.add_argument('--initial_interval_seconds', type=float, default=DEFAULT_INITIAL_POLL_INTERVAL_SECONDS,
+                        help='The delay before the first status check is repeated. It doubles, with jitter, each time.')
+    parser.add_argument('--max_interval_seconds', type=float, default=DEFAULT_MAX_POLL_INTERVAL_SECONDS,
+                        help='The longest delay between status checks.')
+    # Ignore unknown arguments, such as those of the Jupyter kernel when this is run as a snippet.
+    args, _ = parser.parse_known_args(argv)
+
     # Iteration 1: these ENV reads will throw errors if not set.
     env = {
         'workspace_namespace': os.environ['WORKSPACE_NAMESPACE'],
@@ -118,13 +234,12 @@ def main():
     # Before going any further, check that cromshell2 is installed:
     validate_cromshell()
 
-    # Fetch the token:
-    token_fetch_command = subprocess.run(['gcloud', 'auth', 'print-access-token', env['user_email']], capture_output=True, check=True, encoding='utf-8')
-    env['token'] = str.strip(token_fetch_command.stdout)
-
-    find_app_status(env)
+    # Access tokens for env['user_email'] are fetched and cached by authorized_get.
+    if args.wait:
+        wait_for_app_status(env, args.deadline_seconds, args.initial_interval_seconds, args.max_interval_seconds)
+    else:
+        find_app_status(env)
 
 
 if __name__ == '__main__':
     main()
- 
@@ -0,0 +1,157 @@
+"""Tests for py_cromwell_setup.py, against a local fake Leonardo server."""
+
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import py_cromwell_setup
+from terra_widgets import auth
+
+PROJECT = 'fake-project'
+OWNER = 'a@researchallofus.org'
+WORKSPACE_NAMESPACE = 'aou-rw-target'
+PROXY_URL = 'https://leonardo/proxy/fake-project/app-target/cromwell-service/swagger/'
+
+
+class FakeLeonardoHandler(http.server.BaseHTTPRequestHandler):
+    """Serve the apps in server.apps, stepping each one through its list of detail responses."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        parts = self.path.split('?')[0].strip('/').split('/')
+        with server.lock:
+            server.requests.append(self.path)
+            if len(parts) == 5:
+                server.list_calls += 1
+                visible = server.list_calls > server.hidden_list_calls
+                self._respond(200, [{'appName': name, 'appType': 'CROMWELL', 'status': details[0][0],
+                                     'auditInfo': {'creator': OWNER}}
+                                    for name, details in server.apps.items() if visible])
+            elif parts[5] not in server.apps:
+                self._respond(404, {'message': 'not found'})
+            else:
+                details = server.apps[parts[5]]
+                status, namespace, proxy_url = details.pop(0) if len(details) > 1 else details[0]
+                self._respond(200, {'status': status,
+                                    'customEnvironmentVariables': {'WORKSPACE_NAMESPACE': namespace},
+                                    'proxyUrls': {'cromwell-service': proxy_url} if proxy_url else None})
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class PyCromwellSetupTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('localhost', 0), FakeLeonardoHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        auth.set_token_cache(auth.AccessTokenCache(
+            fetch_token_fn=lambda account: auth.AccessToken(token='fake-token', expires_at=float('inf'))))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        auth.set_token_cache(None)
+
+    def setUp(self):
+        self.server.apps = {}
+        self.server.requests = []
+        self.server.list_calls = 0
+        self.server.hidden_list_calls = 0
+        self.home = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.home.name, '.cromshell'))
+        self.previous_home = os.environ.get('HOME')
+        os.environ['HOME'] = self.home.name
+        self.env = {'leonardo_url': f'http://localhost:{self.server.server_address[1]}',
+                    'google_project': PROJECT,
+                    'owner_email': OWNER,
+                    'user_email': OWNER,
+                    'workspace_namespace': WORKSPACE_NAMESPACE}
+        self.now = 0.0
+        self.sleeps = []
+
+    def tearDown(self):
+        os.environ['HOME'] = self.previous_home
+        self.home.cleanup()
+
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def _wait(self, **kwargs):
+        return py_cromwell_setup.wait_for_app(self.env, sleep=self._sleep, clock=lambda: self.now,
+                                              initial_interval_seconds=5, max_interval_seconds=20, **kwargs)
+
+    def _read_config(self):
+        with open(os.path.join(self.home.name, '.cromshell', 'cromshell_config.json')) as f:
+            return json.load(f)
+
+    def test_check_for_app(self):
+        self.server.apps = {f'app-{i}': [('RUNNING', f'aou-rw-other-{i}', None)] for i in range(20)}
+        self.server.apps['app-target'] = [('RUNNING', WORKSPACE_NAMESPACE, PROXY_URL)]
+        self.assertTupleEqual(py_cromwell_setup.check_for_app(self.env),
+                              ('app-target', 'RUNNING', PROXY_URL))
+
+    def test_check_for_app_not_found(self):
+        self.server.apps = {'app-other': [('RUNNING', 'aou-rw-other', None)]}
+        self.assertTupleEqual(py_cromwell_setup.check_for_app(self.env), (None, None, None))
+
+    def test_get_deleted_app_details(self):
+        self.assertTupleEqual(py_cromwell_setup.get_app_details(self.env, 'app-gone'), ('DELETED', None, None))
+
+    def test_wait_until_running(self):
+        self.server.hidden_list_calls = 1
+        self.server.apps['app-target'] = [('PROVISIONING', WORKSPACE_NAMESPACE, None),
+                                          ('PROVISIONING', WORKSPACE_NAMESPACE, None),
+                                          ('PROVISIONING', WORKSPACE_NAMESPACE, PROXY_URL),
+                                          ('RUNNING', WORKSPACE_NAMESPACE, PROXY_URL)]
+        app_status, metrics = self._wait()
+        self.assertEqual(app_status, 'RUNNING')
+        # One poll before the app exists, one to find it, then one for each remaining detail response.
+        self.assertEqual(metrics['polls'], 5)
+        self.assertEqual(len(self.sleeps), 4)
+        self.assertTrue(all(0 < s <= 20 for s in self.sleeps))
+        self.assertLess(metrics['seconds_to_app'], metrics['seconds_to_proxy_url'])
+        self.assertLess(metrics['seconds_to_proxy_url'], metrics['seconds_to_running'])
+        self.assertEqual(self._read_config()['cromwell_server'],
+                         'https://leonardo/proxy/fake-project/app-target/cromwell-service/')
+
+    def test_wait_stops_on_error(self):
+        self.server.apps['app-target'] = [('PROVISIONING', WORKSPACE_NAMESPACE, None),
+                                          ('ERROR', WORKSPACE_NAMESPACE, None)]
+        app_status, metrics = self._wait()
+        self.assertEqual(app_status, 'ERROR')
+        self.assertIsNone(metrics['seconds_to_running'])
+
+    def test_wait_deadline(self):
+        app_status, metrics = self._wait(deadline_seconds=60)
+        self.assertEqual(app_status, 'TIMEOUT')
+        self.assertIsNone(metrics['seconds_to_app'])
+        self.assertAlmostEqual(self.now, 60)
+        self.assertFalse(os.path.exists(os.path.join(self.home.name, '.cromshell', 'cromshell_config.json')))
+
+    def test_poll_interval_backoff(self):
+        for attempt in range(10):
+            interval = py_cromwell_setup.get_poll_interval(attempt, initial_interval_seconds=5, max_interval_seconds=60)
+            self.assertGreaterEqual(interval, min(5 * 2 ** attempt, 60) / 2)
+            self.assertLessEqual(interval, min(5 * 2 ** attempt, 60))
+
+
+if __name__ == '__main__':
+    unittest.main()
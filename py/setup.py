@@ -19,7 +19,7 @@ setup(
     long_description=long_description,
     long_description_content_type='text/markdown',
 
-    python_requires='>=3.7',
+    python_requires='>=3.8',
     install_requires=requirements,
     packages=find_packages(),
 
@@ -0,0 +1,128 @@
+"""Compute the exact ages of participants, in whole years, for whole columns at once.
+
+Subtracting the year of birth from the current year, as the add_age_to_demographics.py snippet did,
+overstates the age of everyone whose birthday has not yet come this year. Dividing the days between
+two dates by 365.25 is also off by one around birthdays. `age_in_years` instead turns each date into
+the number year * 10000 + month * 100 + day, so that the age is the difference of two such numbers
+divided by 10000, rounded down: a year is counted only once the birthday has come.
+
+Converting days to calendar dates is the slow part, so it is done once for each distinct day in the
+range of the column and looked up for each row. Arrow timestamps are read as their days since the
+epoch, without converting them to pandas first.
+"""
+
+import datetime
+import sys
+
+# The most days in the range of a column, per row, for which to build a lookup table of their dates.
+MAX_TABLE_DAYS_PER_ROW = 4
+
+
+def _calendar_keys(days):
+  """Return year * 10000 + month * 100 + day of each of the int64 days since the epoch."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  days = days.astype('datetime64[D]')
+  months = days.astype('datetime64[M]')
+  year = days.astype('datetime64[Y]').astype(np.int64) + 1970
+  month = months.astype(np.int64) - (year - 1970) * 12 + 1
+  day = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+  return year * 10000 + month * 100 + day
+
+
+def _epoch_days(values):
+  """Return the date of each datetime, as int64 days since the epoch, and which are missing.
+
+  Timestamps with a timezone are dated in their local time, as pandas.Series.dt and Arrow compute
+  functions give their fields.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  if isinstance(values, pd.Series) and isinstance(values.dtype, pd.ArrowDtype):
+    values = values.array.__arrow_array__()
+  # Arrow arrays can only have been created if pyarrow was imported.
+  pa = sys.modules.get('pyarrow')
+  if pa is not None and isinstance(values, (pa.Array, pa.ChunkedArray)):
+    import pyarrow.compute as pc  # pylint: disable=import-outside-toplevel
+
+    if pa.types.is_timestamp(values.type):
+      if values.type.tz not in (None, 'UTC', '+00:00'):
+        values = pc.local_timestamp(values)
+      units_per_day = 86400 * {'s': 1, 'ms': 1000, 'us': 1000000, 'ns': 1000000000}[values.type.unit]
+    elif pa.types.is_date(values.type):
+      values = values.cast(pa.date32()).cast(pa.int32())
+      units_per_day = 1
+    else:
+      values = values.to_pandas()
+    if not isinstance(values, pd.Series):
+      missing = np.asarray(values.is_null())
+      days = np.asarray(pc.fill_null(values.cast(pa.int64()), 0)) // units_per_day
+      return days, missing
+
+  if isinstance(values, pd.Series):
+    if getattr(values.dtype, 'tz', None) is not None:
+      values = values.dt.tz_localize(None)
+    values = values.to_numpy()
+  values = np.asarray(values)
+  if not np.issubdtype(values.dtype, np.datetime64):
+    values = pd.to_datetime(values).to_numpy()
+  days = values.astype('datetime64[D]')
+  missing = np.isnat(days)
+  return np.where(missing, 0, days.astype(np.int64)), missing
+
+
+def _date_keys(values):
+  """Return year * 10000 + month * 100 + day of the date of each datetime, and which are missing."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  days, missing = _epoch_days(values)
+  if missing.all():
+    return np.zeros(len(days), dtype=np.int64), missing
+  present = days[~missing] if missing.any() else days
+  first, last = present.min(), present.max()
+  if last - first < MAX_TABLE_DAYS_PER_ROW * len(days):
+    table = _calendar_keys(np.arange(first, last + 1))
+    # The days of missing datetimes may be outside the range; their keys are not used.
+    return table[np.clip(days - first, 0, last - first)], missing
+  return _calendar_keys(days), missing
+
+
+def age_in_years(birth_datetime, as_of=None):
+  """Compute the age in whole years of each participant, as of today or of the time of an event.
+
+  A participant born on February 29th turns a year older on March 1st in years which are not leap
+  years.
+
+  Args:
+    birth_datetime: The dates of birth, such as the date_of_birth column from Dataset Builder or the
+      birth_datetime column of measurement_of_interest.sql. A pandas Series or numpy array of
+      datetime64, with or without a timezone, or of Arrow timestamps or dates.
+    as_of: The time to compute the ages as of. Either a column of the same length and of any of
+      the same types, such as measurement_datetime, a single date or datetime, or None for today.
+  Returns:
+    A pandas Series of the ages, with the index of birth_datetime if it is a Series. Its dtype is
+    int64, or float64 with NaN for the ages of missing datetimes, as for pandas.Series.dt.year.
+  Raises:
+    ValueError: if as_of is a column of a different length than birth_datetime.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  birth_keys, missing = _date_keys(birth_datetime)
+  if as_of is None:
+    as_of = datetime.date.today()
+  if isinstance(as_of, (datetime.date, str, np.datetime64)):
+    as_of = pd.Timestamp(as_of)
+    keys = as_of.year * 10000 + as_of.month * 100 + as_of.day
+  else:
+    keys, as_of_missing = _date_keys(as_of)
+    if len(keys) != len(birth_keys):
+      raise ValueError(f'as_of has {len(keys)} rows, but birth_datetime has {len(birth_keys)}.')
+    missing = missing | as_of_missing
+  # Month * 100 + day is less than 10000, so the age is a year less until the birthday.
+  ages = (keys - birth_keys) // 10000
+  index = birth_datetime.index if isinstance(birth_datetime, pd.Series) else None
+  if missing.any():
+    ages = np.where(missing, np.nan, ages)
+  return pd.Series(ages, index=index)
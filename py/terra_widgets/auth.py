@@ -0,0 +1,225 @@
+"""Access tokens and a pooled HTTP session shared by terra_widgets and py_cromwell_setup.
+
+Launching `gcloud auth print-access-token` takes on the order of a second, and a new
+`requests.get` per call pays for a new TLS handshake. So access tokens are cached until
+shortly before they expire, and all requests share one keep-alive session which retries
+transient errors.
+"""
+
+import datetime
+import json
+import subprocess
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+from typing import TYPE_CHECKING
+
+# The HTTP modules are slow to import, so they are imported only when the session is created.
+if TYPE_CHECKING:
+  import requests
+
+# gcloud may hand back a cached token without saying when it expires, so assume it has only a short while left.
+ASSUMED_TOKEN_LIFETIME_SECONDS = 600
+# Refresh a token in the background once it is this close to expiring, and synchronously once it has expired.
+DEFAULT_REFRESH_MARGIN_SECONDS = 120
+DEFAULT_POOL_SIZE = 32
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_TIMEOUT_SECONDS = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+AccessToken = NamedTuple('AccessToken', [('token', str), ('expires_at', float)])
+
+
+def fetch_gcloud_access_token(account: Optional[str] = None) -> AccessToken:
+  """Retrieve an access token from gcloud.
+
+  Args:
+    account: The account for which to retrieve a token. Defaults to the active account.
+  Returns:
+    The token and the time, in seconds since the epoch, at which it expires.
+  """
+  command = ['gcloud', 'auth', 'print-access-token', '--format=json']
+  if account:
+    command.append(account)
+  output = subprocess.run(command, capture_output=True, check=True, encoding='utf-8').stdout.strip()
+  expires_at = time.time() + ASSUMED_TOKEN_LIFETIME_SECONDS
+  try:
+    parsed = json.loads(output)
+  except ValueError:
+    return AccessToken(token=output, expires_at=expires_at)
+  if isinstance(parsed, str):
+    return AccessToken(token=parsed, expires_at=expires_at)
+  if parsed.get('token_expiry'):
+    try:
+      expiry = datetime.datetime.fromisoformat(parsed['token_expiry'].replace('Z', '+00:00'))
+      if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+      expires_at = expiry.timestamp()
+    except ValueError:
+      pass  # Fall back to the assumed lifetime.
+  return AccessToken(token=parsed['token'], expires_at=expires_at)
+
+
+class AccessTokenCache:
+  """Encapsulate a cache of access tokens, one per account, which are refreshed before they expire."""
+
+  def __init__(self,
+               fetch_token_fn: Callable[[Optional[str]], AccessToken] = fetch_gcloud_access_token,
+               refresh_margin_seconds: float = DEFAULT_REFRESH_MARGIN_SECONDS,
+               clock: Callable[[], float] = time.time):
+    """Initialize the cache.
+
+    Args:
+      fetch_token_fn: A function which takes an account, or None for the active account, and returns a new token.
+      refresh_margin_seconds: How long before a token expires to start refreshing it in the background.
+      clock: The function used to obtain the current time, in seconds since the epoch.
+    """
+    self._fetch_token = fetch_token_fn
+    self.refresh_margin_seconds = refresh_margin_seconds
+    self._clock = clock
+    self._lock = threading.Lock()
+    # Held while fetching a token synchronously, so that concurrent callers wait for one fetch instead of each fetching.
+    self._fetch_lock = threading.Lock()
+    self._tokens: Dict[Optional[str], AccessToken] = {}
+    self._refreshing: Dict[Optional[str], threading.Thread] = {}
+
+  def _refresh(self, account: Optional[str]) -> AccessToken:
+    token = self._fetch_token(account)
+    with self._lock:
+      self._tokens[account] = token
+      self._refreshing.pop(account, None)
+    return token
+
+  def _refresh_in_background(self, account: Optional[str]):
+    def refresh():
+      try:
+        self._refresh(account)
+      except Exception:  # pylint: disable=broad-except
+        with self._lock:
+          self._refreshing.pop(account, None)  # The next call will retry synchronously once the token expires.
+    with self._lock:
+      if account in self._refreshing:
+        return
+      thread = threading.Thread(target=refresh, name='terra_widgets_token_refresh', daemon=True)
+      self._refreshing[account] = thread
+    thread.start()
+
+  def get_token(self, account: Optional[str] = None) -> str:
+    """Retrieve an unexpired access token for the account, fetching a new one only when needed.
+
+    Args:
+      account: The account for which to retrieve a token. Defaults to the active account.
+    Returns:
+      The access token.
+    """
+    with self._lock:
+      token = self._tokens.get(account)
+    now = self._clock()
+    if token is None or now >= token.expires_at:
+      with self._fetch_lock:
+        with self._lock:
+          token = self._tokens.get(account)
+        if token is None or self._clock() >= token.expires_at:
+          token = self._refresh(account)
+      return token.token
+    if now >= token.expires_at - self.refresh_margin_seconds:
+      self._refresh_in_background(account)
+    return token.token
+
+  def invalidate(self, account: Optional[str] = None):
+    """Discard the cached token for the account, for example after it was rejected."""
+    with self._lock:
+      self._tokens.pop(account, None)
+
+
+def create_session(pool_size: int = DEFAULT_POOL_SIZE,
+                   max_retries: int = DEFAULT_MAX_RETRIES,
+                   backoff_factor: float = DEFAULT_BACKOFF_FACTOR) -> 'requests.Session':
+  """Create an HTTP session which keeps connections alive and retries transient errors.
+
+  Args:
+    pool_size: The maximum number of connections kept alive for each host.
+    max_retries: The number of times to retry idempotent requests which fail with a transient error.
+    backoff_factor: The delay before the first retry. It doubles for each further retry.
+  Returns:
+    The session.
+  """
+  import requests
+  from requests.adapters import HTTPAdapter
+  from urllib3.util.retry import Retry
+
+  # By default, only idempotent methods such as GET are retried.
+  retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                raise_on_status=False)
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+  session = requests.Session()
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  return session
+
+
+# Define these in the outer scope so that the tokens and connections live for the duration of the Jupyter kernel.
+_TOKEN_CACHE: Optional[AccessTokenCache] = None
+_SESSION: Optional['requests.Session'] = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def get_token_cache() -> AccessTokenCache:
+  """Retrieve the shared token cache, creating it if needed."""
+  global _TOKEN_CACHE
+  with _SINGLETON_LOCK:
+    if _TOKEN_CACHE is None:
+      _TOKEN_CACHE = AccessTokenCache()
+    return _TOKEN_CACHE
+
+
+def set_token_cache(token_cache: AccessTokenCache):
+  """Use a different token cache, such as one which obtains tokens some other way."""
+  global _TOKEN_CACHE
+  _TOKEN_CACHE = token_cache
+
+
+def get_session() -> 'requests.Session':
+  """Retrieve the shared HTTP session, creating it if needed."""
+  global _SESSION
+  with _SINGLETON_LOCK:
+    if _SESSION is None:
+      _SESSION = create_session()
+    return _SESSION
+
+
+def set_session(session: 'requests.Session'):
+  """Use a different HTTP session, such as one with different retry settings."""
+  global _SESSION
+  _SESSION = session
+
+
+def authorized_get(url: str,
+                   account: Optional[str] = None,
+                   timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                   **kwargs) -> 'requests.Response':
+  """Send a GET request with a cached access token, using the shared session.
+
+  If the token is rejected, for example because it was revoked, one new token is fetched and the request is sent again.
+
+  Args:
+    url: The URL to request.
+    account: The account whose access token to use. Defaults to the active account.
+    timeout: The timeout, in seconds, for each attempt.
+    **kwargs: Further arguments for requests, such as params.
+  Returns:
+    The response. The caller is responsible for checking its status.
+  """
+  headers = dict(kwargs.pop('headers', None) or {})
+  token_cache = get_token_cache()
+  headers['Authorization'] = f'Bearer {token_cache.get_token(account)}'
+  response = get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+  if response.status_code == 401:
+    token_cache.invalidate(account)
+    headers['Authorization'] = f'Bearer {token_cache.get_token(account)}'
+    response = get_session().get(url, headers=headers, timeout=timeout, **kwargs)
+  return response
@@ -0,0 +1,117 @@
+"""Methods to fetch many small objects concurrently.
+
+Fetching objects such as comment files is I/O-bound, so a pool of threads which lives for the
+duration of the Jupyter kernel is used instead of a new pool of processes for each request.
+"""
+
+import concurrent.futures
+import random
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_INITIAL_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 10.0
+
+FetchResult = NamedTuple('FetchResult', [('path', str), ('value', Any), ('error', Optional[str])])
+
+
+class ConcurrentFetcher:
+  """Encapsulate a bounded pool of threads used to fetch objects, with timeouts and retries."""
+
+  def __init__(self,
+               max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+               timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+               max_retries: int = DEFAULT_MAX_RETRIES,
+               initial_backoff_seconds: float = DEFAULT_INITIAL_BACKOFF_SECONDS,
+               sleep: Callable[[float], None] = time.sleep):
+    """Initialize the fetcher.
+
+    Args:
+      max_concurrency: The maximum number of fetches in flight at once.
+      timeout_seconds: The timeout for each individual fetch attempt, passed to the fetch function.
+      max_retries: The number of times to retry a failed fetch.
+      initial_backoff_seconds: The delay before the first retry. It doubles, with jitter, for each further retry.
+      sleep: The function used to wait between retries.
+    """
+    self.max_concurrency = max_concurrency
+    self.timeout_seconds = timeout_seconds
+    self.max_retries = max_retries
+    self.initial_backoff_seconds = initial_backoff_seconds
+    self._sleep = sleep
+    self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+    self._lock = threading.Lock()
+
+  @property
+  def executor(self) -> concurrent.futures.ThreadPoolExecutor:
+    """The pool of threads, created on first use."""
+    with self._lock:
+      if self._executor is None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                               thread_name_prefix='terra_widgets_fetch')
+      return self._executor
+
+  def get_backoff_seconds(self, attempt: int) -> float:
+    """Compute the delay before retrying, for the zero-based number of the attempt which failed."""
+    backoff = min(self.initial_backoff_seconds * 2 ** attempt, MAX_BACKOFF_SECONDS)
+    return backoff * random.uniform(0.5, 1.0)
+
+  def _fetch_with_retries(self, fetch_fn: Callable[..., Any], path: str) -> FetchResult:
+    attempt = 0
+    while True:
+      try:
+        return FetchResult(path=path, value=fetch_fn(path, timeout=self.timeout_seconds), error=None)
+      except FileNotFoundError as e:
+        # Retrying will not make the object appear.
+        return FetchResult(path=path, value=None, error=f'{type(e).__name__}: {e}')
+      except Exception as e:  # pylint: disable=broad-except
+        if attempt >= self.max_retries:
+          return FetchResult(path=path, value=None, error=f'{type(e).__name__}: {e}')
+        self._sleep(self.get_backoff_seconds(attempt))
+        attempt += 1
+
+  def fetch_all(self,
+                paths: Iterable[str],
+                fetch_fn: Callable[..., Any],
+                on_result: Optional[Callable[[FetchResult], None]] = None) -> List[FetchResult]:
+    """Fetch all the paths concurrently.
+
+    Args:
+      paths: The paths to fetch.
+      fetch_fn: A function which takes a path and a `timeout` keyword argument, returning the fetched value.
+      on_result: An optional callback, called from the calling thread as each fetch completes. For example,
+                 use it to update a progress bar.
+    Returns:
+      A FetchResult for each path, in the same order as the paths.
+    """
+    futures = [self.executor.submit(self._fetch_with_retries, fetch_fn, path) for path in paths]
+    if on_result:
+      for future in concurrent.futures.as_completed(futures):
+        on_result(future.result())
+    return [future.result() for future in futures]
+
+
+# Define this in the outer scope so that the pool of threads lives for the duration of the Jupyter kernel.
+_FETCHER: Optional[ConcurrentFetcher] = None
+
+
+def get_fetcher() -> ConcurrentFetcher:
+  """Retrieve the shared fetcher, creating it with the default settings if needed."""
+  global _FETCHER
+  if _FETCHER is None:
+    _FETCHER = ConcurrentFetcher()
+  return _FETCHER
+
+
+def set_fetcher(fetcher: ConcurrentFetcher):
+  """Use a fetcher with different settings, such as a different maximum concurrency."""
+  global _FETCHER
+  _FETCHER = fetcher
@@ -0,0 +1,213 @@
+"""Join dataframes from Dataset Builder in less memory than pandas.merge.
+
+The person dataframe from Dataset Builder has one row per participant, and the domain dataframes,
+such as measurements, have many rows per participant whose concept names are repeated strings.
+`pandas.merge` builds a hash table of the keys and copies every column of both dataframes, as
+object arrays of the strings. `join_dataframes` instead stores the ids in the smallest integer
+dtype that holds them and the repeated strings as categoricals. It then joins on an index of the
+person_ids of the dataframe with one row per person, and copies only the requested columns.
+"""
+
+from typing import Optional
+from typing import Sequence
+
+# String columns with at most this fraction of distinct values are stored as categoricals.
+MAX_CATEGORICAL_FRACTION = 0.5
+
+# Keys are looked up in an array indexed by the key when the range of the keys is at most this
+# many times their number, plus a constant, so that the array is not much larger than the keys.
+DENSE_INDEX_MAX_SPAN_PER_KEY = 16
+DENSE_INDEX_MIN_SPAN = 2**20
+
+# The suffixes of the columns other than the keys which are in both dataframes, as for pandas.merge.
+SUFFIXES = ('_x', '_y')
+
+
+def memory_usage_mb(df) -> float:
+  """Return the memory of the dataframe in megabytes, including the strings it holds."""
+  return df.memory_usage(index=True, deep=True).sum() / 2**20
+
+
+def shrink_dataframe(df, max_categorical_fraction: float = MAX_CATEGORICAL_FRACTION):
+  """Return the dataframe with its ids and repeated strings in smaller dtypes.
+
+  Integer columns whose names end in `_id`, such as person_id and the concept ids, become int32 if
+  their values fit in it. String columns with few distinct values, such as the concept names,
+  become categoricals with sorted categories. The dataframe itself is not modified.
+
+  Args:
+    df: A dataframe.
+    max_categorical_fraction: The largest ratio of distinct values to rows of the string columns
+      which become categoricals.
+  Returns:
+    A new dataframe with the same columns and values.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  int32 = np.iinfo(np.int32)
+  columns = {}
+  for name, column in df.items():
+    if (str(name).endswith('_id') and column.dtype == np.int64 and len(column)
+        and int32.min <= column.min() and column.max() <= int32.max):
+      column = column.astype(np.int32)
+    elif pd.api.types.is_object_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+      if pd.api.types.infer_dtype(column, skipna=True) == 'string':
+        codes, uniques = pd.factorize(column, sort=True)
+        if len(uniques) <= max_categorical_fraction * len(column):
+          column = pd.Series(pd.Categorical.from_codes(codes, uniques), index=column.index, name=name)
+    columns[name] = column
+  return pd.DataFrame(columns, index=df.index)
+
+
+def _index_keys(column):
+  """Return the column as numpy signed integers, or None if its keys cannot be indexed.
+
+  Nullable integer columns, such as those of pandas-gbq, are converted unless a key is missing.
+  Unsigned integers are not indexed, as together with signed ones they only fit in floats.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  if not pd.api.types.is_signed_integer_dtype(column.dtype):
+    return None
+  if isinstance(column.dtype, np.dtype):
+    return column
+  if column.isna().any():
+    return None
+  return pd.Series(column.to_numpy(np.int64), index=column.index, name=column.name)
+
+
+def _index_join(unique_df, repeated_df, key: str):
+  """Inner join on the key, which is unique in unique_df, returning the rows taken from each.
+
+  Keys within a range not much larger than their number, such as person_ids, are looked up in an
+  array indexed by the key. Otherwise each key is found by a binary search of the sorted keys.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  unique_keys = unique_df[key].to_numpy()
+  repeated_keys = repeated_df[key].to_numpy()
+  if not len(unique_keys) or not len(repeated_keys):
+    return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+  low, high = int(unique_keys.min()), int(unique_keys.max())
+  if high - low < DENSE_INDEX_MAX_SPAN_PER_KEY * len(unique_keys) + DENSE_INDEX_MIN_SPAN:
+    index = np.full(high - low + 1, -1, dtype=np.intp)
+    index[unique_keys - low] = np.arange(len(unique_keys))
+    offsets = repeated_keys.astype(np.int64) - low
+    in_range = (offsets >= 0) & (offsets <= high - low)
+    unique_rows = np.full(len(repeated_keys), -1, dtype=np.intp)
+    unique_rows[in_range] = index[offsets[in_range]]
+    matched = unique_rows >= 0
+  else:
+    # Dataframes which are already sorted by the key need not be sorted again.
+    order = None if unique_df[key].is_monotonic_increasing else np.argsort(unique_keys, kind='stable')
+    sorted_keys = unique_keys if order is None else unique_keys[order]
+    positions = np.searchsorted(sorted_keys, repeated_keys)
+    np.minimum(positions, len(sorted_keys) - 1, out=positions)
+    matched = sorted_keys[positions] == repeated_keys
+    unique_rows = positions if order is None else order[positions]
+  if matched.all():
+    return unique_rows, None
+  repeated_rows = np.flatnonzero(matched)
+  return unique_rows[repeated_rows], repeated_rows
+
+
+def _take(df, columns: Sequence[str], rows):
+  """Return the columns of the dataframe at the row positions, or all rows if rows is None."""
+  df = df[list(columns)]
+  if rows is not None:
+    df = df.take(rows)
+  return df.reset_index(drop=True)
+
+
+def join_dataframes(left, right, on: Optional[Sequence[str]] = None, columns: Optional[Sequence[str]] = None,
+                    report: bool = False):
+  """Inner join two dataframes, such as the person and measurement dataframes from Dataset Builder.
+
+  The dataframes are shrunk with shrink_dataframe before they are joined. When they are joined on
+  one signed integer column, such as person_id, whose values are unique in one of them, each row of
+  the other dataframe is matched through an index of the keys rather than a hash table, and its
+  rows stay in their order. Nullable Int64 keys without missing values are joined in the same way,
+  and become int64. Otherwise the dataframes are joined with pandas.merge.
+
+  Args:
+    left: A dataframe, such as YOUR_DATASET_NAME_person_df.
+    right: Another dataframe, such as YOUR_DATASET_NAME_measurement_df.
+    on: The columns to join on. Defaults to the columns the dataframes have in common.
+    columns: The columns of the result, from either dataframe. Defaults to all of them, in the
+      order of pandas.merge. Columns other than those of on which are in both dataframes are
+      named with the suffixes _x and _y, as by pandas.merge.
+    report: Whether to print the memory of the dataframes before and after they are shrunk, and
+      of the result.
+  Returns:
+    The joined dataframe.
+  Raises:
+    ValueError: if the dataframes have no columns in common, or a column is in neither dataframe.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  if on is None:
+    on = [column for column in left.columns if column in right.columns]
+  elif isinstance(on, str):
+    on = [on]
+  if not on:
+    raise ValueError('The dataframes have no columns in common to join on.')
+  # Other columns in both dataframes are suffixed, as pandas.merge does.
+  overlap = [column for column in left.columns if column in right.columns and column not in on]
+  if overlap:
+    left = left.rename(columns={column: f'{column}{SUFFIXES[0]}' for column in overlap})
+    right = right.rename(columns={column: f'{column}{SUFFIXES[1]}' for column in overlap})
+  if columns is None:
+    columns = list(left.columns) + [column for column in right.columns if column not in on]
+  missing = [column for column in columns if column not in left.columns and column not in right.columns]
+  if missing:
+    raise ValueError(f'Columns {missing} are in neither dataframe.')
+
+  left_columns = list(on) + [column for column in left.columns if column in columns and column not in on]
+  right_columns = list(on) + [column for column in right.columns
+                              if column in columns and column not in on and column not in left_columns]
+  left = left[left_columns]
+  right = right[right_columns]
+  if report:
+    before_mb = memory_usage_mb(left) + memory_usage_mb(right)
+  key = on[0]
+  keys = [_index_keys(left[key]), _index_keys(right[key])] if len(on) == 1 else [None]
+  indexable = all(k is not None for k in keys)
+  if indexable:
+    left = left.assign(**{key: keys[0]})
+    right = right.assign(**{key: keys[1]})
+  left = shrink_dataframe(left)
+  right = shrink_dataframe(right)
+  if report:
+    shrunk_mb = memory_usage_mb(left) + memory_usage_mb(right)
+
+  unique_side = None
+  if indexable:
+    # The dataframe with one row per key is usually the smaller one, so check it first.
+    for side, df in sorted([('left', left), ('right', right)], key=lambda item: len(item[1])):
+      if df[key].is_unique:
+        unique_side = side
+        break
+
+  if unique_side is None:
+    data = pd.merge(left, right, how='inner', on=list(on))
+  else:
+    # Compare the keys in one dtype, as the dataframes may have been shrunk differently.
+    dtype = np.promote_types(left[key].dtype, right[key].dtype)
+    left = left.astype({key: dtype})
+    right = right.astype({key: dtype})
+    unique_df, repeated_df = (left, right) if unique_side == 'left' else (right, left)
+    unique_rows, repeated_rows = _index_join(unique_df, repeated_df, key)
+    data = pd.concat([_take(repeated_df, [column for column in columns if column in repeated_df.columns],
+                            repeated_rows),
+                      _take(unique_df, [column for column in columns if column in unique_df.columns
+                                        and column not in repeated_df.columns], unique_rows)],
+                     axis=1)
+  data = data[list(columns)]
+
+  if report:
+    print(f'Joined {len(data):,} rows. Memory of the dataframes: {before_mb:,.1f} MB, '
+          f'{shrunk_mb:,.1f} MB after shrinking them. Memory of the result: {memory_usage_mb(data):,.1f} MB.')
+  return data
@@ -0,0 +1,304 @@
+"""Summarize every column of a dataframe, such as one from Dataset Builder, in one pass.
+
+pandas_profiling takes many minutes on the dataframes of a cohort, so the summarize_a_dataframe.py
+snippet profiled only the first 10,000 rows, which describe whichever participants came first.
+`summarize_dataframe` instead computes the statistics of each column over all of its rows, a chunk
+of rows at a time. The quantiles and the numbers of distinct values are estimated with sketches of
+fixed size. The correlations, which compare every pair of columns, are computed on a random or
+stratified sample of the rows, which can also be profiled with pandas_profiling.
+"""
+
+import time
+from typing import Any
+from typing import Dict
+from typing import NamedTuple
+from typing import Optional
+
+from terra_widgets.sketches import estimate_cardinality
+from terra_widgets.sketches import new_registers
+from terra_widgets.sketches import QuantileSketch
+from terra_widgets.sketches import update_registers
+
+# The number of rows to summarize at a time.
+DEFAULT_CHUNK_SIZE = 1000000
+
+# The number of rows of the sample for the correlations.
+DEFAULT_SAMPLE_SIZE = 10000
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# The counts of the values of each column are kept for at most this many of its most frequent
+# values, so they are exact for columns with fewer distinct values than this.
+MAX_TRACKED_VALUES = 1000
+
+# Cramér's V is computed between the columns of the sample with at most this many distinct values.
+MAX_CRAMERS_VALUES = 50
+
+STATISTICS = ['dtype', 'count', 'missing', 'missing_percent', 'distinct', 'mean', 'std', 'min'] + [
+    f'{100 * q:g}%' for q in QUANTILES] + ['max', 'zeros', 'top', 'top_count']
+
+DataframeSummary = NamedTuple('DataframeSummary', [('num_rows', int),
+                                                   ('num_rows_summarized', int),
+                                                   ('statistics', Any),
+                                                   ('sample', Any),
+                                                   ('correlations', Dict[str, Any])])
+
+
+def _values_as_strings(column):
+  """Return the column with each value which is not missing as its string, such as '[1, 2]' for a list."""
+  return column.astype(object).where(column.isna(), column.astype(str))
+
+
+def _count_values(column):
+  """Return the number of rows of each value of the column which is not missing, and their hashes.
+
+  Raises:
+    TypeError: if a value cannot be hashed.
+  """
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  counts = column.value_counts(dropna=True)
+  # Categoricals count every category, including those not in the chunk.
+  counts = pd.Series(counts.to_numpy(), index=pd.Index(counts.index.to_numpy(dtype=object)))
+  counts = counts[counts > 0]
+  return counts, pd.util.hash_array(counts.index.to_numpy())
+
+
+class _ColumnStatistics:
+  """Accumulate the statistics of one column over chunks of its rows."""
+
+  def __init__(self, dtype):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    self.dtype = dtype
+    if pd.api.types.is_bool_dtype(dtype):
+      self.kind = 'values'
+    elif pd.api.types.is_numeric_dtype(dtype):
+      self.kind = 'numeric'
+    elif pd.api.types.is_datetime64_any_dtype(dtype):
+      self.kind = 'datetime'
+    else:
+      self.kind = 'values'
+    self.count = 0
+    self.missing = 0
+    self.mean = 0.0
+    self.sum_of_squares = 0.0
+    self.min = None
+    self.max = None
+    self.zeros = 0
+    self.quantiles = QuantileSketch()
+    self.registers = new_registers(1)
+    self.value_counts = pd.Series(dtype=np.int64)
+    # Whether the values are counted as strings, as some of them cannot be hashed.
+    self.as_strings = False
+
+  def update(self, column):
+    """Add a chunk of the column's rows."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    if self.kind == 'values':
+      if self.as_strings:
+        column = _values_as_strings(column)
+      try:
+        counts, hashes = _count_values(column)
+      except TypeError:
+        # Lists and dicts, such as from BigQuery REPEATED and RECORD fields, cannot be hashed.
+        self.as_strings = True
+        counts, hashes = _count_values(_values_as_strings(column))
+      self.missing += len(column) - int(counts.sum())
+      self.count += int(counts.sum())
+      if len(counts):
+        update_registers(self.registers, hashes)
+        merged = counts if not len(self.value_counts) else self.value_counts.add(counts, fill_value=0)
+        self.value_counts = merged.nlargest(MAX_TRACKED_VALUES)
+      return
+
+    if self.kind == 'datetime':
+      if getattr(column.dtype, 'tz', None) is not None:
+        column = column.dt.tz_localize(None)
+      values = column.to_numpy()
+      valid = values[~np.isnat(values)].view(np.int64)
+    else:
+      values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+      valid = values[~np.isnan(values)]
+    self.missing += len(values) - len(valid)
+    if not len(valid):
+      return
+    update_registers(self.registers, pd.util.hash_array(valid))
+    chunk_min, chunk_max = valid.min(), valid.max()
+    self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+    self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+    if self.kind == 'numeric':
+      # Combine the mean and sum of squared deviations of the chunk with those of the earlier rows.
+      chunk_mean = valid.mean()
+      chunk_sum_of_squares = np.square(valid - chunk_mean).sum()
+      total = self.count + len(valid)
+      delta = chunk_mean - self.mean
+      self.sum_of_squares += chunk_sum_of_squares + delta**2 * self.count * len(valid) / total
+      self.mean += delta * len(valid) / total
+      self.zeros += int(np.count_nonzero(valid == 0))
+    self.count += len(valid)
+    self.quantiles.update(valid)
+
+  def get_statistics(self):
+    """Return the statistics of the column, as a dict whose keys are in STATISTICS."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    total = self.count + self.missing
+    statistics = {
+        'dtype': str(self.dtype),
+        'count': self.count,
+        'missing': self.missing,
+        'missing_percent': round(100 * self.missing / total, 2) if total else np.nan,
+        'distinct': int(np.round(estimate_cardinality(self.registers)[0])),
+    }
+    if self.kind == 'values':
+      if len(self.value_counts):
+        statistics['top'] = self.value_counts.index[0]
+        statistics['top_count'] = int(self.value_counts.iloc[0])
+      return statistics
+
+    quantiles = self.quantiles.quantiles(QUANTILES)
+    if self.kind == 'datetime':
+      unit, _ = np.datetime_data(np.dtype(getattr(self.dtype, 'base', self.dtype)))
+
+      def to_timestamp(value):
+        if value is None or np.isnan(value):
+          return pd.NaT
+        timestamp = pd.Timestamp(np.datetime64(int(round(value)), unit))
+        tz = getattr(self.dtype, 'tz', None)
+        return timestamp if tz is None else timestamp.tz_localize(tz)
+
+      statistics['min'] = to_timestamp(self.min)
+      statistics['max'] = to_timestamp(self.max)
+      for q, value in zip(QUANTILES, quantiles):
+        statistics[f'{100 * q:g}%'] = to_timestamp(value)
+      return statistics
+
+    statistics['mean'] = self.mean if self.count else np.nan
+    statistics['std'] = np.sqrt(self.sum_of_squares / (self.count - 1)) if self.count > 1 else np.nan
+    integers = pd.api.types.is_integer_dtype(self.dtype)
+    statistics['min'] = int(self.min) if integers and self.count else self.min
+    statistics['max'] = int(self.max) if integers and self.count else self.max
+    for q, value in zip(QUANTILES, quantiles):
+      statistics[f'{100 * q:g}%'] = value
+    statistics['zeros'] = self.zeros
+    return statistics
+
+
+def sample_rows(df, sample_size: int = DEFAULT_SAMPLE_SIZE, stratify_by: Optional[str] = None, seed: int = 0):
+  """Return a random sample of the rows of the dataframe, in their order.
+
+  Args:
+    df: A dataframe.
+    sample_size: The number of rows of the sample, or all of them if there are fewer.
+    stratify_by: A column whose values are the strata, such as 'sex_at_birth'. The sample then has
+      an equal number of rows of each value, or all the rows of the values which have fewer, so that
+      rare values are represented. Missing values are a stratum of their own. Defaults to a uniform
+      random sample.
+    seed: The seed of the random numbers.
+  Returns:
+    The sampled rows.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  rng = np.random.default_rng(seed)
+  if stratify_by is None:
+    positions = rng.choice(len(df), size=min(sample_size, len(df)), replace=False)
+  else:
+    codes, uniques = pd.factorize(df[stratify_by], use_na_sentinel=False)
+    sizes = np.bincount(codes, minlength=len(uniques))
+    # Give each stratum an equal share of the rows left, from the smallest stratum to the largest.
+    allocation = np.zeros(len(sizes), dtype=np.int64)
+    remaining = sample_size
+    for i, stratum in enumerate(np.argsort(sizes, kind='stable')):
+      allocation[stratum] = min(sizes[stratum], remaining // (len(sizes) - i))
+      remaining -= allocation[stratum]
+    # Shuffle the rows, then keep the first rows of each stratum up to its allocation.
+    shuffled = rng.permutation(len(df))
+    by_stratum = shuffled[np.argsort(codes[shuffled], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    sorted_codes = codes[by_stratum]
+    ranks = np.arange(len(df)) - starts[sorted_codes]
+    positions = by_stratum[ranks < allocation[sorted_codes]]
+  return df.take(np.sort(positions))
+
+
+def _cramers_v(sample, columns):
+  """Return Cramér's V, the association from 0 to 1, between each pair of the categorical columns."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  result = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+  for i, first in enumerate(columns):
+    for second in columns[i + 1:]:
+      observed = pd.crosstab(sample[first], sample[second]).to_numpy(dtype=np.float64)
+      n = observed.sum()
+      if min(observed.shape) < 2 or not n:
+        value = np.nan
+      else:
+        expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+        chi2 = (np.square(observed - expected) / expected).sum()
+        value = np.sqrt(chi2 / (n * (min(observed.shape) - 1)))
+      result.loc[first, second] = result.loc[second, first] = value
+  return result
+
+
+def summarize_dataframe(df, sample_size: int = DEFAULT_SAMPLE_SIZE, stratify_by: Optional[str] = None,
+                        time_budget_seconds: Optional[float] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        seed: int = 0) -> DataframeSummary:
+  """Compute the statistics of each column of the dataframe, and the correlations of a sample of its rows.
+
+  Args:
+    df: A dataframe, such as YOUR_DATASET_NAME_person_df.
+    sample_size: The number of rows of the sample for the correlations.
+    stratify_by: A column to stratify the sample by. See sample_rows.
+    time_budget_seconds: If set, the rows are summarized in a random order, and no more chunks of
+      rows are summarized once this many seconds have passed. The statistics are then those of a
+      uniform random sample of the rows. Defaults to summarizing every row.
+    chunk_size: The number of rows to summarize at a time.
+    seed: The seed of the random numbers for the order of the rows and the sample.
+  Returns:
+    The summary. Its statistics are a dataframe with a row for each column of df and the columns
+    in STATISTICS: the counts of values and of missing values, the estimated number of distinct
+    values, the mean, standard deviation, minimum, estimated quantiles and maximum of numbers and
+    datetimes, and the most frequent other value. Its correlations are the Pearson and Spearman
+    correlations of the numeric columns of the sample, and Cramér's V of its other columns with few
+    distinct values.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  start = time.monotonic()
+  columns = {name: _ColumnStatistics(dtype) for name, dtype in df.dtypes.items()}
+  order = None if time_budget_seconds is None else np.random.default_rng(seed).permutation(len(df))
+  num_rows_summarized = 0
+  for chunk_start in range(0, len(df), chunk_size):
+    if order is None:
+      chunk = df.iloc[chunk_start:chunk_start + chunk_size]
+    else:
+      chunk = df.take(order[chunk_start:chunk_start + chunk_size])
+    for name, statistics in columns.items():
+      statistics.update(chunk[name])
+    num_rows_summarized += len(chunk)
+    if time_budget_seconds is not None and time.monotonic() - start > time_budget_seconds:
+      break
+  statistics = pd.DataFrame([columns[name].get_statistics() for name in columns], index=list(columns),
+                            columns=STATISTICS).astype({'zeros': 'Int64', 'top_count': 'Int64'})
+
+  sample = sample_rows(df, sample_size=sample_size, stratify_by=stratify_by, seed=seed)
+  numeric = [name for name, column in columns.items() if column.kind == 'numeric']
+  categorical = [name for name, column in columns.items()
+                 if column.kind == 'values' and not column.as_strings
+                 and 1 < sample[name].nunique() <= MAX_CRAMERS_VALUES]
+  correlations = {
+      'pearson': sample[numeric].corr(method='pearson'),
+      'spearman': sample[numeric].corr(method='spearman'),
+      'cramers': _cramers_v(sample, categorical),
+  }
+  return DataframeSummary(num_rows=len(df), num_rows_summarized=num_rows_summarized, statistics=statistics,
+                          sample=sample, correlations=correlations)
@@ -0,0 +1,83 @@
+"""Methods for rendering notebooks to HTML in bulk.
+
+Notebooks are rendered in-process using nbconvert's HTMLExporter instead of launching
+`jupyter nbconvert` once per notebook. When more than one notebook is rendered, the work
+is spread across a pool of processes and results are yielded as each notebook finishes.
+"""
+
+import concurrent.futures
+import os
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+
+from terra_widgets.workspace_paths import WorkspacePaths
+
+RenderResult = NamedTuple('RenderResult', [('notebook_file', str),
+                                           ('html_file', Optional[str]),
+                                           ('error', Optional[str])])
+
+# The exporter is created once per process and reused for every notebook rendered by that process.
+_EXPORTER = None
+
+
+def _get_exporter():
+  """Retrieve the HTML exporter for this process, creating it if needed."""
+  global _EXPORTER
+  if _EXPORTER is None:
+    from nbconvert import HTMLExporter
+    from traitlets.config import Config
+    # Keep images inline within the HTML, the same as `--ExtractOutputPreprocessor.enabled=False`.
+    _EXPORTER = HTMLExporter(config=Config({'ExtractOutputPreprocessor': {'enabled': False}}))
+  return _EXPORTER
+
+
+def render_notebook(notebook_file: str) -> RenderResult:
+  """Render a local notebook file to an HTML file in the same folder.
+
+  The notebook is rendered as-is (it is not re-run).
+
+  Args:
+    notebook_file: The local path to the notebook.
+  Returns:
+    A RenderResult holding the path to the HTML file, or the error message if rendering failed.
+  """
+  html_file = notebook_file.replace(WorkspacePaths.NOTEBOOK_FILE_SUFFIX, WorkspacePaths.HTML_FILE_SUFFIX)
+  try:
+    body, _ = _get_exporter().from_filename(notebook_file)
+    with open(html_file, 'w', encoding='utf-8') as f:
+      f.write(body)
+  except Exception as e:  # pylint: disable=broad-except
+    return RenderResult(notebook_file=notebook_file, html_file=None, error=f'{type(e).__name__}: {e}')
+  return RenderResult(notebook_file=notebook_file, html_file=html_file, error=None)
+
+
+def render_notebooks(notebook_files: Iterable[str], max_workers: Optional[int] = None) -> Iterator[RenderResult]:
+  """Render local notebook files to HTML, yielding each result as soon as it is ready.
+
+  Results are yielded in completion order, not in the order of the input.
+
+  Args:
+    notebook_files: The local paths to the notebooks.
+    max_workers: The maximum number of processes to use. Defaults to the number of CPUs.
+  Yields:
+    A RenderResult for each notebook.
+  """
+  notebook_files = list(notebook_files)
+  if max_workers is None:
+    max_workers = os.cpu_count() or 1
+  max_workers = min(max_workers, len(notebook_files))
+  if max_workers <= 1:
+    # Not worth the cost of starting a process pool.
+    for notebook_file in notebook_files:
+      yield render_notebook(notebook_file)
+    return
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+    futures = {executor.submit(render_notebook, notebook_file): notebook_file for notebook_file in notebook_files}
+    for future in concurrent.futures.as_completed(futures):
+      try:
+        yield future.result()
+      except concurrent.futures.process.BrokenProcessPool as e:
+        yield RenderResult(notebook_file=futures[future], html_file=None, error=f'{type(e).__name__}: {e}')
@@ -7,47 +7,67 @@ a notebook changes over time as analysis work proceeds.
 import collections
 import os
 import tempfile
+from typing import Callable
 from typing import Dict
 from typing import List
-
-from IPython import get_ipython
-from IPython.display import display
-from IPython.display import HTML
-from IPython.display import IFrame
-from ipywidgets import widgets
-from multiprocess import Pool
-import pandas as pd
-import tensorflow as tf
-from tqdm import tqdm
-
-from terra_widgets.workspace_metadata import WorkspaceMetadata
+from typing import Optional
+from typing import TYPE_CHECKING
+
+from terra_widgets.concurrent_fetch import get_fetcher
+from terra_widgets.html_rendering import render_notebooks
+from terra_widgets.html_rendering import RenderResult
+from terra_widgets.object_cache import get_object_cache
+from terra_widgets.snapshot_index import get_snapshot_index
+from terra_widgets.storage import FAILED
+from terra_widgets.storage import get_storage_backend
+from terra_widgets.storage import ObjectUpload
+from terra_widgets.storage import SKIPPED
+from terra_widgets.storage import UploadResult
 from terra_widgets.workspace_paths import WorkspacePaths
 
+# The user interface modules are slow to import, so they are imported only when a widget is created.
+if TYPE_CHECKING:
+  from IPython.display import HTML
+
 # Define this in the outer scope so that it lives for the duration of the Jupyter kernel.
-TEMP_HTML = tempfile.NamedTemporaryFile(dir=os.getcwd(), prefix='view_an_html_snapshot_', suffix='.html')
+_TEMP_HTML = None
+
+
+def _get_temp_html():
+  """Retrieve the local file used to display HTML snapshots, creating it on first use."""
+  global _TEMP_HTML
+  if _TEMP_HTML is None:
+    _TEMP_HTML = tempfile.NamedTemporaryFile(dir=os.getcwd(), prefix='view_an_html_snapshot_', suffix='.html')
+  return _TEMP_HTML
 
 
 def create_html_snapshot(notebook_paths: List[str],
                          comment: str,
                          workspace_paths: WorkspacePaths,
-                         overwrite: bool = False) -> HTML:
+                         overwrite: bool = False,
+                         on_result: Optional[Callable[[str, RenderResult], None]] = None) -> 'HTML':
   """Render a notebook to HTML and transfer the HTML and its comment to the workspace bucket.
 
   The notebook is rendered as-is (it is not re-run). The comment is stored in a file in the same folder as the HTML.
+  When more than one notebook is selected, they are rendered in parallel and each one is transferred to the
+  workspace bucket as soon as its rendering completes.
 
-  Note, there's a mix of TensorFlow GFile in here and gsutil. We use GFile while the file could be
-  either local or remote. We use gsutil when its definitely remote because the console output serves as
-  useful progress messages.
+  The HTML and comment files are transferred concurrently by the storage backend, with their
+  Content-Type set as part of the upload.
 
   Args:
     notebook_paths: A list of Cloud Storage paths to the notebooks for which to create HTML
     comment: A string to be associated with the HTML file(s) such as a description of recent
              changes to the notebook and the results within it.
     workspace_paths: A list of WorkspacePaths objects indicating the destinations for the HTML and comment files.
-    overwrite: Skip the snapshot creation if the file already exists.
+    overwrite: Whether to replace the snapshot files if they already exist. If False, existing files
+               are left as-is and reported in the returned HTML.
+    on_result: An optional callback, called with the notebook path and its RenderResult as each notebook finishes.
   Returns:
     An HTML object for display.
   """
+  from IPython.display import HTML
+
   if not notebook_paths:
     return HTML('''<div class="alert alert-block alert-danger">
     No notebook was selected. To create an HTML snapshot of a notebook, select the desired notebook.</div>''')
@@ -59,33 +79,92 @@ def create_html_snapshot(notebook_paths: List[str],
   destinations = workspace_paths.formulate_destination_paths(notebooks=notebook_paths)
 
   with tempfile.TemporaryDirectory() as tmpdirname:
+    temp_notebooks = {}
     for notebook_path in notebook_paths:
       temp_notebook = os.path.join(tmpdirname, os.path.basename(notebook_path))
       try:
-        tf.io.gfile.copy(src=notebook_path, dst=temp_notebook)
-      except (tf.errors.NotFoundError, tf.errors.PermissionDeniedError) as e:
+        get_storage_backend().download_file(notebook_path, temp_notebook)
+      except (FileNotFoundError, PermissionError) as e:
         return HTML(f'''<div class="alert alert-block alert-danger">
         <b>Warning:</b> Unable to copy {notebook_path} to {temp_notebook}.
-        <hr><p><pre>{e.message}</pre></p></div>''')
-
-      noclobber = '-n' if not overwrite else ''
-      # Create and transfer the html file to the workspace bucket.
-      get_ipython().system(f"set -o xtrace ; jupyter nbconvert --to html --ExtractOutputPreprocessor.enabled=False '{temp_notebook}'")
-      temp_html = temp_notebook.replace(WorkspacePaths.NOTEBOOK_FILE_SUFFIX, WorkspacePaths.HTML_FILE_SUFFIX)
-      get_ipython().system(f"set -o xtrace ; gsutil cp {noclobber} '{temp_html}' '{destinations[notebook_path].html_file}'")
-      # Create and transfer the comment file to the workspace bucket.
-      temp_comment = temp_notebook.replace(WorkspacePaths.NOTEBOOK_FILE_SUFFIX, WorkspacePaths.COMMENT_FILE_SUFFIX)
-      with open(temp_comment, 'w') as f:
-        f.write(comment)
-      get_ipython().system(f"set -o xtrace ; gsutil cp {noclobber} '{temp_comment}' '{destinations[notebook_path].comment_file}'")
-      get_ipython().system(f"set -o xtrace ; gsutil setmeta -h 'Content-Type:text/plain' '{destinations[notebook_path].comment_file}'")
+        <hr><p><pre>{e}</pre></p></div>''')
+      temp_notebooks[temp_notebook] = notebook_path
+
+    def artifacts():
+      # Create the html files, transferring each one to the workspace bucket as soon as it is ready.
+      for result in render_notebooks(notebook_files=temp_notebooks.keys()):
+        notebook_path = temp_notebooks[result.notebook_file]
+        if on_result:
+          on_result(notebook_path, result)
+        if result.error:
+          continue
+        yield ObjectUpload(source_file=result.html_file,
+                           destination=destinations[notebook_path].html_file,
+                           content_type='text/html')
+        # Create and transfer the comment file to the workspace bucket.
+        temp_comment = result.notebook_file.replace(WorkspacePaths.NOTEBOOK_FILE_SUFFIX, WorkspacePaths.COMMENT_FILE_SUFFIX)
+        with open(temp_comment, 'w') as f:
+          f.write(comment)
+        yield ObjectUpload(source_file=temp_comment,
+                           destination=destinations[notebook_path].comment_file,
+                           content_type='text/plain')
+
+    upload_results = list(get_storage_backend().upload_files(artifacts(), overwrite=overwrite))
+  # Make the new snapshots visible in the other tabs.
+  get_snapshot_index(workspace_paths).invalidate()
+
+  return _format_upload_results(upload_results)
+
+
+def _format_upload_results(upload_results: List[UploadResult]) -> 'HTML':
+  """Format the outcome of transferring the snapshot files to the workspace bucket for display."""
+  from IPython.display import HTML
+
+  messages = []
+  skipped = sorted(r.destination for r in upload_results if r.status == SKIPPED)
+  if skipped:
+    files = '<br>'.join(skipped)
+    messages.append(f'''<div class="alert alert-block alert-warning">
+    <b>Warning:</b> These files already exist and were not overwritten:<br>{files}</div>''')
+  for result in sorted((r for r in upload_results if r.status == FAILED), key=lambda r: r.destination):
+    messages.append(f'''<div class="alert alert-block alert-danger">
+    <b>Warning:</b> Unable to transfer {result.destination}.
+    <hr><p><pre>{result.error}</pre></p></div>''')
+  return HTML(''.join(messages))
+
+
+def _format_render_result(notebook_path: str, result: RenderResult) -> 'HTML':
+  """Format the outcome of rendering a single notebook for display."""
+  from IPython.display import HTML
+
+  if result.error:
+    return HTML(f'''<div class="alert alert-block alert-danger">
+    <b>Warning:</b> Unable to render {notebook_path} to HTML.
+    <hr><p><pre>{result.error}</pre></p></div>''')
+  return HTML(f'''<div class="alert alert-block alert-success">Rendered {os.path.basename(notebook_path)}.</div>''')
+
+
+def read_snapshot_file(path: str, workspace_paths: WorkspacePaths, timeout: Optional[float] = None) -> bytes:
+  """Read an HTML snapshot or comment file, from the local cache when possible.
 
-  # Intentionally empty. 'No clobber' does not throw an error, only warns, so returning success might not be correct.
-  return HTML('')
+  Args:
+    path: The path to the HTML snapshot or comment file.
+    workspace_paths: The WorkspacePaths object for the workspace bucket holding the file.
+    timeout: The number of seconds to wait for Cloud Storage, if the file is not already cached.
+  Returns:
+    The contents of the file.
+  """
+  generation = get_snapshot_index(workspace_paths).get_generation(path)
+  return get_object_cache().get_or_fetch(
+      path, generation, lambda p: get_storage_backend().read_bytes(p, timeout=timeout))
 
 
 def create_html_snapshot_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, WorkspacePaths], output):
   """Create an ipywidget UI for creating html copies."""
+  from IPython.display import display
+  from IPython.display import HTML
+  from ipywidgets import widgets
+
   workspace_chooser = widgets.Dropdown(
       options=ws_names2id,
       value=None,
@@ -125,13 +204,14 @@ def create_html_snapshot_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str,
       workspace_paths = ws_paths[workspace_chooser.value]
       display(create_html_snapshot(notebook_paths=notebook_chooser.value,
                                    comment=commenter.value,
-                                   workspace_paths=workspace_paths))
+                                   workspace_paths=workspace_paths,
+                                   on_result=lambda nb, result: display(_format_render_result(nb, result))))
   submit_button.on_click(on_button_clicked)
 
   def on_choose_workspace(changed):
     output.clear_output()
     workspace_paths = ws_paths[changed['new']]
-    workspace_notebooks = tf.io.gfile.glob(pattern=workspace_paths.get_notebook_file_glob())
+    workspace_notebooks = get_storage_backend().glob(pattern=workspace_paths.get_notebook_file_glob())
     notebook_chooser.options = {os.path.basename(nb): nb for nb in workspace_notebooks}
   workspace_chooser.observe(on_choose_workspace, names='value')
 
@@ -152,6 +232,11 @@ def create_html_snapshot_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str,
 
 def create_view_files_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, WorkspacePaths], output):
   """Create an ipywidget UI to view HTML snapshots and their associated comment files."""
+  from IPython.display import display
+  from IPython.display import HTML
+  from IPython.display import IFrame
+  from ipywidgets import widgets
+
   workspace_chooser = widgets.Dropdown(
       options=ws_names2id,
       value=None,
@@ -201,6 +286,12 @@ def create_view_files_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, Wo
       layout=widgets.Layout(width='250px'),
       tooltip='Click the button to view the HTML snapshot of the notebook.'
   )
+  refresh_button = widgets.Button(
+      description='Refresh the list of HTML snapshots',
+      disabled=False,
+      layout=widgets.Layout(width='300px'),
+      tooltip='Click the button to see HTML snapshots created since the list was last retrieved.'
+  )
 
   def on_view_comment_button_clicked(_):
     with output:
@@ -210,8 +301,8 @@ def create_view_files_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, Wo
         No comment files found for HTML snapshots in this workspace.</div>'''))
         return
       comment_file = file_chooser.value.replace('.html', WorkspacePaths.COMMENT_FILE_SUFFIX)
-      comment = get_ipython().getoutput(f"gsutil cat '{comment_file}'")
-      display(HTML(f'''<div class="alert alert-block alert-info">{comment}</div>'''))
+      comment = read_snapshot_file(path=comment_file, workspace_paths=ws_paths[workspace_chooser.value])
+      display(HTML(f'''<div class="alert alert-block alert-info">{'<br>'.join(comment.decode('utf-8').splitlines())}</div>'''))
   view_comment_button.on_click(on_view_comment_button_clicked)
 
   def on_view_html_button_clicked(_):
@@ -221,49 +312,46 @@ def create_view_files_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, Wo
         display(HTML('''<div class="alert alert-block alert-warning">
         No HTML snapshots found in this workspace.</div>'''))
         return
-      source = file_chooser.value
-      dest = TEMP_HTML.name
-      get_ipython().system(f"set -o xtrace ; gsutil cp '{source}' '{dest}'")
-      display(IFrame(os.path.join('.', os.path.basename(TEMP_HTML.name)), width='100%', height=800))
+      snapshot = read_snapshot_file(path=file_chooser.value, workspace_paths=ws_paths[workspace_chooser.value])
+      temp_html = _get_temp_html()
+      with open(temp_html.name, 'wb') as f:
+        f.write(snapshot)
+      display(IFrame(os.path.join('.', os.path.basename(temp_html.name)), width='100%', height=800))
   view_html_button.on_click(on_view_html_button_clicked)
 
   def on_choose_workspace(changed):
     output.clear_output()
     user_chooser.options = []
     if changed['new']:
-      workspace_paths = ws_paths[changed['new']]
-      items = tf.io.gfile.glob(pattern=workspace_paths.get_user_glob())
-      if items:
-        user_chooser.options = {os.path.basename(item): item for item in items}
+      snapshot_index = get_snapshot_index(ws_paths[changed['new']])
+      user_chooser.options = snapshot_index.get_users()
   workspace_chooser.observe(on_choose_workspace, names='value')
 
+  def on_refresh_button_clicked(_):
+    if workspace_chooser.value:
+      get_snapshot_index(ws_paths[workspace_chooser.value]).refresh(full=True)
+      on_choose_workspace({'new': workspace_chooser.value})
+  refresh_button.on_click(on_refresh_button_clicked)
+
   def on_choose_user(changed):
     date_chooser.options = []
     if changed['new']:
-      workspace_paths = ws_paths[workspace_chooser.value]
-      items = tf.io.gfile.glob(pattern=workspace_paths.add_date_glob_to_path(path=changed['new']))
-      if items:
-        date_chooser.options = collections.OrderedDict(sorted(
-            {os.path.basename(item): item for item in items}.items(), reverse=True))
+      snapshot_index = get_snapshot_index(ws_paths[workspace_chooser.value])
+      date_chooser.options = snapshot_index.get_dates(user_path=changed['new'])
   user_chooser.observe(on_choose_user, names='value')
 
   def on_choose_date(changed):
     time_chooser.options = []
     if changed['new']:
-      workspace_paths = ws_paths[workspace_chooser.value]
-      items = tf.io.gfile.glob(pattern=workspace_paths.add_time_glob_to_path(path=changed['new']))
-      if items:
-        time_chooser.options = collections.OrderedDict(sorted(
-            {os.path.basename(item): item for item in items}.items(), reverse=True))
+      snapshot_index = get_snapshot_index(ws_paths[workspace_chooser.value])
+      time_chooser.options = snapshot_index.get_times(date_path=changed['new'])
   date_chooser.observe(on_choose_date, names='value')
 
   def on_choose_time(changed):
     file_chooser.options = []
     if changed['new']:
-      workspace_paths = ws_paths[workspace_chooser.value]
-      items = tf.io.gfile.glob(pattern=workspace_paths.add_html_glob_to_path(path=changed['new']))
-      if items:
-        file_chooser.options = {os.path.basename(item): item for item in items}
+      snapshot_index = get_snapshot_index(ws_paths[workspace_chooser.value])
+      file_chooser.options = snapshot_index.get_files(time_path=changed['new'])
   time_chooser.observe(on_choose_time, names='value')
 
   return widgets.VBox(
@@ -273,12 +361,18 @@ def create_view_files_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, Wo
        <br>Then click on the 'view' buttons to see either the comment for the snapshot or the actual snapshot.
        </p><hr>'''),
        workspace_chooser, user_chooser, date_chooser, time_chooser, file_chooser,
-       widgets.HBox([view_comment_button, view_html_button])],
+       widgets.HBox([view_comment_button, view_html_button, refresh_button])],
       layout=widgets.Layout(width='auto', border='solid 1px grey'))
 
 
 def create_view_all_comments_widget(ws_names2id: Dict[str, str], ws_paths: Dict[str, WorkspacePaths], output):
   """Create an ipywidget UI to display the contents of all comment files within a particular workspace."""
+  from IPython.display import display
+  from IPython.display import HTML
+  from ipywidgets import widgets
+  import pandas as pd
+  from tqdm import tqdm
+
   workspace_chooser = widgets.Dropdown(
       options=ws_names2id,
       value=None,
@@ -292,12 +386,12 @@ def create_view_all_comments_widget(ws_names2id: Dict[str, str], ws_paths: Dict[
       output.clear_output()
       workspace_paths = ws_paths[changed['new']]
       try:
-        comment_files = tf.io.gfile.glob(pattern=workspace_paths.get_comment_file_glob())
-      except tf.errors.PermissionDeniedError as e:
+        comment_files = get_snapshot_index(workspace_paths).get_all_files(suffix=WorkspacePaths.COMMENT_FILE_SUFFIX)
+      except PermissionError as e:
         target_workspace = [name for name, id in ws_names2id.items() if id == changed['new']]
         display(HTML(f'''<div class="alert alert-block alert-danger">
           <b>Warning:</b> Unable to view HTML snapshots in workspace {target_workspace} from <b>this workspace</b>.
-          <hr><p><pre>{e.message}</pre></p>
+          <hr><p><pre>{e}</pre></p>
           </div>'''))
         return
       if not comment_files:
@@ -305,18 +399,19 @@ def create_view_all_comments_widget(ws_names2id: Dict[str, str], ws_paths: Dict[
           No comment files found for HTML snapshots in this workspace.</div>'''))
         return
 
-      def get_comment(f):
-        with tf.io.gfile.GFile(f, 'r') as fh:
-          return fh.readlines()
-
-      def process_task(f):
-        return f, get_comment(f)
+      def get_comment(f, timeout):
+        return read_snapshot_file(path=f, workspace_paths=workspace_paths, timeout=timeout).decode('utf-8').splitlines()
 
-      max_pool = 8
-      with Pool(max_pool) as p:
-        pool_outputs = list(tqdm(p.imap(process_task, comment_files), total=len(comment_files)))
+      with tqdm(total=len(comment_files)) as progress_bar:
+        fetch_results = get_fetcher().fetch_all(comment_files, get_comment, on_result=lambda _: progress_bar.update(1))
 
-      comments = pd.DataFrame.from_dict({f.replace(workspace_paths.get_subfolder(), ''): c[0] for f, c in pool_outputs},
+      for result in fetch_results:
+        if result.error:
+          display(HTML(f'''<div class="alert alert-block alert-warning">
+            <b>Warning:</b> Unable to read {result.path}.
+            <hr><p><pre>{result.error}</pre></p></div>'''))
+      comments = pd.DataFrame.from_dict({r.path.replace(workspace_paths.get_subfolder(), ''): r.value[0] if r.value else ''
+                                         for r in fetch_results if not r.error},
                                         orient = 'index',
                                         columns = ['comment']
                                        ).reset_index()
@@ -336,6 +431,13 @@ def create_view_all_comments_widget(ws_names2id: Dict[str, str], ws_paths: Dict[
 
 def display_html_snapshots_widget():
   """Create an ipywidget UI encapsulating all three UIs related to HTML snapshots."""
+  from IPython import get_ipython
+  from IPython.display import display
+  from ipywidgets import widgets
+  import pandas as pd
+
+  from terra_widgets.workspace_metadata import WorkspaceMetadata
+
   if not get_ipython():
     print('The HTML snapshot widget cannot be display in environments other than IPython.')
     return
@@ -350,30 +452,41 @@ def display_html_snapshots_widget():
       '''// Display cell outputs to full height (no vertical scroll bar)
          IPython.OutputArea.auto_scroll_threshold = 9999;''')
 
-  # Retrieve the workspace metadata for the current user and environment.
-  ws_meta = WorkspaceMetadata()
-  workspace_names2id = collections.OrderedDict(sorted(
-      ws_meta.get_workspace_name_to_id_mapping().items()))
-  workspace_names2id_include_readonly = collections.OrderedDict(sorted(
-      ws_meta.get_workspace_name_to_id_mapping(include_private_readonly=True).items()))
-  workspace_ids2bucket_include_readonly = ws_meta.get_workspace_id_to_bucket_mapping(include_private_readonly=True)
-  workspace_paths = {k: WorkspacePaths(workspace_bucket=v)
-                     for k, v in workspace_ids2bucket_include_readonly.items()}
-
   ui_output = widgets.Output()
 
+  # Display the tabs right away, and fill them in once the workspace metadata has arrived.
   ui_tabs = widgets.Tab()
-  ui_tabs.children = [create_html_snapshot_widget(ws_names2id=workspace_names2id,
-                                                  ws_paths=workspace_paths,
-                                                  output=ui_output),
-                      create_view_files_widget(ws_names2id=workspace_names2id_include_readonly,
-                                               ws_paths=workspace_paths,
-                                               output=ui_output),
-                      create_view_all_comments_widget(ws_names2id=workspace_names2id_include_readonly,
-                                                      ws_paths=workspace_paths,
-                                                      output=ui_output)]
+  ui_tabs.children = [widgets.HTML('<p>Retrieving the list of your workspaces...</p>') for _ in range(3)]
   ui_tabs.set_title(title='Create', index=0)
   ui_tabs.set_title(title='View one', index=1)
   ui_tabs.set_title(title='View all', index=2)
 
+  def on_metadata_loaded(ws_meta: WorkspaceMetadata):
+    try:
+      ws_meta.wait()
+    except Exception as e:  # pylint: disable=broad-except
+      ui_tabs.children = [widgets.HTML(f'''<div class="alert alert-block alert-danger">
+      <b>Warning:</b> Unable to retrieve the list of your workspaces.
+      <hr><p><pre>{e}</pre></p></div>''') for _ in range(3)]
+      return
+    workspace_names2id = collections.OrderedDict(sorted(
+        ws_meta.get_workspace_name_to_id_mapping().items()))
+    workspace_names2id_include_readonly = collections.OrderedDict(sorted(
+        ws_meta.get_workspace_name_to_id_mapping(include_private_readonly=True).items()))
+    workspace_ids2bucket_include_readonly = ws_meta.get_workspace_id_to_bucket_mapping(include_private_readonly=True)
+    workspace_paths = {k: WorkspacePaths(workspace_bucket=v)
+                       for k, v in workspace_ids2bucket_include_readonly.items()}
+    ui_tabs.children = [create_html_snapshot_widget(ws_names2id=workspace_names2id,
+                                                    ws_paths=workspace_paths,
+                                                    output=ui_output),
+                        create_view_files_widget(ws_names2id=workspace_names2id_include_readonly,
+                                                 ws_paths=workspace_paths,
+                                                 output=ui_output),
+                        create_view_all_comments_widget(ws_names2id=workspace_names2id_include_readonly,
+                                                        ws_paths=workspace_paths,
+                                                        output=ui_output)]
+
+  # Retrieve the workspace metadata for the current user and environment.
+  WorkspaceMetadata(background=True).add_done_callback(on_metadata_loaded)
+
   display(ui_tabs, ui_output)
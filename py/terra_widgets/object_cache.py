@@ -0,0 +1,142 @@
+"""A local cache of objects from the workspace bucket.
+
+HTML snapshots and their comment files are never modified once written, so a cached copy keyed
+by the object path and generation can be reused indefinitely. The cache is shared by all the
+tabs of the widget and by all Jupyter kernels on the same machine.
+"""
+
+import collections
+import hashlib
+import os
+import threading
+from typing import Callable
+from typing import NamedTuple
+from typing import Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'terra_widgets', 'objects')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+CacheStats = NamedTuple('CacheStats', [('hits', int),
+                                       ('misses', int),
+                                       ('evictions', int),
+                                       ('num_objects', int),
+                                       ('size_bytes', int)])
+
+
+class ObjectCache:
+  """Encapsulate a least-recently-used cache of objects on local disk, with a cap on its total size."""
+
+  def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    self._sizes = collections.OrderedDict()  # Least recently used first.
+    self._size_bytes = 0
+    self._hits = 0
+    self._misses = 0
+    self._evictions = 0
+    os.makedirs(cache_dir, exist_ok=True)
+    # Pick up where previous kernels left off, using the access time as the recency.
+    entries = []
+    for key in os.listdir(cache_dir):
+      if key.endswith('.tmp'):
+        continue
+      stat = os.stat(os.path.join(cache_dir, key))
+      entries.append((stat.st_atime, key, stat.st_size))
+    for _, key, size in sorted(entries):
+      self._sizes[key] = size
+      self._size_bytes += size
+    with self._lock:
+      self._evict()
+
+  @staticmethod
+  def get_key(path: str, generation: int) -> str:
+    return hashlib.sha256(f'{path}#{generation}'.encode('utf-8')).hexdigest()
+
+  @property
+  def stats(self) -> CacheStats:
+    with self._lock:
+      return CacheStats(hits=self._hits, misses=self._misses, evictions=self._evictions,
+                        num_objects=len(self._sizes), size_bytes=self._size_bytes)
+
+  def _evict(self):
+    """Remove least recently used objects until the cache is within its size limit. Hold the lock to call this."""
+    while self._size_bytes > self.max_bytes and self._sizes:
+      key, size = self._sizes.popitem(last=False)
+      self._size_bytes -= size
+      self._evictions += 1
+      try:
+        os.remove(os.path.join(self.cache_dir, key))
+      except FileNotFoundError:
+        pass  # Another kernel already removed it.
+
+  def get(self, path: str, generation: int) -> Optional[bytes]:
+    """Retrieve the cached contents of the object, or None if it is not in the cache."""
+    key = self.get_key(path, generation)
+    try:
+      with open(os.path.join(self.cache_dir, key), 'rb') as f:
+        data = f.read()
+    except FileNotFoundError:
+      with self._lock:
+        self._misses += 1
+        if key in self._sizes:
+          # Another kernel evicted it.
+          self._size_bytes -= self._sizes.pop(key)
+      return None
+    with self._lock:
+      self._hits += 1
+      if key not in self._sizes:
+        # Another kernel added it.
+        self._sizes[key] = len(data)
+        self._size_bytes += len(data)
+      self._sizes.move_to_end(key)
+    return data
+
+  def put(self, path: str, generation: int, data: bytes):
+    """Add the contents of the object to the cache."""
+    if len(data) > self.max_bytes:
+      return
+    key = self.get_key(path, generation)
+    temp_file = os.path.join(self.cache_dir, f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(temp_file, 'wb') as f:
+      f.write(data)
+    os.replace(temp_file, os.path.join(self.cache_dir, key))
+    with self._lock:
+      if key in self._sizes:
+        self._size_bytes -= self._sizes[key]
+      self._sizes[key] = len(data)
+      self._sizes.move_to_end(key)
+      self._size_bytes += len(data)
+      self._evict()
+
+  def get_or_fetch(self, path: str, generation: Optional[int], fetch_fn: Callable[[str], bytes]) -> bytes:
+    """Retrieve the contents of the object from the cache, fetching and caching them on a miss.
+
+    Args:
+      path: The path to the object.
+      generation: The generation of the object. If it is not known, the object is fetched and not cached.
+      fetch_fn: A function which takes the path and returns the contents of the object.
+    Returns:
+      The contents of the object.
+    """
+    if generation is None:
+      with self._lock:
+        self._misses += 1
+      return fetch_fn(path)
+    data = self.get(path, generation)
+    if data is None:
+      data = fetch_fn(path)
+      self.put(path, generation, data)
+    return data
+
+
+# Define this in the outer scope so that the cache lives for the duration of the Jupyter kernel.
+_OBJECT_CACHE: Optional[ObjectCache] = None
+
+
+def get_object_cache() -> ObjectCache:
+  """Retrieve the shared cache, creating it if needed."""
+  global _OBJECT_CACHE
+  if _OBJECT_CACHE is None:
+    _OBJECT_CACHE = ObjectCache()
+  return _OBJECT_CACHE
@@ -0,0 +1,913 @@
+"""Run the SQL snippets with query parameters, caching their results locally as Parquet.
+
+The SQL snippets are templates with placeholders such as `{CDR}`, `{COHORT_QUERY}` and
+`{MEASUREMENT_CONCEPT_ID}`. Rather than formatting all of them into the query text:
+
+* `{CDR}` is the dataset of the curated data repository, which is part of table paths and so is
+  substituted into the query text, after checking that it is a dataset path.
+* Placeholders whose names end in `_QUERY`, such as `{COHORT_QUERY}`, are SQL fragments and are
+  also substituted into the query text.
+* All other placeholders become query parameters, including those within string literals, which
+  are split around the parameter.
+
+The curated data repositories do not change once released, so the results of a query are cached
+in a local Parquet file keyed by the normalized query text, its parameters, the CDR and the
+engine. Rerunning a cell with the same query is then as fast as reading the file.
+
+Results are downloaded as Arrow record batches and streamed to the Parquet file, and only then
+converted to a pandas dataframe, with dates as datetime64 and columns with few distinct values
+such as `sex_at_birth` as categoricals. Results which are too large for a dataframe can be
+written to a Parquet file with `download_query` instead.
+
+Every SQL snippet restricts to `person_id IN ({COHORT_QUERY})`, which evaluates the cohort
+query again for each query. After `materialize_cohort`, the snippets read the person_ids of the
+cohort from a temporary table, or from a sorted array query parameter, instead.
+
+The measurement SQL snippets each scan the whole measurement table. After
+`extract_measurements_of_interest`, they read a temporary table holding just the measurements of
+interest for the cohort instead. `get_query_log` shows the bytes processed by each query.
+"""
+
+import datetime
+import decimal
+import hashlib
+import itertools
+import json
+import numbers
+import os
+import re
+import shutil
+import string
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+DATASET_PARAMETER = 'CDR'
+FRAGMENT_SUFFIX = '_QUERY'
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'terra_widgets', 'query_results')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# The number of rows in each record batch downloaded from the engine.
+DEFAULT_BATCH_SIZE = 65536
+
+# Columns of the SQL snippet results with few distinct values, which are much smaller as categoricals.
+DEFAULT_CATEGORICAL_COLUMNS = ('sex_at_birth', 'src_id')
+
+# A BigQuery dataset path such as `project.dataset`, which may also be a single local schema name.
+_DATASET_RE = re.compile(r'^[A-Za-z0-9_-]+(\.[A-Za-z0-9_-]+){0,2}$')
+
+# Comments, string literals and quoted identifiers, in the BigQuery dialect. Everything between
+# them is SQL code.
+_TOKEN_RE = re.compile(r'''
+    (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>(?P<prefix>(?:(?<!\w)[rRbB]{1,2})?)
+      (?P<quote>"""|\'\'\'|"|')
+      (?P<body>(?:\\.|(?!(?P=quote)).)*?)
+      (?P=quote))
+  | (?P<identifier>`[^`]*`)
+''', re.VERBOSE | re.DOTALL)
+
+RenderedQuery = NamedTuple('RenderedQuery', [('sql', str),
+                                             ('parameters', Dict[str, Any])])
+
+CacheStats = NamedTuple('CacheStats', [('hits', int),
+                                       ('misses', int)])
+
+JobStats = NamedTuple('JobStats', [('bytes_processed', Optional[int]),
+                                   ('bytes_billed', Optional[int])])
+
+QueryLogEntry = NamedTuple('QueryLogEntry', [('description', str),
+                                             ('seconds', float),
+                                             ('num_rows', int),
+                                             ('from_cache', bool),
+                                             ('extract', Optional[str]),
+                                             ('bytes_processed', Optional[int]),
+                                             ('bytes_billed', Optional[int])])
+
+# A table holding a subset of a CDR table, such as the measurements of interest for a cohort.
+Extract = NamedTuple('Extract', [('table', str),
+                                 ('replaces', str),
+                                 ('values', Dict[str, Any]),
+                                 ('covered_values', Dict[str, frozenset])])
+
+# A cohort evaluated once, which is passed as the value of COHORT_QUERY. Its person_ids are held
+# in a temporary table, or else in a sorted array which is passed to queries as a query parameter.
+Cohort = NamedTuple('Cohort', [('query', str),
+                               ('table', Optional[str]),
+                               ('num_people', int),
+                               ('person_ids', Optional[Tuple[int, ...]])])
+
+# The measurements whose concept names match MEASUREMENT_OF_INTEREST, as in
+# measurements_of_interest_summary.sql, with the columns the measurement SQL snippets use.
+MEASUREMENTS_OF_INTEREST_EXTRACT_QUERY = """
+-- Extract the measurements of interest for our cohort.
+SELECT
+  measurement.person_id,
+  measurement.measurement_id,
+  measurement.measurement_concept_id,
+  measurement.unit_concept_id,
+  measurement.measurement_date,
+  measurement.measurement_datetime,
+  measurement.measurement_type_concept_id,
+  measurement.operator_concept_id,
+  measurement.value_as_number,
+  measurement.value_as_concept_id,
+  measurement.range_low,
+  measurement.range_high
+FROM
+  `{CDR}.measurement` AS measurement
+INNER JOIN
+  `{CDR}.concept` AS measurement_concept
+ON
+  measurement_concept.concept_id = measurement.measurement_concept_id
+WHERE
+  REGEXP_CONTAINS(measurement_concept.concept_name, r"(?i){MEASUREMENT_OF_INTEREST}")
+  AND measurement.person_id IN ({COHORT_QUERY})
+"""
+
+
+def tokenize_sql(sql: str) -> List[Tuple[str, str]]:
+  """Split the SQL into ('code', text), ('comment', text), ('string', text) and ('identifier', text) pieces."""
+  pieces = []
+  position = 0
+  for match in _TOKEN_RE.finditer(sql):
+    if match.start() > position:
+      pieces.append(('code', sql[position:match.start()]))
+    pieces.append((match.lastgroup, match.group()))
+    position = match.end()
+  if position < len(sql):
+    pieces.append(('code', sql[position:]))
+  return pieces
+
+
+def normalize_sql(sql: str) -> str:
+  """Remove comments and collapse whitespace outside of string literals and quoted identifiers."""
+  parts = []
+  code = ''
+  for kind, text in tokenize_sql(sql):
+    if kind in ('code', 'comment'):
+      code += text if kind == 'code' else ' '
+      continue
+    parts.append(re.sub(r'\s+', ' ', code))
+    parts.append(text)
+    code = ''
+  parts.append(re.sub(r'\s+', ' ', code))
+  return ''.join(parts).strip()
+
+
+def get_placeholder_names(sql_template: str) -> List[str]:
+  """List the names of the placeholders in the SQL template, in order of first appearance."""
+  names = []
+  for _, field_name, _, _ in string.Formatter().parse(sql_template):
+    if field_name is not None and field_name not in names:
+      names.append(field_name)
+  return names
+
+
+def _to_parameter_type_and_value(value: Any) -> Tuple[str, Any]:
+  """Determine the BigQuery type of a query parameter value, and its value in the REST API representation."""
+  if isinstance(value, bool):
+    return 'BOOL', 'true' if value else 'false'
+  if isinstance(value, numbers.Integral):
+    return 'INT64', str(int(value))
+  if isinstance(value, decimal.Decimal):
+    return 'NUMERIC', str(value)
+  if isinstance(value, numbers.Real):
+    return 'FLOAT64', repr(float(value))
+  if isinstance(value, str):
+    return 'STRING', value
+  if isinstance(value, datetime.datetime):
+    return ('TIMESTAMP' if value.tzinfo else 'DATETIME'), value.isoformat()
+  if isinstance(value, datetime.date):
+    return 'DATE', value.isoformat()
+  raise TypeError(f'Query parameters of type {type(value).__name__} are not supported.')
+
+
+def to_query_parameter(name: str, value: Any) -> Dict[str, Any]:
+  """Represent a named query parameter as the BigQuery REST API does.
+
+  Args:
+    name: The name of the parameter.
+    value: A scalar value, or a list or tuple of scalar values of the same type.
+  Returns:
+    The query parameter, for the queryParameters of a query job configuration.
+  Raises:
+    TypeError: if the value is not of a supported type.
+    ValueError: if the value is an empty list, whose element type cannot be determined.
+  """
+  if isinstance(value, (list, tuple)):
+    if not value:
+      raise ValueError(f'Query parameter {name} is an empty list, so its type cannot be determined.')
+    types_and_values = [_to_parameter_type_and_value(v) for v in value]
+    return {'name': name,
+            'parameterType': {'type': 'ARRAY', 'arrayType': {'type': types_and_values[0][0]}},
+            'parameterValue': {'arrayValues': [{'value': v} for _, v in types_and_values]}}
+  parameter_type, parameter_value = _to_parameter_type_and_value(value)
+  return {'name': name,
+          'parameterType': {'type': parameter_type},
+          'parameterValue': {'value': parameter_value}}
+
+
+def _render_fragment(name: str, value: Any, engine) -> Tuple[str, Dict[str, Any]]:
+  """Render the value of a SQL fragment placeholder, returning its text and any query parameters."""
+  if not isinstance(value, Cohort):
+    return str(value), {}
+  if value.person_ids is None:
+    return f'SELECT person_id FROM `{value.table}`', {}
+  return f'SELECT person_id FROM UNNEST({engine.placeholder(name)}) AS person_id', {name: list(value.person_ids)}
+
+
+def _render_string_literal(literal: str, values: Dict[str, Any], engine) -> Tuple[str, List[str]]:
+  """Render a string literal, splitting it around any query parameters within it."""
+  match = _TOKEN_RE.fullmatch(literal)
+  prefix, quote = match.group('prefix'), match.group('quote')
+  pieces = []
+  names = []
+  text = ''
+  for literal_text, field_name, format_spec, conversion in string.Formatter().parse(match.group('body')):
+    text += literal_text
+    if field_name is None:
+      continue
+    if format_spec or conversion:
+      raise ValueError(f'Format specifications are not supported for placeholder {field_name}.')
+    if field_name == DATASET_PARAMETER or field_name.endswith(FRAGMENT_SUFFIX):
+      if isinstance(values[field_name], Cohort):
+        raise ValueError(f'Placeholder {field_name} is within a string literal, so it cannot be a cohort.')
+      text += str(values[field_name])
+      continue
+    if text:
+      pieces.append(f'{prefix}{quote}{text}{quote}')
+      text = ''
+    parameter = engine.placeholder(field_name)
+    if not isinstance(values[field_name], str):
+      parameter = f'CAST({parameter} AS STRING)'
+    pieces.append(parameter)
+    names.append(field_name)
+  if not names:
+    return f'{prefix}{quote}{text}{quote}', names
+  if text:
+    pieces.append(f'{prefix}{quote}{text}{quote}')
+  if len(pieces) == 1:
+    return pieces[0], names
+  return f'CONCAT({", ".join(pieces)})', names
+
+
+def render_query(sql_template: str, values: Dict[str, Any], engine,
+                 table_overrides: Optional[Dict[str, str]] = None) -> RenderedQuery:
+  """Render the SQL template with query parameters for the engine.
+
+  Args:
+    sql_template: SQL with placeholders such as `{CDR}`, in the syntax of str.format.
+    values: The values of the placeholders. The value of COHORT_QUERY may also be a Cohort.
+    engine: The engine which will run the query, which determines how parameters are written.
+    table_overrides: The paths of tables to read instead of the tables of the SQL template, such
+      as an extract of `project.cdr.measurement`, keyed by the path of the table they replace.
+  Returns:
+    The query text and the values of its query parameters.
+  Raises:
+    ValueError: if a placeholder has no value, if the CDR is not a dataset path, if a query
+      parameter is used as an identifier, or if a cohort is within a string literal.
+  """
+  missing = [name for name in get_placeholder_names(sql_template) if name not in values]
+  if missing:
+    raise ValueError(f'No value was provided for query placeholder(s) {", ".join(missing)}.')
+  if DATASET_PARAMETER in values and not _DATASET_RE.match(str(values[DATASET_PARAMETER])):
+    raise ValueError(f'{DATASET_PARAMETER} "{values[DATASET_PARAMETER]}" is not a dataset path.')
+
+  parts = []
+  names = []
+  fragment_parameters = {}
+  for kind, text in tokenize_sql(sql_template):
+    if kind == 'comment':
+      parts.append(text)
+      continue
+    if kind == 'string':
+      rendered, literal_names = _render_string_literal(text, values, engine)
+      parts.append(rendered)
+      names.extend(literal_names)
+      continue
+    rendered = []
+    for literal_text, field_name, format_spec, conversion in string.Formatter().parse(text):
+      rendered.append(literal_text)
+      if field_name is None:
+        continue
+      if format_spec or conversion:
+        raise ValueError(f'Format specifications are not supported for placeholder {field_name}.')
+      if field_name == DATASET_PARAMETER or field_name.endswith(FRAGMENT_SUFFIX):
+        fragment, parameters = _render_fragment(field_name, values[field_name], engine)
+        rendered.append(fragment)
+        fragment_parameters.update(parameters)
+      elif kind == 'identifier':
+        raise ValueError(f'Placeholder {field_name} is part of an identifier, so it cannot be a query parameter.')
+      else:
+        rendered.append(engine.placeholder(field_name))
+        names.append(field_name)
+    rendered = ''.join(rendered)
+    if kind == 'identifier' and table_overrides and rendered.strip('`') in table_overrides:
+      rendered = f'`{table_overrides[rendered.strip("`")]}`'
+    parts.append(rendered)
+  parameters = {name: values[name] for name in names}
+  parameters.update(fragment_parameters)
+  return RenderedQuery(sql=''.join(parts), parameters=parameters)
+
+
+def get_cache_key(query: RenderedQuery, cdr: Optional[str], engine_name: str) -> str:
+  """Compute the cache key of a query from its normalized text, its parameters, the CDR and the engine."""
+  key = {'version': CACHE_VERSION,
+         'engine': engine_name,
+         'cdr': cdr,
+         'sql': normalize_sql(query.sql),
+         'parameters': {name: to_query_parameter(name, value) for name, value in query.parameters.items()}}
+  return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _to_bigquery_parameter(name: str, value: Any):
+  """Convert a query parameter to the class of the BigQuery client library."""
+  from google.cloud import bigquery  # pylint: disable=import-outside-toplevel
+
+  resource = to_query_parameter(name, value)
+  if resource['parameterType']['type'] == 'ARRAY':
+    return bigquery.ArrayQueryParameter.from_api_repr(resource)
+  return bigquery.ScalarQueryParameter.from_api_repr(resource)
+
+
+class BigQueryEngine:
+  """Run queries on BigQuery, with named query parameters.
+
+  Results are downloaded as Arrow record batches using the BigQuery Storage Read API, which
+  streams large results in parallel and in a columnar format, rather than as pages of JSON rows.
+  """
+
+  name = 'bigquery'
+
+  def __init__(self, billing_project_id: Optional[str] = None):
+    self.billing_project_id = billing_project_id or os.environ.get('GOOGLE_PROJECT')
+    self._client = None
+    self._bqstorage_client = None
+
+  @staticmethod
+  def placeholder(name: str) -> str:
+    return f'@{name}'
+
+  def _get_clients(self):
+    if self._client is None:
+      from google.cloud import bigquery  # pylint: disable=import-outside-toplevel
+      from google.cloud import bigquery_storage  # pylint: disable=import-outside-toplevel
+      self._client = bigquery.Client(project=self.billing_project_id)
+      self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+    return self._client, self._bqstorage_client
+
+  def _start_job(self, sql: str, parameters: Dict[str, Any], dry_run: bool = False):
+    from google.cloud import bigquery  # pylint: disable=import-outside-toplevel
+
+    client, _ = self._get_clients()
+    job_config = bigquery.QueryJobConfig(
+        dry_run=dry_run,
+        query_parameters=[_to_bigquery_parameter(name, value) for name, value in parameters.items()])
+    return client.query(sql, job_config=job_config)
+
+  def execute(self, sql: str, parameters: Dict[str, Any],
+              batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[Any, JobStats]:
+    """Run the query, returning a pyarrow.RecordBatchReader over its result and the statistics of the job."""
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+    _, bqstorage_client = self._get_clients()
+    job = self._start_job(sql, parameters)
+    rows = job.result(page_size=batch_size)
+    stats = JobStats(bytes_processed=job.total_bytes_processed, bytes_billed=job.total_bytes_billed)
+    batches = iter(rows.to_arrow_iterable(bqstorage_client=bqstorage_client))
+    first = next(batches, None)
+    if first is None:
+      # There are no batches from which to take the schema of an empty result.
+      return job.to_arrow().to_reader(), stats
+    return pa.RecordBatchReader.from_batches(first.schema, itertools.chain([first], batches)), stats
+
+  def materialize(self, sql: str, parameters: Dict[str, Any], name: str) -> Tuple[str, JobStats]:  # pylint: disable=unused-argument
+    """Run the query, returning the path of the temporary table holding its result and the statistics of the job.
+
+    The result is left in the anonymous table of the query job, which lasts for about a day and
+    which only the user who ran the query can read, so the name is not used.
+    """
+    job = self._start_job(sql, parameters)
+    job.result()
+    destination = job.destination
+    return (f'{destination.project}.{destination.dataset_id}.{destination.table_id}',
+            JobStats(bytes_processed=job.total_bytes_processed, bytes_billed=job.total_bytes_billed))
+
+  def estimate_bytes_processed(self, sql: str, parameters: Dict[str, Any]) -> Optional[int]:
+    """Estimate the bytes the query would process, with a dry run which is free."""
+    return self._start_job(sql, parameters, dry_run=True).total_bytes_processed
+
+
+class DuckDBEngine:
+  """Run queries on a local DuckDB database, as a stand-in for BigQuery.
+
+  A table `project.dataset.table` is looked up as table `table` of the DuckDB schema named
+  `project.dataset`, so that the CDR may be any dataset path. Use `from_parquet` to query CDR
+  tables which were exported as Parquet files. Only the differences between the dialects which
+  the SQL snippets depend upon are translated. DuckDB does not report the bytes processed by
+  queries.
+  """
+
+  name = 'duckdb'
+
+  # The schema of the tables created by materialize.
+  EXTRACT_SCHEMA = 'extracts'
+
+  def __init__(self, connection=None):
+    if connection is None:
+      import duckdb  # pylint: disable=import-outside-toplevel
+      connection = duckdb.connect()
+    self.connection = connection
+
+  @classmethod
+  def from_parquet(cls, directory: str, cdr: str) -> 'DuckDBEngine':
+    """Create an engine which queries CDR tables exported as Parquet files, in place.
+
+    Each file `<table>.parquet` in the directory, or subdirectory `<table>` of Parquet files such
+    as the shards of a BigQuery export, is read as table `<table>` of the CDR. Cached results are
+    keyed by the size and modification time of the files, so they are not reused once the files
+    are exported again.
+
+    Args:
+      directory: The directory of the exported tables.
+      cdr: The dataset path of the CDR in the SQL snippets, such as the value of WORKSPACE_CDR.
+    Returns:
+      The engine.
+    Raises:
+      ValueError: if the CDR is not a dataset path or the directory holds no Parquet files.
+    """
+    import duckdb  # pylint: disable=import-outside-toplevel
+
+    if not _DATASET_RE.match(cdr):
+      raise ValueError(f'{DATASET_PARAMETER} "{cdr}" is not a dataset path.')
+    connection = duckdb.connect()
+    connection.execute(f'CREATE SCHEMA "{cdr}"')
+    files = []
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+      if entry.is_file() and entry.name.endswith('.parquet'):
+        table, pattern = entry.name[:-len('.parquet')], entry.path
+        files.append(entry)
+      elif entry.is_dir():
+        table, pattern = entry.name, os.path.join(entry.path, '*.parquet')
+        shards = sorted((shard for shard in os.scandir(entry.path) if shard.name.endswith('.parquet')),
+                        key=lambda shard: shard.name)
+        if not shards:
+          continue
+        files.extend(shards)
+      else:
+        continue
+      pattern = pattern.replace("'", "''")
+      connection.execute(f'CREATE VIEW "{cdr}"."{table}" AS SELECT * FROM read_parquet(\'{pattern}\')')
+    if not files:
+      raise ValueError(f'There are no Parquet files in {directory}.')
+    engine = cls(connection)
+    fingerprint = [(os.path.relpath(entry.path, directory), entry.stat().st_size, entry.stat().st_mtime_ns)
+                   for entry in files]
+    engine.name = 'duckdb-parquet-' + hashlib.sha256(json.dumps(fingerprint).encode('utf-8')).hexdigest()[:16]
+    return engine
+
+  @staticmethod
+  def placeholder(name: str) -> str:
+    return f'${name}'
+
+  @staticmethod
+  def _translate_string_literal(literal: str) -> str:
+    """Translate a BigQuery string literal, which may be raw or double-quoted, to a DuckDB one."""
+    match = _TOKEN_RE.fullmatch(literal)
+    prefix, quote, body = match.group('prefix').lower(), match.group('quote'), match.group('body')
+    if quote == "'" and 'r' not in prefix and '\\' not in body:
+      return literal
+    if 'r' in prefix or '\\' not in body:
+      # DuckDB does not interpret backslashes in its string literals.
+      return "'" + body.replace("'", "''") + "'"
+    # Keep the escape sequences, escaping any bare single quotes.
+    return "E'" + re.sub(r"\\.|'", lambda m: "\\'" if m.group() == "'" else m.group(), body) + "'"
+
+  @staticmethod
+  def _translate_approx_quantiles(match) -> str:
+    """Translate APPROX_QUANTILES(x, n), which returns the minimum, n - 1 quantiles and the maximum."""
+    num_quantiles = int(match.group('num_quantiles'))
+    fractions = ', '.join(repr(i / num_quantiles) for i in range(num_quantiles + 1))
+    return f'quantile_disc({match.group("expression")}, [{fractions}])'
+
+  @classmethod
+  def translate(cls, sql: str) -> str:
+    """Translate the BigQuery SQL of the snippets to DuckDB.
+
+    This covers quoted table paths, string literals, SELECT * EXCEPT, REGEXP_CONTAINS, COUNTIF,
+    APPROX_QUANTILES of a column or simple expression, and the aliases of UNNEST. Functions such as
+    IF, IFNULL and STDDEV are the same in both dialects.
+    """
+    parts = []
+    for kind, text in tokenize_sql(sql):
+      if kind == 'identifier':
+        dataset, _, table = text.strip('`').rpartition('.')
+        text = f'"{dataset}"."{table}"' if dataset else f'"{table}"'
+      elif kind == 'string':
+        text = cls._translate_string_literal(text)
+      elif kind == 'code':
+        text = re.sub(r'\*\s*EXCEPT\s*\(', '* EXCLUDE(', text, flags=re.IGNORECASE)
+        text = re.sub(r'\bREGEXP_CONTAINS\s*\(', 'regexp_matches(', text, flags=re.IGNORECASE)
+        text = re.sub(r'\bCOUNTIF\s*\(', 'count_if(', text, flags=re.IGNORECASE)
+        text = re.sub(r'\bAPPROX_QUANTILES\s*\(\s*(?P<expression>[^(),]+(?:\([^()]*\)[^(),]*)*?)\s*,'
+                      r'\s*(?P<num_quantiles>\d+)\s*\)',
+                      cls._translate_approx_quantiles, text, flags=re.IGNORECASE)
+        # The alias of UNNEST names its column in BigQuery, but names a struct of it in DuckDB.
+        text = re.sub(r'(\bUNNEST\s*\([^()]*\)\s+AS\s+)(\w+)\b(?!\s*\()', r'\1\2(\2)', text, flags=re.IGNORECASE)
+      parts.append(text)
+    return ''.join(parts)
+
+  def execute(self, sql: str, parameters: Dict[str, Any],
+              batch_size: int = DEFAULT_BATCH_SIZE) -> Tuple[Any, JobStats]:
+    """Run the query, returning a pyarrow.RecordBatchReader over its result and empty statistics."""
+    result = self.connection.execute(self.translate(sql), parameters)
+    # Older versions of DuckDB only have the name which newer versions deprecate.
+    to_arrow_reader = getattr(result, 'to_arrow_reader', None) or result.fetch_record_batch
+    return to_arrow_reader(batch_size), JobStats(bytes_processed=None, bytes_billed=None)
+
+  def materialize(self, sql: str, parameters: Dict[str, Any], name: str) -> Tuple[str, JobStats]:
+    """Run the query into a table of the extracts schema, returning its path and empty statistics."""
+    self.connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.EXTRACT_SCHEMA}"')
+    self.connection.execute(f'CREATE OR REPLACE TABLE "{self.EXTRACT_SCHEMA}"."{name}" AS {self.translate(sql)}',
+                            parameters)
+    return f'{self.EXTRACT_SCHEMA}.{name}', JobStats(bytes_processed=None, bytes_billed=None)
+
+  @staticmethod
+  def estimate_bytes_processed(sql: str, parameters: Dict[str, Any]) -> Optional[int]:  # pylint: disable=unused-argument
+    return None
+
+
+def write_parquet(reader, path: str) -> int:
+  """Write the record batches to a Parquet file one at a time, returning the number of rows."""
+  import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+  num_rows = 0
+  temp_file = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+  try:
+    with pq.ParquetWriter(temp_file, reader.schema) as writer:
+      for batch in reader:
+        writer.write_batch(batch)
+        num_rows += batch.num_rows
+    os.replace(temp_file, path)
+  finally:
+    if os.path.exists(temp_file):
+      os.remove(temp_file)
+  return num_rows
+
+
+def to_dataframe(table, categorical_columns: Sequence[str] = DEFAULT_CATEGORICAL_COLUMNS):
+  """Convert an Arrow table to a pandas dataframe, releasing the Arrow memory as it goes.
+
+  Args:
+    table: The query result.
+    categorical_columns: The string columns to convert to pandas categoricals, where present.
+  Returns:
+    A dataframe with dates as datetime64 rather than objects, and with the categorical columns.
+  """
+  import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+  categories = [field.name for field in table.schema
+                if field.name in categorical_columns
+                and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type))]
+  return table.to_pandas(categories=categories, date_as_object=False, split_blocks=True, self_destruct=True)
+
+
+def _is_one_of(value: Any, values: frozenset) -> bool:
+  try:
+    return value in values
+  except TypeError:
+    return False  # Values such as lists are never one of the values of a column.
+
+
+def describe_query(sql_template: str) -> str:
+  """Describe the query with the first line of its leading comment, or else the start of its text."""
+  for kind, text in tokenize_sql(sql_template):
+    if kind == 'comment':
+      return text.lstrip('-#/* ').strip()
+    if kind != 'code' or text.strip():
+      break
+  return normalize_sql(sql_template)[:80]
+
+
+class QueryRunner:
+  """Encapsulate running SQL snippets on an engine, with their results cached as local Parquet files.
+
+  Each query is recorded in `query_log`, with the bytes it processed when the engine reports them.
+  """
+
+  def __init__(self, engine=None, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+               use_cache: bool = True, categorical_columns: Sequence[str] = DEFAULT_CATEGORICAL_COLUMNS):
+    self.engine = engine if engine is not None else BigQueryEngine()
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.use_cache = use_cache
+    self.categorical_columns = categorical_columns
+    self.query_log: List[QueryLogEntry] = []
+    self._extracts: List[Extract] = []
+    self._lock = threading.Lock()
+    self._hits = 0
+    self._misses = 0
+
+  @property
+  def stats(self) -> CacheStats:
+    with self._lock:
+      return CacheStats(hits=self._hits, misses=self._misses)
+
+  def _get_cache_file(self, key: str) -> str:
+    return os.path.join(self.cache_dir, f'{key}.parquet')
+
+  def _lookup_cache(self, key: str) -> Optional[str]:
+    """Return the path to the cached result, or None if it is not cached."""
+    cache_file = self._get_cache_file(key)
+    try:
+      os.utime(cache_file)  # Mark it as recently used.
+    except FileNotFoundError:
+      cache_file = None
+    with self._lock:
+      if cache_file is not None:
+        self._hits += 1
+      else:
+        self._misses += 1
+    return cache_file
+
+  def _write_cache(self, key: str, reader) -> str:
+    os.makedirs(self.cache_dir, exist_ok=True)
+    cache_file = self._get_cache_file(key)
+    write_parquet(reader, cache_file)
+    self._evict()
+    return cache_file
+
+  def _evict(self):
+    """Remove the least recently used results until the cache is within its size limit."""
+    entries = []
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.endswith('.parquet'):
+        stat = entry.stat()
+        entries.append((stat.st_mtime, entry.path, stat.st_size))
+    size_bytes = sum(size for _, _, size in entries)
+    # Keep the most recent result, even if it is over the limit by itself, so that it can be read.
+    for _, path, size in sorted(entries)[:-1]:
+      if size_bytes <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass  # Another kernel already removed it.
+      size_bytes -= size
+
+  def clear_cache(self):
+    """Remove all the cached query results."""
+    if not os.path.isdir(self.cache_dir):
+      return
+    for entry in os.scandir(self.cache_dir):
+      if entry.name.endswith('.parquet'):
+        os.remove(entry.path)
+
+  def _log(self, sql_template: str, start: float, num_rows: int, stats: Optional[JobStats],
+           extract: Optional[Extract] = None):
+    """Record a query. Pass stats of None for a result read from the cache."""
+    entry = QueryLogEntry(description=describe_query(sql_template),
+                          seconds=time.perf_counter() - start,
+                          num_rows=num_rows,
+                          from_cache=stats is None,
+                          extract=extract.table if extract is not None else None,
+                          bytes_processed=stats.bytes_processed if stats is not None else 0,
+                          bytes_billed=stats.bytes_billed if stats is not None else 0)
+    with self._lock:
+      self.query_log.append(entry)
+
+  def _find_extract(self, sql_template: str, values: Dict[str, Any]) -> Optional[Extract]:
+    """Find an extract which holds all the rows the query would read from the table it replaces."""
+    names = set(get_placeholder_names(sql_template))
+    with self._lock:
+      extracts = list(reversed(self._extracts))  # The most recent first.
+    for extract in extracts:
+      scope = [name for name in extract.values if name == DATASET_PARAMETER or name.endswith(FRAGMENT_SUFFIX)]
+      if not all(name in names and values[name] == extract.values[name] for name in scope):
+        continue
+      restrictions = {name: frozenset([value]) for name, value in extract.values.items() if name not in scope}
+      restrictions.update(extract.covered_values)
+      used = [name for name in restrictions if name in names]
+      if used and all(_is_one_of(values[name], restrictions[name]) for name in used):
+        return extract
+    return None
+
+  def _prepare(self, sql_template: str, values: Dict[str, Any]) -> Tuple[RenderedQuery, str, Optional[Extract]]:
+    """Render the query, reading from an extract if there is one for it, and compute its cache key."""
+    query = render_query(sql_template, values, self.engine)
+    # The result for a cohort is the same as that for its query, so the cache key is too.
+    key_values = {name: value.query if isinstance(value, Cohort) else value for name, value in values.items()}
+    key = get_cache_key(render_query(sql_template, key_values, self.engine), values.get(DATASET_PARAMETER),
+                        self.engine.name)
+    extract = self._find_extract(sql_template, values)
+    if extract is not None:
+      # The result is the same as that of the query on the whole table, so the cache key is too.
+      query = render_query(sql_template, values, self.engine, table_overrides={extract.replaces: extract.table})
+    return query, key, extract
+
+  def run(self, sql_template: str, use_cache: Optional[bool] = None, **values):
+    """Run the SQL template, or retrieve its result from the cache.
+
+    Args:
+      sql_template: SQL with placeholders such as `{CDR}`, in the syntax of str.format.
+      use_cache: Whether to use the cache for this query. Defaults to the setting of the runner.
+      **values: The values of the placeholders.
+    Returns:
+      A pandas dataframe holding the query result.
+    """
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    start = time.perf_counter()
+    use_cache = self.use_cache if use_cache is None else use_cache
+    query, key, extract = self._prepare(sql_template, values)
+    cache_file = self._lookup_cache(key) if use_cache else None
+    stats = None
+    if cache_file is not None:
+      table = pq.read_table(cache_file)
+    else:
+      reader, stats = self.engine.execute(query.sql, query.parameters)
+      if use_cache:
+        # Stream the result to the cache, rather than holding both the download and the dataframe in memory.
+        table = pq.read_table(self._write_cache(key, reader))
+      else:
+        table = reader.read_all()
+    self._log(sql_template, start, table.num_rows, stats, extract)
+    return to_dataframe(table, self.categorical_columns)
+
+  def download(self, sql_template: str, destination: str, use_cache: Optional[bool] = None, **values) -> int:
+    """Run the SQL template, writing its result to a local Parquet file without loading it into memory.
+
+    Use this for results too large for a dataframe, such as row-level measurements for a whole
+    cohort. Read the file back in parts with `pandas.read_parquet(destination, columns=[...])`
+    or `pyarrow.parquet.ParquetFile(destination).iter_batches()`.
+
+    Args:
+      sql_template: SQL with placeholders such as `{CDR}`, in the syntax of str.format.
+      destination: The path to the Parquet file to write.
+      use_cache: Whether to copy a cached result, if there is one. Defaults to the setting of the runner.
+      **values: The values of the placeholders.
+    Returns:
+      The number of rows written.
+    """
+    import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+    start = time.perf_counter()
+    use_cache = self.use_cache if use_cache is None else use_cache
+    query, key, extract = self._prepare(sql_template, values)
+    cache_file = self._lookup_cache(key) if use_cache else None
+    if cache_file is not None:
+      shutil.copyfile(cache_file, destination)
+      num_rows, stats = pq.ParquetFile(destination).metadata.num_rows, None
+    else:
+      reader, stats = self.engine.execute(query.sql, query.parameters)
+      num_rows = write_parquet(reader, destination)
+    self._log(sql_template, start, num_rows, stats, extract)
+    return num_rows
+
+  def estimate_bytes_processed(self, sql_template: str, **values) -> Optional[int]:
+    """Estimate the bytes the query would process, reading from an extract if there is one for it.
+
+    Returns:
+      The estimate, or None if the engine cannot estimate it.
+    """
+    query, _, _ = self._prepare(sql_template, values)
+    return self.engine.estimate_bytes_processed(query.sql, query.parameters)
+
+  def create_extract(self, sql_template: str, replaces: str, covered_columns: Optional[Dict[str, str]] = None,
+                     **values) -> Extract:
+    """Materialize a subset of a CDR table, which later queries then read instead of the whole table.
+
+    A later query reads the extract when it has the same CDR and SQL fragments, such as
+    COHORT_QUERY, as the extract, and when it is restricted by one or more of the other
+    placeholders of the extract, or of the covered columns, to values all of whose rows are in
+    the extract. For example, the extract of the measurements of interest for a cohort holds
+    all the measurements of each measurement_concept_id in it, so it can be read by a query
+    for the cohort with any of those values of MEASUREMENT_CONCEPT_ID.
+
+    Args:
+      sql_template: The query for the extract, which must return every column of the table
+        which the later queries use.
+      replaces: The name of the CDR table, such as 'measurement'.
+      covered_columns: The columns of the extract holding the values of placeholders of later
+        queries, keyed by the placeholder, such as {'MEASUREMENT_CONCEPT_ID': 'measurement_concept_id'}.
+      **values: The values of the placeholders of the extract query.
+    Returns:
+      The extract.
+    """
+    start = time.perf_counter()
+    query = render_query(sql_template, values, self.engine)
+    name = 'extract_' + get_cache_key(query, values.get(DATASET_PARAMETER), self.engine.name)[:16]
+    table, stats = self.engine.materialize(query.sql, query.parameters, name)
+    reader, _ = self.engine.execute(f'SELECT COUNT(1) AS num_rows FROM `{table}`', {})
+    num_rows = reader.read_all().column(0)[0].as_py()
+    covered_values = {}
+    for placeholder, column in (covered_columns or {}).items():
+      reader, _ = self.engine.execute(f'SELECT DISTINCT {column} FROM `{table}`', {})
+      covered_values[placeholder] = frozenset(reader.read_all().column(0).to_pylist())
+    extract = Extract(table=table,
+                      replaces=f'{values[DATASET_PARAMETER]}.{replaces}',
+                      values=dict(values),
+                      covered_values=covered_values)
+    with self._lock:
+      self._extracts.append(extract)
+    self._log(sql_template, start, num_rows, stats)
+    return extract
+
+  def create_cohort(self, cohort_query: str, as_array: bool = False) -> Cohort:
+    """Evaluate the cohort query once, for the SQL snippets to read instead of evaluating it again.
+
+    Pass the cohort as the value of COHORT_QUERY. The SQL snippets are unchanged: their
+    `person_id IN ({COHORT_QUERY})` becomes a semi-join with the temporary table of the
+    person_ids of the cohort, or with the sorted array of them. The array is passed to each query
+    as a query parameter, so only use it for cohorts of up to a few hundred thousand people.
+    On BigQuery the temporary table lasts for about a day.
+
+    Args:
+      cohort_query: SQL returning the person_ids of the cohort, such as one from Cohort Builder.
+        It is not a template, so any placeholders must already be formatted into it.
+      as_array: Whether to hold the person_ids in a local sorted array rather than in a table.
+    Returns:
+      The cohort.
+    """
+    if isinstance(cohort_query, Cohort):
+      cohort_query = cohort_query.query
+    start = time.perf_counter()
+    sql = 'SELECT DISTINCT person_id FROM (\n' + cohort_query.strip().rstrip(';') + '\n)'
+    if as_array:
+      reader, stats = self.engine.execute(sql + ' ORDER BY person_id', {})
+      table, person_ids = None, tuple(reader.read_all().column(0).to_pylist())
+      num_people = len(person_ids)
+    else:
+      name = 'cohort_' + get_cache_key(RenderedQuery(sql=sql, parameters={}), None, self.engine.name)[:16]
+      table, stats = self.engine.materialize(sql, {}, name)
+      reader, _ = self.engine.execute(f'SELECT COUNT(1) AS num_people FROM `{table}`', {})
+      person_ids, num_people = None, reader.read_all().column(0)[0].as_py()
+    self._log(cohort_query, start, num_people, stats)
+    return Cohort(query=cohort_query, table=table, num_people=num_people, person_ids=person_ids)
+
+  def clear_extracts(self):
+    """Stop reading from extracts, so that queries read the whole tables again."""
+    with self._lock:
+      self._extracts = []
+
+
+# Define this in the outer scope so that the query runner lives for the duration of the Jupyter kernel.
+_QUERY_RUNNER: Optional[QueryRunner] = None
+
+
+def get_query_runner() -> QueryRunner:
+  """Retrieve the shared query runner, creating one for BigQuery if needed."""
+  global _QUERY_RUNNER
+  if _QUERY_RUNNER is None:
+    _QUERY_RUNNER = QueryRunner()
+  return _QUERY_RUNNER
+
+
+def set_query_runner(query_runner: Optional[QueryRunner]):
+  """Use a different query runner, such as one for a local engine. Pass None to restore the default."""
+  global _QUERY_RUNNER
+  _QUERY_RUNNER = query_runner
+
+
+def run_query(sql_template: str, use_cache: Optional[bool] = None, **values):
+  """Run the SQL template on the shared query runner. See QueryRunner.run for details."""
+  return get_query_runner().run(sql_template, use_cache=use_cache, **values)
+
+
+def download_query(sql_template: str, destination: str, use_cache: Optional[bool] = None, **values) -> int:
+  """Write the result of the SQL template to a Parquet file. See QueryRunner.download for details."""
+  return get_query_runner().download(sql_template, destination, use_cache=use_cache, **values)
+
+
+def materialize_cohort(cohort_query: str, as_array: bool = False) -> Cohort:
+  """Evaluate the cohort query once, to pass as COHORT_QUERY. See QueryRunner.create_cohort for details."""
+  return get_query_runner().create_cohort(cohort_query, as_array=as_array)
+
+
+def extract_measurements_of_interest(**values) -> Extract:
+  """Materialize the measurements of interest for the cohort, for the measurement SQL snippets to read.
+
+  Args:
+    **values: The values of CDR, COHORT_QUERY and MEASUREMENT_OF_INTEREST.
+  Returns:
+    The extract. See QueryRunner.create_extract for details.
+  """
+  return get_query_runner().create_extract(
+      MEASUREMENTS_OF_INTEREST_EXTRACT_QUERY, replaces='measurement',
+      covered_columns={'MEASUREMENT_CONCEPT_ID': 'measurement_concept_id'}, **values)
+
+
+def get_query_log():
+  """Retrieve the queries run by the shared query runner as a dataframe, including the bytes each one processed."""
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  return pd.DataFrame(get_query_runner().query_log, columns=QueryLogEntry._fields)
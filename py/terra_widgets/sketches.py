@@ -0,0 +1,111 @@
+"""Sketches which summarize values added in chunks in a small, fixed amount of memory.
+
+* HyperLogLog registers estimate the number of distinct values, from 64-bit hashes of them.
+* QuantileSketch estimates the quantiles of numbers, from an evenly spaced sample of each chunk.
+"""
+
+from typing import Sequence
+
+# HyperLogLog sketches have 2**SKETCH_PRECISION one-byte registers, for a standard error of 0.8%.
+SKETCH_PRECISION = 14
+
+# Quantile sketches keep this many values of each chunk, for a rank error of at most 1/1000.
+QUANTILE_RESOLUTION = 1000
+
+
+def new_registers(num_sketches: int):
+  """Return the HyperLogLog registers of the sketches, one row per sketch, with nothing added."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  return np.zeros((num_sketches, 2**SKETCH_PRECISION), dtype=np.uint8)
+
+
+def update_registers(registers, hashes, sketch_ids=None):
+  """Add the values of the hashes to HyperLogLog registers.
+
+  Args:
+    registers: The registers of the sketches, one row per sketch, which are updated in place.
+    hashes: The uint64 hashes of the values, which should be uniformly distributed.
+    sketch_ids: The row of the registers to add each hash to. Defaults to the first row.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  register_bits = np.uint64(64 - SKETCH_PRECISION)
+  indexes = (hashes >> register_bits).astype(np.int64)
+  if sketch_ids is not None:
+    indexes += sketch_ids * registers.shape[1]
+  # The rank is one more than the number of trailing zeros of the remaining bits.
+  remaining = hashes & np.uint64((1 << (64 - SKETCH_PRECISION)) - 1)
+  lowest_bit = remaining & (~remaining + np.uint64(1))
+  ranks = np.where(remaining > 0, np.frexp(lowest_bit.astype(np.float64))[1], 64 - SKETCH_PRECISION + 1)
+  np.maximum.at(registers.reshape(-1), indexes, ranks.astype(np.uint8))
+
+
+def estimate_cardinality(registers):
+  """Estimate the number of distinct values added to each row of HyperLogLog registers."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  num_registers = registers.shape[1]
+  alpha = 0.7213 / (1 + 1.079 / num_registers)
+  # Sum over a few rows at a time, as an array of floats as large as the registers may not fit in memory.
+  powers = np.exp2(-np.arange(256, dtype=np.float64))
+  sums = np.concatenate([powers[registers[start:start + 64]].sum(axis=1) for start in range(0, len(registers), 64)]
+                        + [np.zeros(0)])
+  raw = alpha * num_registers**2 / sums
+  zeros = np.count_nonzero(registers == 0, axis=1)
+  # Use linear counting for small cardinalities, where it is more accurate.
+  with np.errstate(divide='ignore'):
+    linear = num_registers * np.log(num_registers / np.maximum(zeros, 1))
+  return np.where((raw <= 2.5 * num_registers) & (zeros > 0), linear, raw)
+
+
+class QuantileSketch:
+  """Estimate quantiles of numbers added in chunks.
+
+  Each chunk is sorted and only QUANTILE_RESOLUTION evenly spaced values of it are kept, each
+  weighted by the number of values it stands for. Every chunk's rank error is then at most its
+  size / QUANTILE_RESOLUTION, so the estimated quantiles are within a rank error of
+  1 / QUANTILE_RESOLUTION of all the numbers, whatever their order.
+  """
+
+  def __init__(self, resolution: int = QUANTILE_RESOLUTION):
+    self.resolution = resolution
+    self.count = 0
+    self._values = []
+    self._weights = []
+
+  def update(self, values):
+    """Add a chunk of numbers, without missing values. The array may be sorted in place."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    if not len(values):
+      return
+    values.sort()
+    if len(values) > self.resolution:
+      positions = ((np.arange(self.resolution) + 0.5) * (len(values) / self.resolution)).astype(np.int64)
+      kept = values[positions]
+    else:
+      kept = values.copy()
+    self._values.append(kept)
+    self._weights.append(np.full(len(kept), len(values) / len(kept)))
+    self.count += len(values)
+
+  def quantiles(self, probabilities: Sequence[float]):
+    """Return the estimated quantiles, or NaN if no numbers were added.
+
+    Args:
+      probabilities: The probabilities of the quantiles, from 0 to 1.
+    Returns:
+      An array of the quantiles, as float64.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    if not self.count:
+      return np.full(len(probabilities), np.nan)
+    values = np.concatenate(self._values)
+    weights = np.concatenate(self._weights)
+    order = np.argsort(values, kind='stable')
+    values = values[order].astype(np.float64)
+    # The rank of each kept value is the midpoint of the numbers it stands for.
+    ranks = np.cumsum(weights[order]) - weights[order] / 2
+    return np.interp(np.asarray(probabilities) * self.count, ranks, values)
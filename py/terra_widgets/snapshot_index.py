@@ -0,0 +1,143 @@
+"""An in-memory index of the HTML snapshots within a workspace bucket.
+
+The index is built from the snapshot manifest, which in turn is kept up to date by listing
+the HTML snapshots folder, so that choosing a user, date or time within the widgets does not
+require any further listing of the workspace bucket.
+"""
+
+import collections
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from terra_widgets.snapshot_manifest import SnapshotEntry
+from terra_widgets.snapshot_manifest import SnapshotManifest
+from terra_widgets.workspace_paths import WorkspacePaths
+
+# Snapshots are added rarely and only by people using the widget, so a few minutes of staleness is fine.
+DEFAULT_TTL_SECONDS = 300
+
+
+class SnapshotIndex:
+  """Encapsulate the user -> date -> time -> file tree of the HTML snapshots in one workspace bucket.
+
+  Like the dropdowns in the widget, the methods take and return full paths so that each
+  level of the tree is identified by the path to its folder.
+  """
+
+  def __init__(self,
+               manifest: SnapshotManifest,
+               ttl_seconds: float = DEFAULT_TTL_SECONDS,
+               clock: Callable[[], float] = time.monotonic):
+    self.manifest = manifest
+    self.workspace_paths = manifest.workspace_paths
+    self.ttl_seconds = ttl_seconds
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._tree: Dict[str, Dict[str, Dict[str, Dict[str, SnapshotEntry]]]] = {}
+    self._refreshed_at: Optional[float] = None
+
+  def refresh(self, full: bool = False):
+    """Rebuild the index after bringing the manifest up to date.
+
+    Args:
+      full: Whether to rebuild the manifest from a listing of the entire HTML snapshots folder,
+            instead of only listing what is new since the manifest was last refreshed.
+    """
+    self.manifest.refresh(full=full)
+    tree = collections.defaultdict(lambda: collections.defaultdict(lambda: collections.defaultdict(dict)))
+    for entry in self.manifest.entries:
+      tree[entry.user][entry.date][entry.time][entry.notebook] = entry
+    with self._lock:
+      self._tree = tree
+      self._refreshed_at = self._clock()
+
+  def invalidate(self):
+    """Mark the index as stale so that it is rebuilt the next time it is used."""
+    with self._lock:
+      self._refreshed_at = None
+
+  def is_stale(self) -> bool:
+    with self._lock:
+      return self._refreshed_at is None or self._clock() - self._refreshed_at > self.ttl_seconds
+
+  def _get_tree(self):
+    if self.is_stale():
+      self.refresh()
+    return self._tree
+
+  def _join(self, *parts: str) -> str:
+    return '/'.join((self.workspace_paths.get_subfolder(),) + parts)
+
+  def _parse_folder(self, path: str, depth: int) -> List[str]:
+    prefix = self.workspace_paths.get_subfolder() + '/'
+    parts = path[len(prefix):].rstrip('/').split('/')
+    if not path.startswith(prefix) or len(parts) != depth:
+      raise ValueError(f'"{path}" is not a folder {depth} level(s) below "{self.workspace_paths.get_subfolder()}"')
+    return parts
+
+  def get_users(self) -> Dict[str, str]:
+    """Retrieve a mapping of user to the path of their folder of snapshots."""
+    return {user: self._join(user) for user in sorted(self._get_tree())}
+
+  def get_dates(self, user_path: str) -> Dict[str, str]:
+    """Retrieve a mapping of date to folder path for one user, most recent first."""
+    user, = self._parse_folder(user_path, depth=1)
+    dates = self._get_tree().get(user, {})
+    return collections.OrderedDict((date, self._join(user, date)) for date in sorted(dates, reverse=True))
+
+  def get_times(self, date_path: str) -> Dict[str, str]:
+    """Retrieve a mapping of time to folder path for one user and date, most recent first."""
+    user, date = self._parse_folder(date_path, depth=2)
+    times = self._get_tree().get(user, {}).get(date, {})
+    return collections.OrderedDict((t, self._join(user, date, t)) for t in sorted(times, reverse=True))
+
+  def get_files(self, time_path: str, suffix: str = WorkspacePaths.HTML_FILE_SUFFIX) -> Dict[str, str]:
+    """Retrieve a mapping of file name to path for the files in one snapshot folder with the given suffix."""
+    user, date, t = self._parse_folder(time_path, depth=3)
+    entries = self._get_tree().get(user, {}).get(date, {}).get(t, {})
+    if suffix == WorkspacePaths.COMMENT_FILE_SUFFIX:
+      notebooks = [nb for nb, entry in entries.items() if entry.comment_generation is not None]
+    elif suffix == WorkspacePaths.HTML_FILE_SUFFIX:
+      notebooks = [nb for nb, entry in entries.items() if entry.html_generation is not None]
+    else:
+      raise ValueError(f'"{suffix}" is neither "{WorkspacePaths.HTML_FILE_SUFFIX}" nor "{WorkspacePaths.COMMENT_FILE_SUFFIX}"')
+    return {nb + suffix: self._join(user, date, t, nb + suffix) for nb in sorted(notebooks)}
+
+  def get_all_files(self, suffix: str = WorkspacePaths.COMMENT_FILE_SUFFIX) -> List[str]:
+    """Retrieve the paths to all files in the index with the given suffix, such as all the comment files."""
+    paths = []
+    for user, dates in self._get_tree().items():
+      for date, times in dates.items():
+        for t in times:
+          paths.extend(self.get_files(self._join(user, date, t), suffix=suffix).values())
+    return paths
+
+  def get_generation(self, path: str) -> Optional[int]:
+    """Retrieve the generation of an HTML snapshot or comment file, or None if it is not in the index."""
+    parts = self.workspace_paths.parse_snapshot_path(path)
+    if not parts:
+      return None
+    if parts.file.endswith(WorkspacePaths.COMMENT_FILE_SUFFIX):
+      notebook, field = parts.file[:-len(WorkspacePaths.COMMENT_FILE_SUFFIX)], 'comment_generation'
+    elif parts.file.endswith(WorkspacePaths.HTML_FILE_SUFFIX):
+      notebook, field = parts.file[:-len(WorkspacePaths.HTML_FILE_SUFFIX)], 'html_generation'
+    else:
+      return None
+    entry = self._get_tree().get(parts.user, {}).get(parts.date, {}).get(parts.time, {}).get(notebook)
+    return getattr(entry, field) if entry else None
+
+
+# Define this in the outer scope so that the indexes live for the duration of the Jupyter kernel.
+_SNAPSHOT_INDEXES: Dict[str, SnapshotIndex] = {}
+
+
+def get_snapshot_index(workspace_paths: WorkspacePaths) -> SnapshotIndex:
+  """Retrieve the shared index for the workspace bucket, creating it if needed."""
+  if workspace_paths.workspace_bucket not in _SNAPSHOT_INDEXES:
+    _SNAPSHOT_INDEXES[workspace_paths.workspace_bucket] = SnapshotIndex(
+        manifest=SnapshotManifest(workspace_paths=workspace_paths))
+  return _SNAPSHOT_INDEXES[workspace_paths.workspace_bucket]
@@ -0,0 +1,206 @@
+"""A compact, persistent manifest of the HTML snapshots within a workspace bucket.
+
+The manifest is cached on local disk, and optionally as a single object in the workspace
+bucket, so that a new Jupyter kernel does not need to list the entire HTML snapshots folder.
+
+Within each user's folder, the <date>/<time> layout enforced by WorkspacePaths sorts
+lexicographically in chronological order. So to refresh the manifest, only the objects at or
+after each user's most recent snapshot folder are listed, using the listing start offset.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from terra_widgets.storage import get_storage_backend
+from terra_widgets.storage import ObjectInfo
+from terra_widgets.storage import StorageBackend
+from terra_widgets.workspace_paths import WorkspacePaths
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = '.snapshot_manifest.json'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'terra_widgets', 'manifests')
+
+SnapshotEntry = NamedTuple('SnapshotEntry', [('user', str),
+                                             ('date', str),
+                                             ('time', str),
+                                             ('notebook', str),
+                                             ('html_size', Optional[int]),
+                                             ('html_generation', Optional[int]),
+                                             ('comment_size', Optional[int]),
+                                             ('comment_generation', Optional[int])])
+
+EntryKey = Tuple[str, str, str, str]
+
+
+class SnapshotManifest:
+  """Encapsulate the list of HTML snapshots in one workspace bucket and keep it up to date.
+
+  There is one entry per snapshot of a notebook, holding the sizes and generations of both the
+  HTML file and its comment file.
+  """
+
+  def __init__(self,
+               workspace_paths: WorkspacePaths,
+               backend: Optional[StorageBackend] = None,
+               cache_dir: str = DEFAULT_CACHE_DIR,
+               store_in_bucket: bool = False):
+    """Initialize the manifest.
+
+    Args:
+      workspace_paths: The workspace bucket holding the HTML snapshots.
+      backend: The storage backend to use. Defaults to the shared backend.
+      cache_dir: The local folder in which to cache the manifest.
+      store_in_bucket: Whether to also read and write the manifest as an object in the HTML snapshots
+                       folder, so that it is shared by everyone using the workspace.
+    """
+    self.workspace_paths = workspace_paths
+    self._backend = backend
+    self.store_in_bucket = store_in_bucket
+    bucket_name = workspace_paths.workspace_bucket.replace('gs://', '')
+    self.local_file = os.path.join(cache_dir, f'{bucket_name}.json')
+    self.bucket_object = os.path.join(workspace_paths.get_subfolder(), MANIFEST_FILE_NAME)
+    self.refreshed_at: Optional[float] = None
+    self._entries: Dict[EntryKey, SnapshotEntry] = {}
+    self._lock = threading.Lock()
+    self._loaded = False
+
+  @property
+  def backend(self) -> StorageBackend:
+    return self._backend or get_storage_backend()
+
+  @property
+  def entries(self) -> List[SnapshotEntry]:
+    """The snapshots, in user, date, time and notebook order."""
+    with self._lock:
+      return [self._entries[key] for key in sorted(self._entries)]
+
+  def _to_json(self) -> str:
+    with self._lock:
+      return json.dumps({'version': MANIFEST_VERSION,
+                         'workspace_bucket': self.workspace_paths.workspace_bucket,
+                         'refreshed_at': self.refreshed_at,
+                         'entries': [list(self._entries[key]) for key in sorted(self._entries)]},
+                        separators=(',', ':'))
+
+  def _from_json(self, contents: str) -> bool:
+    manifest = json.loads(contents)
+    if (manifest.get('version') != MANIFEST_VERSION
+        or manifest.get('workspace_bucket') != self.workspace_paths.workspace_bucket):
+      return False
+    entries = (SnapshotEntry(*e) for e in manifest['entries'])
+    with self._lock:
+      self._entries = {(e.user, e.date, e.time, e.notebook): e for e in entries}
+      self.refreshed_at = manifest['refreshed_at']
+    return True
+
+  def load(self) -> bool:
+    """Load the manifest from the local cache, or else from the workspace bucket if configured to do so.
+
+    Returns:
+      Whether a manifest was found.
+    """
+    self._loaded = True
+    try:
+      with open(self.local_file, 'r') as f:
+        if self._from_json(f.read()):
+          return True
+    except (OSError, ValueError, TypeError):
+      pass  # A missing or corrupt cache is the same as no cache.
+    if self.store_in_bucket:
+      try:
+        return self._from_json(self.backend.read_bytes(self.bucket_object).decode('utf-8'))
+      except (OSError, ValueError, TypeError):
+        pass
+    return False
+
+  def save(self):
+    """Write the manifest to the local cache, and also to the workspace bucket if configured to do so."""
+    contents = self._to_json()
+    os.makedirs(os.path.dirname(self.local_file), exist_ok=True)
+    temp_file = f'{self.local_file}.{os.getpid()}.tmp'
+    with open(temp_file, 'w') as f:
+      f.write(contents)
+    os.replace(temp_file, self.local_file)
+    if self.store_in_bucket:
+      try:
+        self.backend.upload_data(contents.encode('utf-8'), self.bucket_object,
+                                 content_type='application/json', overwrite=True)
+      except Exception:  # pylint: disable=broad-except
+        pass  # For example, the user only has read access to the workspace. The local cache still works.
+
+  def _merge(self, infos: List[ObjectInfo]) -> int:
+    """Merge listed objects into the manifest, returning the number of entries added or changed."""
+    updates: Dict[EntryKey, Dict[str, int]] = {}
+    for info in infos:
+      parts = self.workspace_paths.parse_snapshot_path(info.path)
+      if not parts:
+        continue
+      if parts.file.endswith(WorkspacePaths.COMMENT_FILE_SUFFIX):
+        notebook, kind = parts.file[:-len(WorkspacePaths.COMMENT_FILE_SUFFIX)], 'comment'
+      elif parts.file.endswith(WorkspacePaths.HTML_FILE_SUFFIX):
+        notebook, kind = parts.file[:-len(WorkspacePaths.HTML_FILE_SUFFIX)], 'html'
+      else:
+        continue
+      fields = updates.setdefault((parts.user, parts.date, parts.time, notebook), {})
+      fields[f'{kind}_size'] = info.size
+      fields[f'{kind}_generation'] = info.generation
+
+    changed = 0
+    with self._lock:
+      for key, fields in updates.items():
+        previous = self._entries.get(key) or SnapshotEntry(*key, None, None, None, None)
+        entry = previous._replace(**fields)
+        if entry != previous or key not in self._entries:
+          self._entries[key] = entry
+          changed += 1
+    return changed
+
+  def _latest_folders(self) -> Dict[str, Tuple[str, str]]:
+    """Retrieve the most recent date and time folder for each user."""
+    latest = {}
+    with self._lock:
+      for user, date, t, _ in self._entries:
+        if user not in latest or (date, t) > latest[user]:
+          latest[user] = (date, t)
+    return latest
+
+  def refresh(self, full: bool = False) -> int:
+    """Bring the manifest up to date with the contents of the HTML snapshots folder.
+
+    An incremental refresh lists only the objects in, or after, each user's most recent snapshot
+    folder. It will not notice snapshots which have since been deleted; use a full refresh for that.
+
+    Args:
+      full: Whether to discard the manifest and list the entire HTML snapshots folder.
+    Returns:
+      The number of entries added or changed.
+    """
+    if not self._loaded and not full:
+      # Without a previous manifest, a single listing of the whole folder is cheaper than one per user.
+      full = not self.load()
+    started_at = time.time()
+    subfolder = self.workspace_paths.get_subfolder() + '/'
+    if full:
+      self._loaded = True
+      with self._lock:
+        self._entries = {}
+      changed = self._merge(list(self.backend.list_objects(subfolder)))
+    else:
+      latest = self._latest_folders()
+      changed = 0
+      for user_prefix in self.backend.list_prefixes(subfolder):
+        user = user_prefix[len(subfolder):-1]
+        # Start from the most recent folder, rather than after it, in case it was still being written.
+        start_offset = f'{user_prefix}{latest[user][0]}/{latest[user][1]}/' if user in latest else None
+        changed += self._merge(list(self.backend.list_objects(user_prefix, start_offset=start_offset)))
+    self.refreshed_at = started_at
+    if changed or full or not os.path.exists(self.local_file):
+      self.save()
+    return changed
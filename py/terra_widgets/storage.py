@@ -0,0 +1,375 @@
+"""Methods to transfer objects to and from Cloud Storage, or a local stand-in for it.
+
+All backends address objects by their `gs://<bucket>/<object name>` path so that callers
+do not need to know which backend is in use. Like fsspec, the backends provide glob, listing,
+read and transfer operations. The Cloud Storage backend uses the Cloud Storage client library
+directly, which is much lighter to import than TensorFlow and, unlike fsspec, supports
+generation preconditions and listing from a start offset. The local-filesystem and in-memory
+backends allow the widgets to be used and tested without access to Cloud Storage.
+"""
+
+import abc
+import concurrent.futures
+import fnmatch
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+GCS_SCHEME = 'gs://'
+DEFAULT_MAX_WORKERS = 16
+
+ObjectInfo = NamedTuple('ObjectInfo', [('path', str), ('size', int), ('generation', int), ('updated', float)])
+ObjectUpload = NamedTuple('ObjectUpload', [('source_file', str), ('destination', str), ('content_type', str)])
+UploadResult = NamedTuple('UploadResult', [('destination', str),
+                                           ('status', str),
+                                           ('generation', Optional[int]),
+                                           ('error', Optional[str])])
+
+UPLOADED = 'uploaded'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+class ObjectExistsError(Exception):
+  """Raised when an object already exists and the caller asked not to overwrite it."""
+
+
+def split_gcs_path(path: str) -> Tuple[str, str]:
+  """Split a path of the form gs://<bucket>/<object name> into its bucket and object name."""
+  if not path.startswith(GCS_SCHEME):
+    raise ValueError(f'"{path}" is not a Cloud Storage path of the form {GCS_SCHEME}<bucket>/<object name>')
+  bucket, _, name = path[len(GCS_SCHEME):].partition('/')
+  return bucket, name
+
+
+class StorageBackend(abc.ABC):
+  """The interface shared by all storage backends."""
+
+  @abc.abstractmethod
+  def upload_file(self, source_file: str, destination: str, content_type: str, overwrite: bool = False) -> int:
+    """Transfer a local file to the destination path.
+
+    Args:
+      source_file: The local path of the file to transfer.
+      destination: The gs:// path of the object to create.
+      content_type: The Content-Type metadata of the object, set as part of the upload.
+      overwrite: Whether to replace the object if it already exists.
+    Returns:
+      The generation of the newly written object.
+    Raises:
+      ObjectExistsError: if the object exists and overwrite is False.
+    """
+
+  @abc.abstractmethod
+  def list_objects(self, prefix: str, start_offset: Optional[str] = None) -> Iterator[ObjectInfo]:
+    """List all objects whose path starts with the prefix, in lexicographic order.
+
+    Args:
+      prefix: A gs:// path prefix. It is not a glob; all objects below it are listed, recursively.
+      start_offset: If provided, only list objects whose path is lexicographically equal to or after this path.
+    Yields:
+      An ObjectInfo for each object.
+    Raises:
+      PermissionError: if the user does not have permission to list the objects.
+    """
+
+  def list_prefixes(self, prefix: str) -> List[str]:
+    """List the immediate 'subfolders' of the prefix, each ending in '/'.
+
+    Args:
+      prefix: A gs:// path prefix ending in '/'.
+    Returns:
+      The sorted list of distinct paths of the form <prefix><subfolder>/.
+    """
+    prefixes = set()
+    for info in self.list_objects(prefix):
+      subfolder, sep, _ = info.path[len(prefix):].partition('/')
+      if sep:
+        prefixes.add(f'{prefix}{subfolder}/')
+    return sorted(prefixes)
+
+  def glob(self, pattern: str) -> List[str]:
+    """List the paths of the objects matching the pattern.
+
+    As with a filesystem glob, wildcards do not match across '/'.
+
+    Args:
+      pattern: A gs:// path which may contain wildcards, such as gs://<bucket>/notebooks/*.ipynb
+    Returns:
+      The sorted list of matching paths.
+    """
+    wildcard = min((i for i, c in enumerate(pattern) if c in '*?['), default=len(pattern))
+    pattern_parts = pattern.split('/')
+    matches = []
+    for info in self.list_objects(pattern[:wildcard]):
+      path_parts = info.path.split('/')
+      if (len(path_parts) == len(pattern_parts)
+          and all(fnmatch.fnmatchcase(p, g) for p, g in zip(path_parts, pattern_parts))):
+        matches.append(info.path)
+    return sorted(matches)
+
+  def download_file(self, path: str, local_file: str):
+    """Transfer an object to a local file.
+
+    Raises:
+      FileNotFoundError: if the object does not exist.
+      PermissionError: if the user does not have permission to read the object.
+    """
+    data = self.read_bytes(path)
+    with open(local_file, 'wb') as f:
+      f.write(data)
+
+  @abc.abstractmethod
+  def read_bytes(self, path: str, timeout: Optional[float] = None) -> bytes:
+    """Retrieve the contents of an object.
+
+    Args:
+      path: The gs:// path of the object.
+      timeout: The number of seconds to wait for the server, if the backend has one.
+    Returns:
+      The contents of the object.
+    Raises:
+      FileNotFoundError: if the object does not exist.
+      PermissionError: if the user does not have permission to read the object.
+    """
+
+  def upload_data(self, data: bytes, destination: str, content_type: str, overwrite: bool = False) -> int:
+    """Transfer in-memory data to the destination path. See upload_file for details."""
+    with tempfile.NamedTemporaryFile() as f:
+      f.write(data)
+      f.flush()
+      return self.upload_file(f.name, destination, content_type, overwrite)
+
+  def upload_files(self,
+                   uploads: Iterable[ObjectUpload],
+                   overwrite: bool = False,
+                   max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[UploadResult]:
+    """Transfer local files concurrently, yielding each result as soon as it is ready.
+
+    Uploads are started as soon as they are read from the iterable, so a generator that produces
+    uploads incrementally will have its earlier uploads in flight while later ones are produced.
+
+    Args:
+      uploads: The files to transfer.
+      overwrite: Whether to replace objects which already exist.
+      max_workers: The maximum number of concurrent uploads.
+    Yields:
+      An UploadResult for each upload, in completion order.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = {executor.submit(self.upload_file, upload.source_file, upload.destination,
+                                 upload.content_type, overwrite): upload.destination
+                 for upload in uploads}
+      for future in concurrent.futures.as_completed(futures):
+        destination = futures[future]
+        try:
+          yield UploadResult(destination=destination, status=UPLOADED, generation=future.result(), error=None)
+        except ObjectExistsError:
+          yield UploadResult(destination=destination, status=SKIPPED, generation=None, error=None)
+        except Exception as e:  # pylint: disable=broad-except
+          yield UploadResult(destination=destination, status=FAILED, generation=None, error=f'{type(e).__name__}: {e}')
+
+
+class GcsBackend(StorageBackend):
+  """Store objects in Cloud Storage using a single client with a pool of keep-alive connections."""
+
+  def __init__(self, max_connections: int = DEFAULT_MAX_WORKERS, client=None):
+    self._max_connections = max_connections
+    self._client = client
+    self._lock = threading.Lock()
+
+  @property
+  def client(self):
+    """The Cloud Storage client, created on first use."""
+    with self._lock:
+      if self._client is None:
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        import requests
+
+        credentials, project = google.auth.default()
+        session = AuthorizedSession(credentials)
+        # The default pool holds 10 connections, fewer than the number of concurrent uploads.
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=self._max_connections,
+                                                                pool_maxsize=self._max_connections))
+        self._client = storage.Client(project=project or os.getenv('GOOGLE_PROJECT'),
+                                      credentials=credentials,
+                                      _http=session)
+      return self._client
+
+  def list_objects(self, prefix: str, start_offset: Optional[str] = None) -> Iterator[ObjectInfo]:
+    from google.api_core.exceptions import Forbidden
+
+    bucket, name = split_gcs_path(prefix)
+    offset = split_gcs_path(start_offset)[1] if start_offset else None
+    try:
+      blobs = list(self.client.list_blobs(bucket, prefix=name, start_offset=offset))
+    except Forbidden as e:
+      raise PermissionError(f'{prefix}: {e.message}') from e
+    for blob in blobs:
+      yield ObjectInfo(path=f'{GCS_SCHEME}{bucket}/{blob.name}',
+                       size=blob.size,
+                       generation=blob.generation,
+                       updated=blob.updated.timestamp())
+
+  def list_prefixes(self, prefix: str) -> List[str]:
+    from google.api_core.exceptions import Forbidden
+
+    bucket, name = split_gcs_path(prefix)
+    blobs = self.client.list_blobs(bucket, prefix=name, delimiter='/')
+    try:
+      for _ in blobs.pages:
+        pass  # The prefixes are accumulated as each page is retrieved.
+    except Forbidden as e:
+      raise PermissionError(f'{prefix}: {e.message}') from e
+    return sorted(f'{GCS_SCHEME}{bucket}/{p}' for p in blobs.prefixes)
+
+  def read_bytes(self, path: str, timeout: Optional[float] = None) -> bytes:
+    from google.api_core.exceptions import Forbidden
+    from google.api_core.exceptions import NotFound
+
+    bucket, name = split_gcs_path(path)
+    try:
+      return self.client.bucket(bucket).blob(name).download_as_bytes(**({'timeout': timeout} if timeout else {}))
+    except NotFound as e:
+      raise FileNotFoundError(path) from e
+    except Forbidden as e:
+      raise PermissionError(f'{path}: {e.message}') from e
+
+  def download_file(self, path: str, local_file: str):
+    from google.api_core.exceptions import Forbidden
+    from google.api_core.exceptions import NotFound
+
+    bucket, name = split_gcs_path(path)
+    try:
+      self.client.bucket(bucket).blob(name).download_to_filename(local_file)
+    except NotFound as e:
+      raise FileNotFoundError(path) from e
+    except Forbidden as e:
+      raise PermissionError(f'{path}: {e.message}') from e
+
+  def upload_file(self, source_file: str, destination: str, content_type: str, overwrite: bool = False) -> int:
+    from google.api_core.exceptions import PreconditionFailed
+
+    bucket, name = split_gcs_path(destination)
+    blob = self.client.bucket(bucket).blob(name)
+    try:
+      # A generation precondition of zero means "only if the object does not yet exist".
+      blob.upload_from_filename(source_file,
+                                content_type=content_type,
+                                if_generation_match=None if overwrite else 0)
+    except PreconditionFailed as e:
+      raise ObjectExistsError(destination) from e
+    return blob.generation
+
+
+class LocalBackend(StorageBackend):
+  """Store objects as files, where gs://<bucket>/<object name> is stored as <root>/<bucket>/<object name>.
+
+  The local filesystem has nowhere to keep the Content-Type, so it is not retained.
+  """
+
+  def __init__(self, root: str):
+    self.root = root
+
+  def local_path(self, path: str) -> str:
+    bucket, name = split_gcs_path(path)
+    return os.path.join(self.root, bucket, name)
+
+  def list_objects(self, prefix: str, start_offset: Optional[str] = None) -> Iterator[ObjectInfo]:
+    bucket, _ = split_gcs_path(prefix)
+    bucket_root = os.path.join(self.root, bucket)
+    paths = []
+    for dirpath, _, filenames in os.walk(bucket_root):
+      for filename in filenames:
+        name = os.path.relpath(os.path.join(dirpath, filename), bucket_root).replace(os.sep, '/')
+        path = f'{GCS_SCHEME}{bucket}/{name}'
+        if path.startswith(prefix) and (not start_offset or path >= start_offset):
+          paths.append(path)
+    for path in sorted(paths):
+      stat = os.stat(self.local_path(path))
+      yield ObjectInfo(path=path, size=stat.st_size, generation=stat.st_mtime_ns, updated=stat.st_mtime)
+
+  def read_bytes(self, path: str, timeout: Optional[float] = None) -> bytes:
+    with open(self.local_path(path), 'rb') as f:
+      return f.read()
+
+  def upload_file(self, source_file: str, destination: str, content_type: str, overwrite: bool = False) -> int:
+    local_destination = self.local_path(destination)
+    os.makedirs(os.path.dirname(local_destination), exist_ok=True)
+    try:
+      # Exclusive creation is the local equivalent of a generation precondition of zero.
+      with open(source_file, 'rb') as src, open(local_destination, 'wb' if overwrite else 'xb') as dst:
+        shutil.copyfileobj(src, dst)
+    except FileExistsError as e:
+      raise ObjectExistsError(destination) from e
+    return os.stat(local_destination).st_mtime_ns
+
+
+class InMemoryBackend(StorageBackend):
+  """Store objects in a dictionary, similar to a fake Cloud Storage server."""
+
+  def __init__(self):
+    self.objects: Dict[str, bytes] = {}
+    self.content_types: Dict[str, str] = {}
+    self.generations: Dict[str, int] = {}
+    self.updated: Dict[str, float] = {}
+    self._next_generation = 1
+    self._lock = threading.Lock()
+
+  def list_objects(self, prefix: str, start_offset: Optional[str] = None) -> Iterator[ObjectInfo]:
+    split_gcs_path(prefix)  # Validate the path.
+    with self._lock:
+      infos = [ObjectInfo(path=path, size=len(data), generation=self.generations[path], updated=self.updated[path])
+               for path, data in self.objects.items()
+               if path.startswith(prefix) and (not start_offset or path >= start_offset)]
+    yield from sorted(infos)
+
+  def read_bytes(self, path: str, timeout: Optional[float] = None) -> bytes:
+    with self._lock:
+      if path not in self.objects:
+        raise FileNotFoundError(path)
+      return self.objects[path]
+
+  def upload_file(self, source_file: str, destination: str, content_type: str, overwrite: bool = False) -> int:
+    split_gcs_path(destination)  # Validate the path.
+    with open(source_file, 'rb') as f:
+      data = f.read()
+    with self._lock:
+      if not overwrite and destination in self.objects:
+        raise ObjectExistsError(destination)
+      generation = self._next_generation
+      self._next_generation += 1
+      self.objects[destination] = data
+      self.content_types[destination] = content_type
+      self.generations[destination] = generation
+      self.updated[destination] = time.time()
+    return generation
+
+
+# Define this in the outer scope so that the client and its connections live for the duration of the Jupyter kernel.
+_STORAGE_BACKEND: Optional[StorageBackend] = None
+
+
+def get_storage_backend() -> StorageBackend:
+  """Retrieve the storage backend in use, defaulting to Cloud Storage."""
+  global _STORAGE_BACKEND
+  if _STORAGE_BACKEND is None:
+    _STORAGE_BACKEND = GcsBackend()
+  return _STORAGE_BACKEND
+
+
+def set_storage_backend(backend: StorageBackend):
+  """Use a different storage backend, such as a LocalBackend when working offline."""
+  global _STORAGE_BACKEND
+  _STORAGE_BACKEND = backend
@@ -0,0 +1,396 @@
+"""Summarize participant counts of a survey dataframe from Dataset Builder.
+
+A survey dataframe has one row per answer, with columns `person_id`, `survey`,
+`question_concept_id`, `question`, `answer_concept_id` and `answer`. Rather than filtering the
+whole dataframe for each module or question, `SurveySummarizer` encodes these columns as integer
+codes once and counts the distinct participants of every question and of every answer in a single
+pass. Each summary of a module or question is then a lookup in those small tables.
+
+Survey data which is too large for memory can be summarized from Parquet or CSV files instead,
+such as in the workspace bucket. The files are read in batches of rows, and the participants of
+each question and answer are counted either exactly, by merging the distinct (group, person_id)
+pairs of each batch, or approximately, with a HyperLogLog sketch of fixed size per group. Memory
+use then depends on the number of distinct pairs, or only on the number of questions and answers.
+"""
+
+import re
+import weakref
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from terra_widgets.sketches import estimate_cardinality
+from terra_widgets.sketches import new_registers
+from terra_widgets.sketches import update_registers
+
+QUESTION_COLUMNS = ('survey', 'question_concept_id', 'question')
+ANSWER_COLUMNS = ('question_concept_id', 'answer_concept_id', 'answer')
+
+# The number of rows of the files to read at a time.
+DEFAULT_BATCH_SIZE = 1000000
+
+# Exact counts pack each (group, person_id) pair into one int64, with the person_id in the low bits.
+PERSON_ID_BITS = 40
+
+
+def _sorted_unique(values):
+  """Sort the values and remove duplicates, in place where possible.
+
+  Sorting is faster than the hashing of numpy.unique for large arrays of distinct values, and a
+  stable sort merges arrays which are concatenations of sorted runs in linear time.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  values.sort(kind='stable')
+  return values[np.concatenate([[True], values[1:] != values[:-1]])]
+
+
+def _encode_groups(encoded, columns: Sequence[str], valid):
+  """Encode each row as the code of its combination of values of the columns.
+
+  Args:
+    encoded: The codes and unique values of each column, as returned by pandas.factorize.
+    columns: The columns to group by.
+    valid: Which rows to encode. Rows with missing values are also removed from it.
+  Returns:
+    The codes of the valid rows, and a dataframe of the values of the columns for each code.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  # Combine the codes of the columns into one key per row, in mixed radix.
+  keys = np.zeros(len(valid), dtype=np.int64)
+  for column in columns:
+    codes, uniques = encoded[column]
+    valid &= codes >= 0
+    keys = keys * max(len(uniques), 1) + codes
+  group_codes, group_keys = pd.factorize(keys[valid])
+  del keys
+
+  values = {}
+  remainder = np.asarray(group_keys, dtype=np.int64)
+  for column in reversed(columns):
+    _, uniques = encoded[column]
+    remainder, codes = np.divmod(remainder, max(len(uniques), 1))
+    values[column] = np.asarray(uniques)[codes]
+  return group_codes, pd.DataFrame({column: values[column] for column in columns})
+
+
+def count_participants(encoded, person_codes, num_people: int, columns: Sequence[str]):
+  """Count the distinct participants of each combination of values of the columns.
+
+  Args:
+    encoded: The codes and unique values of each column, as returned by pandas.factorize.
+    person_codes: The codes of the person_id of each row, as returned by pandas.factorize.
+    num_people: The number of distinct person_ids.
+    columns: The columns to group by.
+  Returns:
+    A dataframe of each combination of values of the columns, sorted by them, with its count of
+    participants in column `n_participant`. As with groupby, rows with missing values are skipped.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  valid = person_codes >= 0
+  group_codes, data = _encode_groups(encoded, columns, valid)
+  # Each distinct (group, person) pair is one participant of the group. Sorting the pairs to find
+  # them is faster than hashing them, since there are as many as there are rows. Work in place,
+  # as the arrays are as long as the dataframe.
+  pairs = group_codes.astype(np.int64, copy=False)
+  pairs *= num_people
+  pairs += person_codes[valid]
+  pairs = _sorted_unique(pairs)
+  data['n_participant'] = np.bincount(pairs // num_people, minlength=len(data))
+  return data.sort_values(list(columns), ignore_index=True)
+
+
+def _hash_person_ids(person_ids):
+  """Hash the person_ids to uniformly distributed 64-bit values, with the splitmix64 finalizer."""
+  import numpy as np  # pylint: disable=import-outside-toplevel
+
+  with np.errstate(over='ignore'):
+    z = person_ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+  return z ^ (z >> np.uint64(31))
+
+
+class _ParticipantCounter:
+  """Count the distinct participants of each group of rows, over batches of rows."""
+
+  def __init__(self, columns: Sequence[str], exact: bool):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    self.columns = columns
+    self.exact = exact
+    self._group_ids: Dict[Tuple, int] = {}
+    self._pairs = np.empty(0, dtype=np.int64)
+    self._pending = []
+    self._registers = new_registers(0)
+
+  def _get_group_ids(self, groups):
+    """Assign an id to each group the first time it is seen."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    ids = [self._group_ids.setdefault(group, len(self._group_ids))
+           for group in groups.itertuples(index=False, name=None)]
+    return np.array(ids, dtype=np.int64)
+
+  def update(self, encoded, person_ids, valid):
+    """Count the participants of a batch, whose person_ids are int64 and valid where they are not missing."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    valid = valid.copy()
+    group_codes, groups = _encode_groups(encoded, self.columns, valid)
+    group_ids = self._get_group_ids(groups)[group_codes]
+    person_ids = person_ids[valid]
+    if self.exact:
+      pairs = _sorted_unique((group_ids << PERSON_ID_BITS) | person_ids)
+      self._pending.append(pairs)
+      # Merge once the pending pairs are as many as the merged ones, so each pair is merged a
+      # logarithmic number of times.
+      if sum(len(pending) for pending in self._pending) >= len(self._pairs):
+        self._merge()
+    else:
+      if len(self._group_ids) > len(self._registers):
+        grown = new_registers(max(len(self._group_ids), 2 * len(self._registers)))
+        grown[:len(self._registers)] = self._registers
+        self._registers = grown
+      update_registers(self._registers, _hash_person_ids(person_ids), group_ids)
+
+  def _merge(self):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    self._pairs = _sorted_unique(np.concatenate([self._pairs] + self._pending))
+    self._pending = []
+
+  def get_counts(self):
+    """Return a dataframe of the values of the columns of each group, with its count of participants."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    data = pd.DataFrame(list(self._group_ids), columns=list(self.columns))
+    for column in self.columns:
+      data[column] = data[column].infer_objects()
+    if self.exact:
+      self._merge()
+      data['n_participant'] = np.bincount(self._pairs >> PERSON_ID_BITS, minlength=len(data))
+    else:
+      estimates = estimate_cardinality(self._registers[:len(data)])
+      data['n_participant'] = np.round(estimates).astype(np.int64)
+    return data.sort_values(list(self.columns), ignore_index=True)
+
+
+def _list_files(path: str):
+  """Return the filesystem of the path and the sorted paths of its files, or of it if it is a file.
+
+  As for pyarrow datasets, files whose names start with '.' or '_', such as _SUCCESS, are skipped.
+  """
+  import pyarrow.fs  # pylint: disable=import-outside-toplevel
+
+  if '://' in path:
+    filesystem, path = pyarrow.fs.FileSystem.from_uri(path)
+  else:
+    filesystem = pyarrow.fs.LocalFileSystem()
+  path = path.rstrip('/') or '/'
+  if filesystem.get_file_info(path).type != pyarrow.fs.FileType.Directory:
+    return filesystem, [path]
+  file_paths = []
+  for info in filesystem.get_file_info(pyarrow.fs.FileSelector(path, recursive=True)):
+    parts = info.path[len(path):].strip('/').split('/')
+    if info.type == pyarrow.fs.FileType.File and not any(part.startswith(('.', '_')) for part in parts):
+      file_paths.append(info.path)
+  return filesystem, sorted(file_paths)
+
+
+def iter_survey_batches(path: str, batch_size: int = DEFAULT_BATCH_SIZE):
+  """Read the survey columns of Parquet or CSV files in batches of rows, as pandas dataframes.
+
+  Args:
+    path: A file or directory of files, local or in a bucket such as `gs://bucket/survey/`.
+      Files whose names end in `.csv` or `.csv.gz` are read as CSV, and all others as Parquet.
+    batch_size: The maximum number of rows of each batch.
+  Yields:
+    Dataframes of the columns the summaries use.
+  """
+  import pyarrow.csv  # pylint: disable=import-outside-toplevel
+  import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+  import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+  columns = ['person_id'] + sorted(set(QUESTION_COLUMNS + ANSWER_COLUMNS))
+  filesystem, file_paths = _list_files(path)
+  csv_paths = {file_path for file_path in file_paths if re.search(r'\.csv(\.gz)?$', file_path)}
+  if csv_paths:
+    # Infer the types of the columns once, so that they are the same in every file.
+    schema = ds.dataset(sorted(csv_paths), filesystem=filesystem, format='csv').schema
+    convert_options = pyarrow.csv.ConvertOptions(
+        column_types={column: schema.field(column).type for column in columns},
+        # Read empty fields as missing, as pandas.read_csv does.
+        strings_can_be_null=True, include_columns=columns)
+    # Survey rows are around 100 bytes, so blocks of this size hold about batch_size rows.
+    read_options = pyarrow.csv.ReadOptions(block_size=min(100 * batch_size, 2**30))
+  # Read each file on this thread. The dataset scanner reads ahead of a slow consumer without
+  # bound, which holds as much memory as reading in batches was meant to save.
+  for file_path in file_paths:
+    if file_path in csv_paths:
+      with filesystem.open_input_stream(file_path) as f:
+        for batch in pyarrow.csv.open_csv(f, read_options=read_options, convert_options=convert_options):
+          yield batch.to_pandas()
+    else:
+      with filesystem.open_input_file(file_path) as f:
+        for batch in pq.ParquetFile(f, pre_buffer=False).iter_batches(batch_size=batch_size, columns=columns,
+                                                                       use_threads=False):
+          yield batch.to_pandas()
+
+
+class SurveySummarizer:
+  """Count the participants of every question and answer of a survey dataframe, in one pass.
+
+  The summarizer holds only the counts, not the dataframe, so it is small.
+  """
+
+  def __init__(self, survey, exact: bool = True, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Count the participants of the survey data.
+
+    Args:
+      survey: A survey dataframe, or the path to Parquet or CSV files of one. See
+        iter_survey_batches for the paths which can be read.
+      exact: For files, whether to count the participants exactly, rather than to estimate them
+        with a sketch of fixed size.
+      batch_size: For files, the number of rows to read at a time.
+    Raises:
+      ValueError: if a person_id of the files is negative or too large to count exactly.
+    """
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    if isinstance(survey, str):
+      self._count_batches(iter_survey_batches(survey, batch_size), exact)
+      return
+    encoded = {column: pd.factorize(survey[column]) for column in set(QUESTION_COLUMNS + ANSWER_COLUMNS)}
+    person_codes, people = pd.factorize(survey['person_id'])
+    self.question_counts = count_participants(encoded, person_codes, len(people), QUESTION_COLUMNS)
+    self.answer_counts = count_participants(encoded, person_codes, len(people), ANSWER_COLUMNS)
+
+  def _count_batches(self, batches, exact: bool):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+
+    counters = [_ParticipantCounter(QUESTION_COLUMNS, exact), _ParticipantCounter(ANSWER_COLUMNS, exact)]
+    for batch in batches:
+      encoded = {column: pd.factorize(batch[column]) for column in set(QUESTION_COLUMNS + ANSWER_COLUMNS)}
+      valid = batch['person_id'].notna().to_numpy()
+      person_ids = batch['person_id'].fillna(0).to_numpy(dtype=np.int64)
+      if exact and np.any((person_ids < 0) | (person_ids >= 2**PERSON_ID_BITS)):
+        raise ValueError(f'Exact counts need person_ids from 0 to 2**{PERSON_ID_BITS}; use exact=False instead.')
+      for counter in counters:
+        counter.update(encoded, person_ids, valid)
+    self.question_counts, self.answer_counts = (counter.get_counts() for counter in counters)
+
+  def summarize_module(self, module: Optional[str] = None, denominator: Optional[int] = None):
+    """Count the participants of each question of the module.
+
+    Args:
+      module: The name of the survey module, such as 'The Basics', in any case. Defaults to all modules.
+      denominator: The number of participants, such as 200000, for a response rate in percent.
+    Returns:
+      A dataframe with columns survey, question_concept_id, question, n_participant and, if
+      there is a denominator, response_rate.
+    """
+    data = self.question_counts
+    if module:
+      data = data[data['survey'].str.lower() == module.lower()].reset_index(drop=True)
+    data = data.copy()
+    if denominator:
+      data['response_rate'] = round(100*data['n_participant']/denominator, 2)
+    return data
+
+  def summarize_question(self, question_concept_id: int, denominator: Optional[int] = None) -> Tuple[Optional[str], Any]:
+    """Count the participants of each answer to the question.
+
+    Args:
+      question_concept_id: The concept id of the question, such as 1585940.
+      denominator: The number of participants, such as 200000, for a response rate in percent.
+    Returns:
+      The text of the question, or None if there is no such question, and a dataframe with columns
+      answer_concept_id, answer, n_participant and, if there is a denominator, response_rate.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    answers = self.answer_counts
+    data = (answers.loc[answers['question_concept_id'] == question_concept_id,
+                        ['answer_concept_id', 'answer', 'n_participant']]
+            .reset_index(drop=True)
+            .assign(answer_concept_id=lambda x: np.int32(x.answer_concept_id)))
+    if denominator:
+      data['response_rate'] = round(100*data['n_participant']/denominator, 2)
+    questions = self.question_counts.loc[self.question_counts['question_concept_id'] == question_concept_id,
+                                         'question']
+    return (questions.iloc[0] if len(questions) else None), data
+
+
+# The columns hashed to notice changes to a survey dataframe which was summarized before.
+FINGERPRINT_COLUMNS = ('person_id', 'question_concept_id', 'answer_concept_id')
+
+# The number of evenly spaced rows hashed to notice changes, so that checking takes the same time
+# however large the dataframe is.
+FINGERPRINT_ROWS = 1000
+
+# Define this in the outer scope so that the summarizer of the most recently summarized survey
+# data lives for the duration of the Jupyter kernel.
+_SUMMARIZER: Optional[Tuple[Any, SurveySummarizer]] = None
+
+
+def _fingerprint(survey) -> Tuple[Any, ...]:
+  """Return the shape, columns and dtypes of the survey dataframe and a hash of a sample of its rows.
+
+  Notebooks often modify a dataframe in place, so it being the same object does not mean that its
+  counts are the same. Filtering rows, or adding, removing or converting columns, changes the shape,
+  columns or dtypes; the sample of the id columns catches many changes to values as well.
+  """
+  import numpy as np  # pylint: disable=import-outside-toplevel
+  import pandas as pd  # pylint: disable=import-outside-toplevel
+
+  columns = [column for column in FINGERPRINT_COLUMNS if column in survey.columns]
+  rows = np.unique(np.linspace(0, len(survey) - 1, min(len(survey), FINGERPRINT_ROWS)).astype(np.int64))
+  hashes = tuple(pd.util.hash_pandas_object(survey[column].iloc[rows], index=False).to_numpy().tobytes()
+                 for column in columns)
+  return (survey.shape, tuple(survey.columns), tuple(str(dtype) for dtype in survey.dtypes)) + hashes
+
+
+def get_survey_summarizer(survey, exact: bool = True, refresh: bool = False) -> SurveySummarizer:
+  """Retrieve the summarizer of the survey data, creating it unless it was the last one summarized.
+
+  Args:
+    survey: A survey dataframe, or the path to Parquet or CSV files of one. A dataframe is summarized
+      again if its shape, columns or a sample of its id columns have changed since it was
+      summarized. Use refresh after other changes, and after files are modified.
+    exact: For files, whether to count the participants exactly. See SurveySummarizer.
+    refresh: Whether to summarize the survey data again even if it looks unchanged.
+  Returns:
+    The summarizer.
+  """
+  global _SUMMARIZER
+  if isinstance(survey, str):
+    source = (survey, exact)
+    reuse = _SUMMARIZER is not None and _SUMMARIZER[0] == source
+  else:
+    source = (weakref.ref(survey), _fingerprint(survey))
+    reuse = (_SUMMARIZER is not None and isinstance(_SUMMARIZER[0][0], weakref.ref)
+             and _SUMMARIZER[0][0]() is survey and _SUMMARIZER[0][1] == source[1])
+  if refresh or not reuse:
+    _SUMMARIZER = (source, SurveySummarizer(survey, exact=exact))
+  return _SUMMARIZER[1]
+
+
+def summarize_survey_module(survey, module: Optional[str] = None, denominator: Optional[int] = None,
+                            exact: bool = True, refresh: bool = False):
+  """Count the participants of each question of the module. See SurveySummarizer.summarize_module for details."""
+  return get_survey_summarizer(survey, exact=exact, refresh=refresh).summarize_module(module, denominator)
+
+
+def summarize_survey_question(survey, question_concept_id: int, denominator: Optional[int] = None,
+                              exact: bool = True, refresh: bool = False) -> Tuple[Optional[str], Any]:
+  """Count the participants of each answer to the question. See SurveySummarizer.summarize_question for details."""
+  return get_survey_summarizer(survey, exact=exact, refresh=refresh).summarize_question(question_concept_id,
+                                                                                        denominator)
@@ -0,0 +1,127 @@
+"""Fake CDR tables for running the SQL snippets on a local DuckDB database.
+
+The tables are those of the BigQuery test cases next to the SQL snippets, such as
+`sql-snippets/measurement_of_interest_test.py`.
+"""
+
+import os
+
+SQL_SNIPPETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'sql-snippets')
+
+# The tables of measurement_of_interest_test.py, which are also those of
+# most_recent_measurement_of_interest_test.py.
+MEASUREMENT_OF_INTEREST_TABLES = {
+    'person': '''
+SELECT * FROM (VALUES
+    (1001, TIMESTAMPTZ '1990-12-31 00:00:00+00', 501),
+    (1002, TIMESTAMPTZ '1950-08-01 00:00:00+00', 500),
+    (1003, TIMESTAMPTZ '1965-06-30 00:00:00+00', 500)
+) AS t(person_id, birth_datetime, sex_at_birth_concept_id)
+''',
+    'concept': '''
+SELECT * FROM (VALUES
+    (  0, 'No matching concept'),
+    (123, 'Hemoglobin'),
+    (456, 'gram per deciliter'),
+    (500, 'FEMALE'),
+    (501, 'MALE')
+) AS t(concept_id, concept_name)
+''',
+    'measurement_ext': '''
+SELECT * FROM (VALUES
+    (1, 'EHR site1'),
+    (2, 'EHR site1'),
+    (3, 'PPI/PM'),
+    (4, 'EHR site2'),
+    (5, 'EHR site2'),
+    (6, 'EHR site2')
+) AS t(measurement_id, src_id)
+''',
+    'measurement': '''
+SELECT
+  measurement_id::BIGINT AS measurement_id,
+  person_id::BIGINT AS person_id,
+  measurement_concept_id::BIGINT AS measurement_concept_id,
+  unit_concept_id::BIGINT AS unit_concept_id,
+  operator_concept_id::BIGINT AS operator_concept_id,
+  measurement_date::DATE AS measurement_date,
+  measurement_datetime::TIMESTAMPTZ AS measurement_datetime,
+  measurement_type_concept_id::BIGINT AS measurement_type_concept_id,
+  value_as_number::DOUBLE AS value_as_number,
+  value_as_concept_id::BIGINT AS value_as_concept_id,
+  range_low::DOUBLE AS range_low,
+  range_high::DOUBLE AS range_high
+FROM (VALUES
+    (1, 1001, 123, 456, NULL, '2005-12-31', '2005-12-31 10:30:00+00', NULL, 42.0, NULL, 0, 999),
+    (2, 1001, 123, 456, NULL, '2007-09-11', '2007-09-11 08:00:00+00', NULL, 13.5, NULL, 0, 999),
+    (3, 1001, 123, 456, NULL, '2007-09-11', '2007-09-11 20:59:00+00', NULL, NULL,  100, 0, 999),
+    (4, 1002, 123, 456, NULL, '2008-02-10', '2008-02-10 23:30:00+00', NULL, NULL, NULL, 0, 999),
+    (5, 1002, 123, 456,  789, '2008-02-10', '2008-02-10 23:30:00+00', NULL,  7.2, NULL, 0, 999),
+    -- This measurement is for someone not in our cohort.
+    (6, 1003, 123, 456,  789, '2010-01-01', '2010-10-01 23:30:00+00', NULL,  500, NULL, 0, 999)
+) AS t(measurement_id, person_id, measurement_concept_id, unit_concept_id, operator_concept_id,
+       measurement_date, measurement_datetime, measurement_type_concept_id, value_as_number,
+       value_as_concept_id, range_low, range_high)
+''',
+}
+
+# The tables of measurements_of_interest_summary_test.py.
+MEASUREMENTS_OF_INTEREST_SUMMARY_TABLES = {
+    'person': MEASUREMENT_OF_INTEREST_TABLES['person'],
+    'concept': '''
+SELECT * FROM (VALUES
+    (123, 'Hemoglobin', 'LOINC'),
+    (456, 'gram per deciliter', 'UCUM')
+) AS t(concept_id, concept_name, vocabulary_id)
+''',
+    'measurement_ext': '''
+SELECT * FROM (VALUES
+    (1, 'EHR site1'),
+    (2, 'EHR site1'),
+    (3, 'EHR site1'),
+    (4, 'EHR site2'),
+    (5, 'EHR site2'),
+    (6, 'PPI/PM')
+) AS t(measurement_id, src_id)
+''',
+    'measurement': '''
+SELECT
+  measurement_id::BIGINT AS measurement_id,
+  person_id::BIGINT AS person_id,
+  measurement_source_concept_id::BIGINT AS measurement_source_concept_id,
+  measurement_concept_id::BIGINT AS measurement_concept_id,
+  unit_concept_id::BIGINT AS unit_concept_id,
+  operator_concept_id::BIGINT AS operator_concept_id,
+  value_as_number::DOUBLE AS value_as_number,
+  value_as_concept_id::BIGINT AS value_as_concept_id
+FROM (VALUES
+    (1, 1001, 123, 123, 456, NULL, 42.0, NULL),
+    (2, 1001, 123, 123, 456, NULL, 13.5, NULL),
+    (3, 1002, 123, 123, 456, NULL, NULL,  100),
+    (4, 1002, 123, 123, 456, NULL, NULL, NULL),
+    (5, 1002, 123, 123, 456,  789,  7.2, NULL),
+    -- This measurement is for someone not in our cohort.
+    (6, 1003, 123, 123, 456, NULL,  500, NULL)
+) AS t(measurement_id, person_id, measurement_source_concept_id, measurement_concept_id, unit_concept_id,
+       operator_concept_id, value_as_number, value_as_concept_id)
+''',
+}
+
+
+def create_tables(connection, dataset: str, tables: dict):
+  """Create the tables in a DuckDB schema named after the dataset."""
+  connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{dataset}"')
+  for name, query in tables.items():
+    connection.execute(f'CREATE OR REPLACE TABLE "{dataset}"."{name}" AS {query}')
+
+
+def write_parquet_tables(connection, directory: str, tables: dict):
+  """Write each table to `<name>.parquet` in the directory, as if exported from BigQuery."""
+  for name, query in tables.items():
+    path = os.path.join(directory, f'{name}.parquet').replace("'", "''")
+    connection.execute(f"COPY ({query}) TO '{path}' (FORMAT PARQUET)")
+
+
+def read_sql_snippet(file_name: str) -> str:
+  with open(os.path.join(SQL_SNIPPETS_DIR, file_name)) as f:
+    return f.read()
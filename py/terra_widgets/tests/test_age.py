@@ -0,0 +1,101 @@
+"""Tests for computing exact ages in whole years."""
+
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from terra_widgets import age
+
+
+def reference_age(birth, as_of):
+  """The age in whole years on the date as_of of someone born on the date birth, one row at a time."""
+  return as_of.year - birth.year - ((as_of.month, as_of.day) < (birth.month, birth.day))
+
+
+def make_datetimes(num_rows, seed=0):
+  """Make dates of birth and of measurements, with times of day and leap days."""
+  rng = np.random.default_rng(seed)
+  birth = pd.Timestamp('1920-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 80 * 365 * 86400, num_rows),
+                                                                  unit='s')
+  event = birth + pd.to_timedelta(rng.integers(0, 40 * 365 * 86400, num_rows), unit='s')
+  birth = pd.Series(birth)
+  event = pd.Series(event)
+  # Birthdays, the days before them and leap days.
+  birth[:4] = pd.to_datetime(['2000-02-29', '2000-02-29', '1969-12-31 23:59', '1990-06-15 12:00'],
+                             format='ISO8601').tz_localize('UTC')
+  event[:4] = pd.to_datetime(['2021-02-28', '2021-03-01', '2020-12-31 00:00', '2020-06-14 23:59'],
+                             format='ISO8601').tz_localize('UTC')
+  return birth, event
+
+
+class TestAgeInYears(unittest.TestCase):
+
+  def setUp(self):
+    self.birth, self.event = make_datetimes(5000)
+    self.expected = [reference_age(b, e) for b, e in zip(self.birth, self.event)]
+
+  def test_as_of_event(self):
+    ages = age.age_in_years(self.birth, self.event)
+    self.assertEqual(ages.dtype, np.int64)
+    self.assertEqual(ages.tolist(), self.expected)
+    self.assertEqual(ages[:4].tolist(), [20, 21, 51, 29])
+
+  def test_numpy_and_arrow(self):
+    naive_birth = self.birth.dt.tz_localize(None)
+    naive_event = self.event.dt.tz_localize(None)
+    for birth, event in [
+        (naive_birth.to_numpy(), naive_event.to_numpy()),
+        (naive_birth.to_numpy().astype('datetime64[ns]'), naive_event.to_numpy().astype('datetime64[s]')),
+        (self.birth.astype('timestamp[us, tz=UTC][pyarrow]'), self.event.astype('timestamp[ns, tz=UTC][pyarrow]')),
+        (pa.array(self.birth), pa.chunked_array([pa.array(self.event[:100]), pa.array(self.event[100:])])),
+        (pa.array(self.birth.dt.date), self.event),
+    ]:
+      self.assertEqual(age.age_in_years(birth, event).tolist(), self.expected)
+
+  def test_timezones(self):
+    # Dates are those of each datetime's own timezone.
+    birth = pd.Series(pd.to_datetime(['1990-06-15 02:00']).tz_localize('UTC'))
+    event = pd.Series(pd.to_datetime(['2020-06-14 23:00']).tz_localize('America/New_York'))
+    self.assertEqual(age.age_in_years(birth, event).tolist(), [29])
+    self.assertEqual(age.age_in_years(pa.array(birth), pa.array(event)).tolist(), [29])
+    self.assertEqual(age.age_in_years(birth.dt.tz_convert('America/New_York'), event).tolist(), [30])
+
+  def test_as_of_date(self):
+    as_of = datetime.date(2020, 6, 15)
+    expected = [reference_age(b, as_of) for b in self.birth]
+    self.assertEqual(age.age_in_years(self.birth, as_of).tolist(), expected)
+    self.assertEqual(age.age_in_years(pa.array(self.birth), '2020-06-15').tolist(), expected)
+    today = datetime.date.today()
+    self.assertEqual(age.age_in_years(self.birth[:10]).tolist(), [reference_age(b, today) for b in self.birth[:10]])
+
+  def test_missing(self):
+    birth = self.birth[:4].copy()
+    event = self.event[:4].copy()
+    birth[1] = pd.NaT
+    event[2] = pd.NaT
+    for ages in [age.age_in_years(birth, event), age.age_in_years(pa.array(birth), pa.array(event))]:
+      self.assertEqual(ages.dtype, np.float64)
+      np.testing.assert_array_equal(ages.to_numpy(), [20, np.nan, np.nan, 29])
+
+  def test_missing_before_1970(self):
+    # An older cohort, all born in a narrow range of days before the epoch, with one missing date of birth.
+    birth = pd.Series(pd.date_range('1940-01-01', '1942-12-31', periods=1200))
+    birth[5] = pd.NaT
+    expected = [np.nan if pd.isna(b) else reference_age(b, datetime.date(2020, 6, 15)) for b in birth]
+    for values in [birth, pa.array(birth)]:
+      np.testing.assert_array_equal(age.age_in_years(values, '2020-06-15').to_numpy(), expected)
+
+  def test_index(self):
+    birth = self.birth.set_axis(self.birth.index + 100)
+    event = self.event.set_axis(self.event.index + 100)
+    self.assertEqual(list(age.age_in_years(birth, event).index), list(birth.index))
+
+  def test_different_lengths(self):
+    with self.assertRaises(ValueError):
+      age.age_in_years(self.birth, self.event[:10])
+
+
+if __name__ == '__main__':
+  unittest.main()
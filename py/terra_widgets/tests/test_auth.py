@@ -0,0 +1,144 @@
+"""Tests for the access token cache and the shared HTTP session."""
+
+import http.server
+import threading
+import unittest
+
+from terra_widgets import auth
+from terra_widgets.auth import AccessToken
+from terra_widgets.auth import AccessTokenCache
+
+
+class StubTokenSource:
+  """Hand out numbered tokens, which expire after an hour of fake time."""
+
+  def __init__(self, clock):
+    self.clock = clock
+    self.accounts = []
+    self.release = threading.Event()
+    self.release.set()
+
+  def __call__(self, account):
+    self.release.wait()
+    self.accounts.append(account)
+    return AccessToken(token=f'token-{len(self.accounts)}', expires_at=self.clock() + 3600)
+
+
+class TestAccessTokenCache(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 1000.0
+    self.source = StubTokenSource(lambda: self.now)
+    self.cache = AccessTokenCache(fetch_token_fn=self.source, refresh_margin_seconds=300, clock=lambda: self.now)
+
+  def test_token_is_reused(self):
+    self.assertEqual(self.cache.get_token(), 'token-1')
+    self.assertEqual(self.cache.get_token(), 'token-1')
+    self.assertListEqual(self.source.accounts, [None])
+
+  def test_tokens_are_per_account(self):
+    self.assertEqual(self.cache.get_token('a@x.org'), 'token-1')
+    self.assertEqual(self.cache.get_token('b@x.org'), 'token-2')
+    self.assertEqual(self.cache.get_token('a@x.org'), 'token-1')
+    self.assertListEqual(self.source.accounts, ['a@x.org', 'b@x.org'])
+
+  def test_expired_token_is_refreshed(self):
+    self.cache.get_token()
+    self.now += 3600
+    self.assertEqual(self.cache.get_token(), 'token-2')
+
+  def test_expiring_token_is_refreshed_in_background(self):
+    self.cache.get_token()
+    self.now += 3400
+    self.source.release.clear()
+    # The current token is still valid, so it is returned without waiting for the refresh.
+    self.assertEqual(self.cache.get_token(), 'token-1')
+    self.source.release.set()
+    for thread in threading.enumerate():
+      if thread.name == 'terra_widgets_token_refresh':
+        thread.join(timeout=10)
+    self.assertEqual(self.cache.get_token(), 'token-2')
+
+  def test_invalidate(self):
+    self.cache.get_token()
+    self.cache.invalidate()
+    self.assertEqual(self.cache.get_token(), 'token-2')
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+  """Reject 'token-1', fail the first request to /flaky, and otherwise echo the authorization header."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    server = self.server
+    server.connections.add(self.client_address)
+    if self.path == '/flaky' and not server.failed_once:
+      server.failed_once = True
+      self._respond(503, b'unavailable')
+    elif self.headers['Authorization'] == 'Bearer token-1':
+      self._respond(401, b'unauthorized')
+    else:
+      self._respond(200, self.headers['Authorization'].encode('utf-8'))
+
+  def _respond(self, status, body):
+    self.send_response(status)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):  # pylint: disable=arguments-differ
+    pass
+
+
+class TestAuthorizedGet(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = http.server.ThreadingHTTPServer(('localhost', 0), StubHandler)
+    cls.server.connections = set()
+    cls.server.failed_once = False
+    cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+    cls.thread.start()
+    cls.url = f'http://localhost:{cls.server.server_address[1]}'
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+
+  def setUp(self):
+    self.server.connections.clear()
+    self.server.failed_once = False
+    self.source = StubTokenSource(lambda: 0.0)
+    auth.set_token_cache(AccessTokenCache(fetch_token_fn=self.source, clock=lambda: 0.0))
+    auth.set_session(auth.create_session(backoff_factor=0))
+
+  def tearDown(self):
+    auth.set_token_cache(None)
+    auth.set_session(None)
+
+  def test_rejected_token_is_replaced(self):
+    response = auth.authorized_get(f'{self.url}/apps')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.text, 'Bearer token-2')
+    self.assertEqual(len(self.source.accounts), 2)
+
+  def test_transient_error_is_retried(self):
+    auth.get_token_cache().get_token()  # Use up the rejected token.
+    auth.get_token_cache().invalidate()
+    response = auth.authorized_get(f'{self.url}/flaky')
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(self.server.failed_once)
+
+  def test_connections_are_reused(self):
+    auth.get_token_cache().get_token()
+    auth.get_token_cache().invalidate()
+    for _ in range(5):
+      self.assertEqual(auth.authorized_get(f'{self.url}/apps').status_code, 200)
+    self.assertEqual(len(self.server.connections), 1)
+    self.assertEqual(len(self.source.accounts), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
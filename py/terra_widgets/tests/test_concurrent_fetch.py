@@ -0,0 +1,89 @@
+"""Tests for the ConcurrentFetcher class."""
+
+import threading
+import unittest
+
+from terra_widgets.concurrent_fetch import ConcurrentFetcher
+
+
+class TestConcurrentFetcher(unittest.TestCase):
+
+  def setUp(self):
+    self.sleeps = []
+    self.fetcher = ConcurrentFetcher(max_concurrency=4,
+                                     timeout_seconds=7,
+                                     max_retries=2,
+                                     initial_backoff_seconds=1,
+                                     sleep=self.sleeps.append)
+
+  def test_fetch_all(self):
+    timeouts = set()
+
+    def fetch(path, timeout):
+      timeouts.add(timeout)
+      return path.upper()
+
+    paths = [f'gs://fc-fake-bucket/{i}' for i in range(100)]
+    completed = []
+    results = self.fetcher.fetch_all(paths, fetch, on_result=completed.append)
+    self.assertListEqual([r.path for r in results], paths)
+    self.assertListEqual([r.value for r in results], [p.upper() for p in paths])
+    self.assertEqual(len(completed), 100)
+    self.assertSetEqual(timeouts, {7})
+    self.assertListEqual(self.sleeps, [])
+
+  def test_bounded_concurrency(self):
+    lock = threading.Lock()
+    in_flight = [0, 0]  # Current and maximum.
+    barrier = threading.Event()
+
+    def fetch(path, timeout):
+      with lock:
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+      barrier.wait(timeout=0.01)
+      with lock:
+        in_flight[0] -= 1
+      return path
+
+    self.fetcher.fetch_all([str(i) for i in range(50)], fetch)
+    self.assertLessEqual(in_flight[1], 4)
+
+  def test_retry_then_succeed(self):
+    attempts = []
+
+    def fetch(path, timeout):
+      attempts.append(path)
+      if len(attempts) < 3:
+        raise TimeoutError('simulated timeout')
+      return 'ok'
+
+    result, = self.fetcher.fetch_all(['a'], fetch)
+    self.assertEqual(result.value, 'ok')
+    self.assertIsNone(result.error)
+    self.assertEqual(len(attempts), 3)
+    self.assertEqual(len(self.sleeps), 2)
+    # Exponential backoff with jitter.
+    self.assertTrue(0.5 <= self.sleeps[0] <= 1)
+    self.assertTrue(1 <= self.sleeps[1] <= 2)
+
+  def test_retries_exhausted(self):
+    def fetch(path, timeout):
+      raise ConnectionError('simulated failure')
+
+    result, = self.fetcher.fetch_all(['a'], fetch)
+    self.assertIsNone(result.value)
+    self.assertEqual(result.error, 'ConnectionError: simulated failure')
+    self.assertEqual(len(self.sleeps), 2)
+
+  def test_not_found_is_not_retried(self):
+    def fetch(path, timeout):
+      raise FileNotFoundError(path)
+
+    result, = self.fetcher.fetch_all(['gs://fc-fake-bucket/missing'], fetch)
+    self.assertIn('FileNotFoundError', result.error)
+    self.assertListEqual(self.sleeps, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,173 @@
+"""Tests for joining dataframes from Dataset Builder in less memory."""
+
+import contextlib
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+from terra_widgets import dataframe_join
+
+
+def make_person_df(num_people, seed=0):
+  """Make a person dataframe with one row per person_id, in no particular order."""
+  rng = np.random.default_rng(seed)
+  return pd.DataFrame({
+      'person_id': rng.permutation(num_people).astype(np.int64) + 1000000,
+      'gender_concept_id': rng.choice([45878463, 45880669], num_people),
+      'gender': np.array(['Female', 'Male'], dtype=object)[rng.integers(0, 2, num_people)],
+      'date_of_birth': pd.Timestamp('1950-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 18000, num_people),
+                                                                               unit='D'),
+      'sex_at_birth': np.array(['Female', 'Male', None], dtype=object)[rng.integers(0, 3, num_people)],
+  })
+
+
+def make_measurement_df(num_rows, num_people, seed=0):
+  """Make a measurement dataframe with many rows per person, some for people not in the person dataframe."""
+  rng = np.random.default_rng(seed)
+  concepts = rng.integers(0, 5, num_rows)
+  return pd.DataFrame({
+      'person_id': rng.integers(0, num_people + 10, num_rows) + 1000000,
+      'measurement_concept_id': concepts + 3000000,
+      'standard_concept_name': np.array([f'Lab {i}' for i in range(5)], dtype=object)[concepts],
+      'value_as_number': rng.normal(100, 10, num_rows),
+      'measurement_source_value': np.array([f'source {i}' for i in range(num_rows)], dtype=object),
+  })
+
+
+def assert_joined_equal(actual, expected):
+  """Compare the rows of the joined dataframes in any order, ignoring their dtypes."""
+  actual = actual.astype(object).sort_values(list(actual.columns)).reset_index(drop=True)
+  expected = expected.astype(object).sort_values(list(expected.columns)).reset_index(drop=True)
+  pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+class TestShrinkDataframe(unittest.TestCase):
+
+  def test_shrink(self):
+    df = make_measurement_df(1000, 50)
+    shrunk = dataframe_join.shrink_dataframe(df)
+    self.assertEqual(shrunk['person_id'].dtype, np.int32)
+    self.assertEqual(shrunk['measurement_concept_id'].dtype, np.int32)
+    self.assertEqual(shrunk['value_as_number'].dtype, np.float64)
+    self.assertIsInstance(shrunk['standard_concept_name'].dtype, pd.CategoricalDtype)
+    self.assertEqual(list(shrunk['standard_concept_name'].cat.categories), [f'Lab {i}' for i in range(5)])
+    # Mostly distinct strings are not worth a categorical.
+    self.assertNotIsInstance(shrunk['measurement_source_value'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(shrunk.astype(object), df.astype(object))
+    self.assertLess(dataframe_join.memory_usage_mb(shrunk), dataframe_join.memory_usage_mb(df))
+    # The dataframe itself is not modified.
+    self.assertEqual(df['person_id'].dtype, np.int64)
+
+  def test_large_ids(self):
+    df = pd.DataFrame({'person_id': [1, 2**40], 'name': ['a', None]})
+    shrunk = dataframe_join.shrink_dataframe(df)
+    self.assertEqual(shrunk['person_id'].dtype, np.int64)
+    self.assertTrue(pd.isna(shrunk['name'][1]))
+
+
+class TestJoinDataframes(unittest.TestCase):
+
+  def setUp(self):
+    self.person_df = make_person_df(100)
+    self.measurement_df = make_measurement_df(2000, 100)
+
+  def test_join(self):
+    joined = dataframe_join.join_dataframes(self.person_df, self.measurement_df)
+    expected = pd.merge(left=self.person_df, right=self.measurement_df, how='inner')
+    self.assertEqual(list(joined.columns), list(expected.columns))
+    assert_joined_equal(joined, expected)
+    self.assertIsInstance(joined['standard_concept_name'].dtype, pd.CategoricalDtype)
+    self.assertIsInstance(joined['gender'].dtype, pd.CategoricalDtype)
+    # The measurements stay in their order.
+    kept = self.measurement_df['person_id'].isin(self.person_df['person_id'])
+    np.testing.assert_array_equal(joined['measurement_source_value'].to_numpy(),
+                                  self.measurement_df.loc[kept, 'measurement_source_value'].to_numpy())
+
+  def test_join_either_order(self):
+    joined = dataframe_join.join_dataframes(self.measurement_df, self.person_df)
+    expected = pd.merge(left=self.measurement_df, right=self.person_df, how='inner')
+    self.assertEqual(list(joined.columns), list(expected.columns))
+    assert_joined_equal(joined, expected)
+
+  def test_sorted_keys(self):
+    person_df = self.person_df.sort_values('person_id')
+    joined = dataframe_join.join_dataframes(person_df, self.measurement_df)
+    assert_joined_equal(joined, pd.merge(left=person_df, right=self.measurement_df, how='inner'))
+
+  def test_sparse_keys(self):
+    # Keys spread over a range too large to index by the key are found by a binary search.
+    person_df = self.person_df.assign(person_id=self.person_df['person_id'] * 10**9)
+    measurement_df = self.measurement_df.assign(person_id=self.measurement_df['person_id'] * 10**9)
+    for df in (person_df, person_df.sort_values('person_id')):
+      joined = dataframe_join.join_dataframes(df, measurement_df)
+      assert_joined_equal(joined, pd.merge(left=df, right=measurement_df, how='inner'))
+
+  def test_nullable_keys(self):
+    # As from pandas-gbq.
+    person_df = self.person_df.astype({'person_id': 'Int64'})
+    measurement_df = self.measurement_df.astype({'person_id': 'Int64'})
+    for left, right in [(person_df, measurement_df), (person_df, self.measurement_df),
+                        (measurement_df, self.person_df.astype({'person_id': 'int64[pyarrow]'}))]:
+      joined = dataframe_join.join_dataframes(left, right)
+      assert_joined_equal(joined, pd.merge(left=left, right=right, how='inner'))
+    # Missing keys are joined by pandas.merge, which does not match them to anything.
+    measurement_df.loc[:10, 'person_id'] = pd.NA
+    joined = dataframe_join.join_dataframes(person_df, measurement_df)
+    self.assertEqual(len(joined), len(pd.merge(left=person_df, right=measurement_df, how='inner')))
+    assert_joined_equal(joined, pd.merge(left=person_df, right=measurement_df, how='inner'))
+
+  def test_unsigned_keys(self):
+    person_df = self.person_df.astype({'person_id': np.uint64})
+    joined = dataframe_join.join_dataframes(person_df, self.measurement_df)
+    assert_joined_equal(joined, pd.merge(left=person_df, right=self.measurement_df, how='inner'))
+
+  def test_on(self):
+    # Both dataframes have a column named x which is not joined on.
+    person_df = self.person_df.assign(x=np.arange(len(self.person_df)))
+    measurement_df = self.measurement_df.assign(x=-np.arange(len(self.measurement_df)))
+    for left, right in [(person_df, measurement_df), (measurement_df, person_df)]:
+      for on in ['person_id', ['person_id']]:
+        joined = dataframe_join.join_dataframes(left, right, on=on)
+        expected = pd.merge(left=left, right=right, how='inner', on=on)
+        self.assertEqual(list(joined.columns), list(expected.columns))
+        assert_joined_equal(joined, expected)
+    # Neither dataframe has unique keys, so pandas.merge joins them.
+    joined = dataframe_join.join_dataframes(measurement_df, measurement_df, on='person_id', columns=['x_x', 'x_y'])
+    assert_joined_equal(joined, pd.merge(left=measurement_df, right=measurement_df, how='inner',
+                                         on='person_id')[['x_x', 'x_y']])
+
+  def test_columns(self):
+    columns = ['person_id', 'sex_at_birth', 'value_as_number']
+    joined = dataframe_join.join_dataframes(self.person_df, self.measurement_df, columns=columns)
+    self.assertEqual(list(joined.columns), columns)
+    assert_joined_equal(joined, pd.merge(left=self.person_df, right=self.measurement_df, how='inner')[columns])
+
+  def test_repeated_keys(self):
+    # Neither dataframe has unique person_ids, so pandas.merge joins them.
+    other_df = make_measurement_df(300, 100, seed=1).rename(columns={'value_as_number': 'other_value'})
+    other_df = other_df[['person_id', 'other_value']]
+    joined = dataframe_join.join_dataframes(self.measurement_df, other_df)
+    assert_joined_equal(joined, pd.merge(left=self.measurement_df, right=other_df, how='inner'))
+
+  def test_no_matches(self):
+    person_df = self.person_df.assign(person_id=self.person_df['person_id'] + 10**6)
+    joined = dataframe_join.join_dataframes(person_df, self.measurement_df)
+    self.assertEqual(len(joined), 0)
+    self.assertEqual(len(dataframe_join.join_dataframes(person_df.iloc[:0], self.measurement_df)), 0)
+
+  def test_report(self):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      dataframe_join.join_dataframes(self.person_df, self.measurement_df, report=True)
+    self.assertIn('after shrinking', output.getvalue())
+
+  def test_errors(self):
+    with self.assertRaises(ValueError):
+      dataframe_join.join_dataframes(self.person_df, pd.DataFrame({'other': [1]}))
+    with self.assertRaises(ValueError):
+      dataframe_join.join_dataframes(self.person_df, self.measurement_df, columns=['person_id', 'unknown'])
+
+
+if __name__ == '__main__':
+  unittest.main()
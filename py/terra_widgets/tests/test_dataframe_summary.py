@@ -0,0 +1,127 @@
+"""Tests for summarizing every column of a dataframe."""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from terra_widgets import dataframe_summary
+
+
+def make_person_df(num_rows, seed=0):
+  """Make a dataframe with columns of each kind, sorted by date of birth as a cohort may be."""
+  rng = np.random.default_rng(seed)
+  value = rng.normal(100, 15, num_rows)
+  value[rng.random(num_rows) < 0.1] = np.nan
+  return pd.DataFrame({
+      'person_id': rng.permutation(num_rows) + 1000000,
+      'value_as_number': value,
+      'sex_at_birth': np.array(['Female', 'Male', 'Intersex', None], dtype=object)[
+          rng.choice(4, num_rows, p=[0.5, 0.45, 0.01, 0.04])],
+      'race': pd.Categorical(rng.choice(['Asian', 'Black', 'White'], num_rows)),
+      'is_deceased': rng.random(num_rows) < 0.02,
+      'date_of_birth': pd.Timestamp('1940-01-01', tz='UTC') + pd.to_timedelta(
+          np.sort(rng.integers(0, 25000, num_rows)), unit='D'),
+  })
+
+
+class TestSummarizeDataframe(unittest.TestCase):
+
+  def setUp(self):
+    self.df = make_person_df(50000)
+
+  def test_statistics(self):
+    summary = dataframe_summary.summarize_dataframe(self.df, chunk_size=7000)
+    statistics = summary.statistics
+    self.assertEqual(summary.num_rows, len(self.df))
+    self.assertEqual(summary.num_rows_summarized, len(self.df))
+    self.assertEqual(list(statistics.index), list(self.df.columns))
+    self.assertEqual(list(statistics.columns), dataframe_summary.STATISTICS)
+
+    value = self.df['value_as_number']
+    self.assertEqual(statistics.loc['value_as_number', 'count'], value.count())
+    self.assertEqual(statistics.loc['value_as_number', 'missing'], value.isna().sum())
+    self.assertAlmostEqual(statistics.loc['value_as_number', 'mean'], value.mean())
+    self.assertAlmostEqual(statistics.loc['value_as_number', 'std'], value.std())
+    self.assertEqual(statistics.loc['value_as_number', 'min'], value.min())
+    self.assertEqual(statistics.loc['value_as_number', 'max'], value.max())
+    ranks = np.searchsorted(np.sort(value.dropna()), statistics.loc['value_as_number', ['5%', '50%', '95%']]
+                            .to_numpy(dtype=np.float64)) / value.count()
+    np.testing.assert_allclose(ranks, [0.05, 0.5, 0.95], atol=0.002)
+    self.assertEqual(statistics.loc['person_id', 'min'], 1000000)
+    np.testing.assert_allclose(statistics.loc['person_id', 'distinct'], len(self.df), rtol=0.03)
+
+    self.assertEqual(statistics.loc['sex_at_birth', 'distinct'], 3)
+    self.assertEqual(statistics.loc['sex_at_birth', 'top'], 'Female')
+    self.assertEqual(statistics.loc['sex_at_birth', 'top_count'], (self.df['sex_at_birth'] == 'Female').sum())
+    self.assertEqual(statistics.loc['sex_at_birth', 'missing'], self.df['sex_at_birth'].isna().sum())
+    self.assertEqual(statistics.loc['race', 'distinct'], 3)
+    self.assertEqual(statistics.loc['is_deceased', 'top'], False)
+
+    date_of_birth = self.df['date_of_birth']
+    self.assertEqual(statistics.loc['date_of_birth', 'min'], date_of_birth.min())
+    self.assertEqual(statistics.loc['date_of_birth', 'max'], date_of_birth.max())
+    self.assertLess(abs(statistics.loc['date_of_birth', '50%'] - date_of_birth.median()), pd.Timedelta(days=60))
+
+  def test_empty(self):
+    summary = dataframe_summary.summarize_dataframe(self.df.iloc[:0])
+    self.assertEqual(summary.statistics['count'].sum(), 0)
+    self.assertEqual(len(summary.sample), 0)
+
+  def test_unhashable_values(self):
+    # Lists and dicts, as from BigQuery REPEATED and RECORD fields, appearing only after the first chunk.
+    tags = pd.Series([f'tag {i % 3}' for i in range(len(self.df))], dtype=object)
+    tags[30000::2] = pd.Series([[1, 2], {'code': 3}, None] * 10000).iloc[:len(tags[30000::2])].to_numpy()
+    df = self.df.assign(tags=tags)
+    summary = dataframe_summary.summarize_dataframe(df, chunk_size=7000)
+    statistics = summary.statistics
+    self.assertEqual(statistics.loc['tags', 'missing'], tags.isna().sum())
+    self.assertEqual(statistics.loc['tags', 'count'], tags.notna().sum())
+    self.assertEqual(statistics.loc['tags', 'distinct'], 5)
+    self.assertNotIn('tags', summary.correlations['cramers'].index)
+    # The other columns are still summarized.
+    self.assertEqual(statistics.loc['sex_at_birth', 'distinct'], 3)
+
+  def test_time_budget(self):
+    summary = dataframe_summary.summarize_dataframe(self.df, chunk_size=5000, time_budget_seconds=0)
+    self.assertEqual(summary.num_rows_summarized, 5000)
+    # The rows are a random sample, rather than the first rows, which are the oldest people.
+    median = summary.statistics.loc['date_of_birth', '50%']
+    self.assertLess(abs(median - self.df['date_of_birth'].median()), pd.Timedelta(days=365))
+
+  def test_correlations(self):
+    df = self.df.assign(value_squared=self.df['value_as_number']**2)
+    summary = dataframe_summary.summarize_dataframe(df, sample_size=2000)
+    self.assertEqual(len(summary.sample), 2000)
+    self.assertGreater(summary.correlations['pearson'].loc['value_as_number', 'value_squared'], 0.99)
+    self.assertGreater(summary.correlations['spearman'].loc['value_as_number', 'value_squared'], 0.99)
+    cramers = summary.correlations['cramers']
+    self.assertEqual(list(cramers.index), ['sex_at_birth', 'race', 'is_deceased'])
+    self.assertLess(cramers.loc['sex_at_birth', 'race'], 0.2)
+
+
+class TestSampleRows(unittest.TestCase):
+
+  def test_random(self):
+    df = make_person_df(10000)
+    sample = dataframe_summary.sample_rows(df, sample_size=1000)
+    self.assertEqual(len(sample), 1000)
+    self.assertTrue(sample.index.is_unique)
+    self.assertTrue(sample.index.is_monotonic_increasing)
+    # Not just the first rows.
+    self.assertGreater(sample.index.max(), 5000)
+    self.assertEqual(len(dataframe_summary.sample_rows(df, sample_size=20000)), len(df))
+
+  def test_stratified(self):
+    df = make_person_df(10000)
+    sample = dataframe_summary.sample_rows(df, sample_size=1000, stratify_by='sex_at_birth')
+    self.assertEqual(len(sample), 1000)
+    self.assertTrue(sample.index.is_unique)
+    counts = sample['sex_at_birth'].value_counts(dropna=False)
+    # All of the rare strata, and an equal share of the rest for the others.
+    self.assertEqual(counts['Intersex'], (df['sex_at_birth'] == 'Intersex').sum())
+    shares = [counts['Female'], counts['Male'], counts[counts.index.isna()].iloc[0]]
+    self.assertLessEqual(max(shares) - min(shares), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
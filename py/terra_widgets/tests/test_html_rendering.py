@@ -0,0 +1,56 @@
+"""Tests for rendering notebooks to HTML."""
+
+import os
+import tempfile
+import unittest
+
+import nbformat
+
+from terra_widgets.html_rendering import render_notebook
+from terra_widgets.html_rendering import render_notebooks
+
+
+def _write_notebook(folder: str, name: str, source: str) -> str:
+  notebook = nbformat.v4.new_notebook()
+  notebook.cells.append(nbformat.v4.new_markdown_cell(f'# {name}'))
+  notebook.cells.append(nbformat.v4.new_code_cell(source))
+  path = os.path.join(folder, f'{name}.ipynb')
+  nbformat.write(notebook, path)
+  return path
+
+
+class TestHtmlRendering(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def test_render_notebook(self):
+    notebook = _write_notebook(self.tmpdir.name, 'test1', 'print("hello snapshot")')
+    result = render_notebook(notebook)
+    self.assertIsNone(result.error)
+    self.assertEqual(result.html_file, os.path.join(self.tmpdir.name, 'test1.html'))
+    with open(result.html_file) as f:
+      self.assertIn('hello snapshot', f.read())
+
+  def test_render_notebook_error(self):
+    notebook = os.path.join(self.tmpdir.name, 'not_a_notebook.ipynb')
+    with open(notebook, 'w') as f:
+      f.write('this is not json')
+    result = render_notebook(notebook)
+    self.assertIsNone(result.html_file)
+    self.assertIsNotNone(result.error)
+
+  def test_render_notebooks(self):
+    notebooks = [_write_notebook(self.tmpdir.name, f'test{i}', f'x = {i}') for i in range(4)]
+    results = list(render_notebooks(notebooks, max_workers=2))
+    self.assertSetEqual({r.notebook_file for r in results}, set(notebooks))
+    for result in results:
+      self.assertIsNone(result.error)
+      self.assertTrue(os.path.isfile(result.html_file))
+
+
+if __name__ == '__main__':
+  unittest.main()
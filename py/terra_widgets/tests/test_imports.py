@@ -0,0 +1,80 @@
+"""Tests that importing terra_widgets is fast and does not load heavy modules."""
+
+import json
+import subprocess
+import sys
+import unittest
+
+# Measured in a fresh interpreter. Typical times are well under a tenth of this.
+IMPORT_TIME_CEILING_SECONDS = 0.5
+
+HEAVY_MODULES = [
+    'firecloud',
+    'google.cloud.storage',
+    'IPython',
+    'ipywidgets',
+    'multiprocess',
+    'nbconvert',
+    'numpy',
+    'pandas',
+    'requests',
+    'tensorflow',
+    'tqdm',
+]
+
+MEASURE_IMPORT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def _cold_import(module: str):
+  output = subprocess.run([sys.executable, '-c', MEASURE_IMPORT.format(module=module)],
+                          capture_output=True, check=True, encoding='utf-8').stdout
+  return json.loads(output)
+
+
+class TestImports(unittest.TestCase):
+
+  def _check_import(self, module: str):
+    result = _cold_import(module)
+    self.assertLess(result['elapsed'], IMPORT_TIME_CEILING_SECONDS)
+    loaded = [m for m in HEAVY_MODULES if m in result['modules']]
+    self.assertListEqual(loaded, [], f'importing {module} loaded heavy modules')
+
+  def test_import_package(self):
+    self._check_import('terra_widgets')
+
+  def test_import_workspace_paths(self):
+    self._check_import('terra_widgets.workspace_paths')
+
+  def test_import_html_snapshots(self):
+    self._check_import('terra_widgets.html_snapshots')
+
+  def test_import_workspace_metadata(self):
+    self._check_import('terra_widgets.workspace_metadata')
+
+  def test_import_query_runner(self):
+    self._check_import('terra_widgets.query_runner')
+
+  def test_import_survey_summary(self):
+    self._check_import('terra_widgets.survey_summary')
+
+  def test_import_dataframe_join(self):
+    self._check_import('terra_widgets.dataframe_join')
+
+  def test_import_dataframe_summary(self):
+    self._check_import('terra_widgets.dataframe_summary')
+
+  def test_import_sketches(self):
+    self._check_import('terra_widgets.sketches')
+
+  def test_import_age(self):
+    self._check_import('terra_widgets.age')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+"""Tests for the ObjectCache class."""
+
+import os
+import tempfile
+import unittest
+
+from terra_widgets.object_cache import ObjectCache
+
+PATH = 'gs://fc-fake-bucket/reports/a@x.org/20200701/120000/test1.html'
+
+
+class TestObjectCache(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.fetches = []
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _fetch(self, path):
+    self.fetches.append(path)
+    return f'contents of {path}'.encode('utf-8')
+
+  def test_hits_and_misses(self):
+    cache = ObjectCache(cache_dir=self.tmpdir.name)
+    first = cache.get_or_fetch(PATH, 1, self._fetch)
+    second = cache.get_or_fetch(PATH, 1, self._fetch)
+    self.assertEqual(first, second)
+    self.assertListEqual(self.fetches, [PATH])
+    stats = cache.stats
+    self.assertEqual((stats.hits, stats.misses, stats.num_objects), (1, 1, 1))
+    self.assertEqual(stats.size_bytes, len(first))
+
+  def test_new_generation(self):
+    cache = ObjectCache(cache_dir=self.tmpdir.name)
+    cache.get_or_fetch(PATH, 1, self._fetch)
+    cache.get_or_fetch(PATH, 2, self._fetch)
+    self.assertListEqual(self.fetches, [PATH, PATH])
+
+  def test_unknown_generation_is_not_cached(self):
+    cache = ObjectCache(cache_dir=self.tmpdir.name)
+    cache.get_or_fetch(PATH, None, self._fetch)
+    cache.get_or_fetch(PATH, None, self._fetch)
+    self.assertEqual(len(self.fetches), 2)
+    self.assertEqual(cache.stats.num_objects, 0)
+
+  def test_lru_eviction(self):
+    cache = ObjectCache(cache_dir=self.tmpdir.name, max_bytes=250)
+    paths = [f'{PATH}.{i}' for i in range(4)]  # Each object is a little over 70 bytes.
+    for path in paths[:3]:
+      cache.get_or_fetch(path, 1, self._fetch)
+    cache.get_or_fetch(paths[0], 1, self._fetch)  # Now paths[1] is the least recently used.
+    cache.get_or_fetch(paths[3], 1, self._fetch)
+    self.assertIsNone(cache.get(paths[1], 1))
+    for path in [paths[0], paths[2], paths[3]]:
+      self.assertIsNotNone(cache.get(path, 1))
+    self.assertEqual(cache.stats.evictions, 1)
+    self.assertLessEqual(cache.stats.size_bytes, 250)
+    self.assertEqual(len(os.listdir(self.tmpdir.name)), 3)
+
+  def test_shared_across_instances(self):
+    ObjectCache(cache_dir=self.tmpdir.name).get_or_fetch(PATH, 1, self._fetch)
+    cache = ObjectCache(cache_dir=self.tmpdir.name)
+    self.assertEqual(cache.stats.num_objects, 1)
+    cache.get_or_fetch(PATH, 1, self._fetch)
+    self.assertListEqual(self.fetches, [PATH])
+    self.assertEqual(cache.stats.hits, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,487 @@
+"""Tests for rendering the SQL snippets with query parameters and caching their results."""
+
+import datetime
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from terra_widgets import query_runner
+from terra_widgets.query_runner import BigQueryEngine
+from terra_widgets.query_runner import QueryRunner
+from terra_widgets.tests import cdr_fixtures
+
+CDR = 'fake-project.fake_cdr'
+COHORT_QUERY = f'SELECT person_id FROM `{CDR}.person` WHERE person_id <= 1002'
+
+
+class TestRenderQuery(unittest.TestCase):
+
+  def test_placeholders(self):
+    sql = cdr_fixtures.read_sql_snippet('measurement_of_interest.sql')
+    query = query_runner.render_query(
+        sql, {'CDR': CDR, 'COHORT_QUERY': COHORT_QUERY, 'MEASUREMENT_CONCEPT_ID': 123, 'UNIT_CONCEPT_ID': 456},
+        BigQueryEngine)
+    self.assertIn(f'`{CDR}.measurement`', query.sql)
+    self.assertIn(f'person_id IN ({COHORT_QUERY})', query.sql)
+    self.assertIn('measurement_concept_id = @MEASUREMENT_CONCEPT_ID', query.sql)
+    self.assertIn('unit_concept_id = @UNIT_CONCEPT_ID', query.sql)
+    self.assertDictEqual(query.parameters, {'MEASUREMENT_CONCEPT_ID': 123, 'UNIT_CONCEPT_ID': 456})
+
+  def test_placeholder_in_string_literal(self):
+    query = query_runner.render_query(
+        'SELECT REGEXP_CONTAINS(name, r"(?i){PATTERN}") AS a, "{ID}-x" AS b, \'{{}}\' AS c',
+        {'PATTERN': 'hemo', 'ID': 7}, BigQueryEngine)
+    self.assertEqual(query.sql, 'SELECT REGEXP_CONTAINS(name, CONCAT(r"(?i)", @PATTERN)) AS a, '
+                                'CONCAT(CAST(@ID AS STRING), "-x") AS b, \'{}\' AS c')
+    self.assertDictEqual(query.parameters, {'PATTERN': 'hemo', 'ID': 7})
+
+  def test_comments_are_kept(self):
+    query = query_runner.render_query('-- Count the rows of {CDR}\nSELECT COUNT(1) FROM `{CDR}.person`',
+                                      {'CDR': CDR}, BigQueryEngine)
+    self.assertEqual(query.sql, f'-- Count the rows of {{CDR}}\nSELECT COUNT(1) FROM `{CDR}.person`')
+
+  def test_missing_value(self):
+    with self.assertRaisesRegex(ValueError, 'UNIT_CONCEPT_ID'):
+      query_runner.render_query('SELECT {UNIT_CONCEPT_ID}', {}, BigQueryEngine)
+
+  def test_cdr_is_not_a_dataset(self):
+    with self.assertRaisesRegex(ValueError, 'not a dataset path'):
+      query_runner.render_query('SELECT * FROM `{CDR}.person`', {'CDR': 'x`; DROP TABLE y; --'}, BigQueryEngine)
+
+  def test_parameter_in_identifier(self):
+    with self.assertRaisesRegex(ValueError, 'identifier'):
+      query_runner.render_query('SELECT * FROM `{CDR}.{TABLE}`', {'CDR': CDR, 'TABLE': 'person'}, BigQueryEngine)
+
+  def test_cohort(self):
+    sql = 'SELECT COUNT(1) FROM `{CDR}.person` WHERE person_id IN ({COHORT_QUERY})'
+    cohort = query_runner.Cohort(query=COHORT_QUERY, table='project.dataset.cohort', num_people=2, person_ids=None)
+    query = query_runner.render_query(sql, {'CDR': CDR, 'COHORT_QUERY': cohort}, BigQueryEngine)
+    self.assertIn('person_id IN (SELECT person_id FROM `project.dataset.cohort`)', query.sql)
+    self.assertDictEqual(query.parameters, {})
+    cohort = cohort._replace(table=None, person_ids=(1001, 1002))
+    query = query_runner.render_query(sql, {'CDR': CDR, 'COHORT_QUERY': cohort}, BigQueryEngine)
+    self.assertIn('person_id IN (SELECT person_id FROM UNNEST(@COHORT_QUERY) AS person_id)', query.sql)
+    self.assertDictEqual(query.parameters, {'COHORT_QUERY': [1001, 1002]})
+    with self.assertRaisesRegex(ValueError, 'string literal'):
+      query_runner.render_query('SELECT "{COHORT_QUERY}"', {'COHORT_QUERY': cohort}, BigQueryEngine)
+
+  def test_to_query_parameter(self):
+    self.assertDictEqual(query_runner.to_query_parameter('A', 3004410),
+                         {'name': 'A', 'parameterType': {'type': 'INT64'}, 'parameterValue': {'value': '3004410'}})
+    self.assertEqual(query_runner.to_query_parameter('A', True)['parameterValue']['value'], 'true')
+    self.assertEqual(query_runner.to_query_parameter('A', 1.5)['parameterType']['type'], 'FLOAT64')
+    self.assertEqual(query_runner.to_query_parameter('A', datetime.date(2020, 1, 2))['parameterValue']['value'],
+                     '2020-01-02')
+    self.assertDictEqual(query_runner.to_query_parameter('A', ['x', 'y']),
+                         {'name': 'A',
+                          'parameterType': {'type': 'ARRAY', 'arrayType': {'type': 'STRING'}},
+                          'parameterValue': {'arrayValues': [{'value': 'x'}, {'value': 'y'}]}})
+    with self.assertRaises(TypeError):
+      query_runner.to_query_parameter('A', object())
+
+  def test_cache_key(self):
+    def get_key(sql, **values):
+      return query_runner.get_cache_key(query_runner.render_query(sql, values, BigQueryEngine), CDR, 'bigquery')
+
+    key = get_key('SELECT a FROM t WHERE b = {B}', B=1)
+    self.assertEqual(key, get_key('-- A comment.\nSELECT a\n  FROM t\n  WHERE b = {B}  # Another.\n', B=1))
+    self.assertNotEqual(key, get_key('SELECT a FROM t WHERE b = {B}', B=2))
+    self.assertNotEqual(key, get_key('SELECT a FROM t WHERE b = {B}', B='1'))
+    self.assertNotEqual(get_key("SELECT 'a  b'"), get_key("SELECT 'a b'"))
+
+
+class TestDuckDBTranslation(unittest.TestCase):
+
+  def test_identifiers(self):
+    self.assertEqual(query_runner.DuckDBEngine.translate(f'SELECT * EXCEPT(a) FROM `{CDR}.person`'),
+                     f'SELECT * EXCLUDE(a) FROM "{CDR}"."person"')
+
+  def test_string_literals(self):
+    translate = query_runner.DuckDBEngine.translate
+    self.assertEqual(translate("SELECT 'a', \"it's\", r\"\\d+\""), "SELECT 'a', 'it''s', '\\d+'")
+    self.assertEqual(translate('SELECT "a\\tb"'), "SELECT E'a\\tb'")
+
+  def test_regexp_contains(self):
+    self.assertEqual(query_runner.DuckDBEngine.translate('WHERE REGEXP_CONTAINS(name, r"(?i)hemo")'),
+                     "WHERE regexp_matches(name, '(?i)hemo')")
+
+  def test_aggregate_functions(self):
+    self.assertEqual(
+        query_runner.DuckDBEngine.translate('SELECT COUNTIF(x IS NULL), APPROX_QUANTILES(value_as_number, 4) FROM t'),
+        'SELECT count_if(x IS NULL), quantile_disc(value_as_number, [0.0, 0.25, 0.5, 0.75, 1.0]) FROM t')
+
+  def test_unnest(self):
+    self.assertEqual(query_runner.DuckDBEngine.translate('SELECT person_id FROM UNNEST($ids) AS person_id'),
+                     'SELECT person_id FROM UNNEST($ids) AS person_id(person_id)')
+
+
+class CountingEngine(query_runner.DuckDBEngine):
+  """Count the queries which reach the engine."""
+
+  def __init__(self, connection):
+    super().__init__(connection)
+    self.num_queries = 0
+
+  def execute(self, sql, parameters, batch_size=query_runner.DEFAULT_BATCH_SIZE):
+    self.num_queries += 1
+    # Use small batches so that results span several of them.
+    return super().execute(sql, parameters, batch_size=2)
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'DuckDB is not installed.')
+class TestQueryRunner(unittest.TestCase):
+
+  def setUp(self):
+    import duckdb  # pylint: disable=import-outside-toplevel
+
+    connection = duckdb.connect()
+    cdr_fixtures.create_tables(connection, CDR, cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    self.engine = CountingEngine(connection)
+    self.cache_dir = tempfile.TemporaryDirectory()
+    self.runner = QueryRunner(engine=self.engine, cache_dir=self.cache_dir.name)
+
+  def tearDown(self):
+    self.cache_dir.cleanup()
+
+  def _run(self, file_name, **kwargs):
+    return self.runner.run(cdr_fixtures.read_sql_snippet(file_name), CDR=CDR, COHORT_QUERY=COHORT_QUERY, **kwargs)
+
+  def test_measurement_of_interest(self):
+    df = self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    # The expected values of measurement_of_interest_test.py.
+    self.assertListEqual(df['person_id'].tolist(), [1001, 1001, 1001, 1002, 1002])
+    self.assertListEqual(df['sex_at_birth'].tolist(), ['MALE', 'MALE', 'MALE', 'FEMALE', 'FEMALE'])
+    self.assertListEqual(df['src_id'].tolist(), ['EHR site1', 'EHR site1', 'PPI/PM', 'EHR site2', 'EHR site2'])
+    self.assertListEqual(df['value_as_number'].fillna(-1).tolist(), [42.0, 13.5, -1, -1, 7.2])
+    self.assertNotIn('measurement_id', df.columns)
+
+  def test_results_are_cached(self):
+    first = self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    second = self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    pd.testing.assert_frame_equal(first, second)
+    self.assertEqual(self.engine.num_queries, 1)
+    self.assertEqual(self.runner.stats, query_runner.CacheStats(hits=1, misses=1))
+
+    # Different parameters are a different query.
+    self.assertEqual(len(self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=0)), 0)
+    self.assertEqual(self.engine.num_queries, 2)
+
+  def test_cache_can_be_bypassed(self):
+    for _ in range(2):
+      self.assertEqual(self._run('total_number_of_participants.sql', use_cache=False)
+                       ['total_number_of_participants'][0], 2)
+    self.assertEqual(self.engine.num_queries, 2)
+    self.runner.run('SELECT 1 AS a', CDR=CDR)
+    self.runner.clear_cache()
+    self.runner.run('SELECT 1 AS a', CDR=CDR)
+    self.assertEqual(self.engine.num_queries, 4)
+
+  def test_cache_size_limit(self):
+    self.runner.max_bytes = 1
+    self.runner.run('SELECT {X} AS a', X=1)
+    self.runner.run('SELECT {X} AS a', X=2)
+    self.runner.run('SELECT {X} AS a', X=2)
+    self.runner.run('SELECT {X} AS a', X=1)
+    # Only the most recent result is kept.
+    self.assertEqual(self.engine.num_queries, 3)
+
+  def test_dtypes(self):
+    for use_cache in (True, False):
+      df = self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456,
+                     use_cache=use_cache)
+      self.assertIsInstance(df['sex_at_birth'].dtype, pd.CategoricalDtype)
+      self.assertIsInstance(df['src_id'].dtype, pd.CategoricalDtype)
+      self.assertListEqual(sorted(df['src_id'].cat.categories), ['EHR site1', 'EHR site2', 'PPI/PM'])
+      self.assertTrue(pd.api.types.is_datetime64_dtype(df['measurement_date']))
+      self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['measurement_datetime']))
+      self.assertEqual(df['measurement_date'][0], pd.Timestamp(2005, 12, 31))
+
+  def test_empty_result(self):
+    df = self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=0, UNIT_CONCEPT_ID=0)
+    self.assertEqual(len(df), 0)
+    self.assertIn('value_as_number', df.columns)
+
+  def test_download(self):
+    destination = os.path.join(self.cache_dir.name, 'measurement_of_interest.parquet')
+    num_rows = self.runner.download(cdr_fixtures.read_sql_snippet('measurement_of_interest.sql'), destination,
+                                    CDR=CDR, COHORT_QUERY=COHORT_QUERY, MEASUREMENT_CONCEPT_ID=123,
+                                    UNIT_CONCEPT_ID=456)
+    self.assertEqual(num_rows, 5)
+    self.assertListEqual(pd.read_parquet(destination, columns=['person_id'])['person_id'].tolist(),
+                         [1001, 1001, 1001, 1002, 1002])
+    self.assertEqual(self.engine.num_queries, 1)
+
+  def test_download_from_cache(self):
+    self.runner.run('SELECT {X} AS a', X=1)
+    destination = os.path.join(self.cache_dir.name, 'a.parquet')
+    self.assertEqual(self.runner.download('SELECT {X} AS a', destination, X=1), 1)
+    self.assertEqual(pd.read_parquet(destination)['a'][0], 1)
+    self.assertEqual(self.engine.num_queries, 1)
+
+  def test_query_log(self):
+    self._run('total_number_of_participants.sql')
+    self._run('total_number_of_participants.sql')
+    self.assertEqual(len(self.runner.query_log), 2)
+    first, second = self.runner.query_log
+    self.assertEqual(first.description, 'Compute the count of unique participants in our All of Us cohort.')
+    self.assertEqual(first.num_rows, 1)
+    self.assertFalse(first.from_cache)
+    self.assertIsNone(first.bytes_processed)  # DuckDB does not report it.
+    self.assertTrue(second.from_cache)
+    self.assertEqual(second.bytes_processed, 0)
+    self.assertIsNone(self.runner.estimate_bytes_processed('SELECT 1'))
+
+  def test_shared_runner(self):
+    query_runner.set_query_runner(self.runner)
+    try:
+      self.assertEqual(query_runner.run_query('SELECT {X} AS a', X=5)['a'][0], 5)
+    finally:
+      query_runner.set_query_runner(None)
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'DuckDB is not installed.')
+class TestMeasurementExtract(unittest.TestCase):
+
+  def setUp(self):
+    import duckdb  # pylint: disable=import-outside-toplevel
+
+    self.connection = duckdb.connect()
+    cdr_fixtures.create_tables(self.connection, CDR, cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    # Add measurements which are not of interest.
+    self.connection.execute(f'''
+INSERT INTO "{CDR}"."concept" VALUES (124, 'Glucose');
+INSERT INTO "{CDR}"."measurement"
+SELECT measurement_id + 100, person_id, 124, unit_concept_id, operator_concept_id, measurement_date,
+       measurement_datetime, measurement_type_concept_id, value_as_number, value_as_concept_id, range_low, range_high
+FROM "{CDR}"."measurement";
+''')
+    self.cache_dir = tempfile.TemporaryDirectory()
+    self.runner = QueryRunner(engine=query_runner.DuckDBEngine(self.connection), cache_dir=self.cache_dir.name,
+                              use_cache=False)
+    query_runner.set_query_runner(self.runner)
+    self.values = {'CDR': CDR, 'COHORT_QUERY': COHORT_QUERY}
+
+  def tearDown(self):
+    query_runner.set_query_runner(None)
+    self.cache_dir.cleanup()
+
+  def _run(self, file_name, **values):
+    return self.runner.run(cdr_fixtures.read_sql_snippet(file_name), **dict(self.values, **values))
+
+  def test_extract(self):
+    extract = query_runner.extract_measurements_of_interest(MEASUREMENT_OF_INTEREST='hemo', **self.values)
+    self.assertEqual(self.connection.execute(f'SELECT COUNT(*) FROM "extracts"."{extract.table.split(".")[1]}"')
+                     .fetchone()[0], 5)
+    self.assertEqual(extract.covered_values, {'MEASUREMENT_CONCEPT_ID': frozenset([123])})
+    self.assertEqual(self.runner.query_log[0].num_rows, 5)
+
+  def test_queries_read_the_extract(self):
+    for file_name in ('measurement_of_interest.sql', 'most_recent_measurement_of_interest.sql'):
+      for concept_id in (123, 124):
+        self.runner.clear_extracts()
+        expected = self._run(file_name, MEASUREMENT_CONCEPT_ID=concept_id, UNIT_CONCEPT_ID=456)
+        self.assertIsNone(self.runner.query_log[-1].extract)
+        extract = query_runner.extract_measurements_of_interest(MEASUREMENT_OF_INTEREST='hemo', **self.values)
+        actual = self._run(file_name, MEASUREMENT_CONCEPT_ID=concept_id, UNIT_CONCEPT_ID=456)
+        pd.testing.assert_frame_equal(actual, expected)
+        # Glucose is not in the extract, so it is read from the whole table.
+        self.assertEqual(self.runner.query_log[-1].extract, extract.table if concept_id == 123 else None)
+
+  def test_queries_which_cannot_read_the_extract(self):
+    query_runner.extract_measurements_of_interest(MEASUREMENT_OF_INTEREST='hemo', **self.values)
+    # Not restricted to the measurements of interest.
+    self._run('number_of_participants_with_measurements.sql')
+    self.assertIsNone(self.runner.query_log[-1].extract)
+    # A different cohort.
+    self._run('measurement_of_interest.sql', MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456,
+              COHORT_QUERY=f'SELECT person_id FROM `{CDR}.person`')
+    self.assertIsNone(self.runner.query_log[-1].extract)
+    self.assertEqual(len(query_runner.get_query_log()), 3)
+
+
+def _to_rows(df):
+  """Convert the dataframe to tuples of the values which bq_test_case compares."""
+  rows = []
+  for row in df.astype(object).itertuples(index=False):
+    values = []
+    for value in row:
+      if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime() if value.tzinfo is not None else value.date()
+      elif isinstance(value, np.ndarray):
+        value = value.tolist()
+      elif pd.isna(value):
+        value = None
+      values.append(value)
+    rows.append(tuple(values))
+  return rows
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'DuckDB is not installed.')
+class TestParquetCDR(unittest.TestCase):
+  """Run the SQL snippets on tables exported as Parquet, checking the expectations of their BigQuery tests."""
+
+  def setUp(self):
+    import duckdb  # pylint: disable=import-outside-toplevel
+
+    self.connection = duckdb.connect()
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.cache_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+    self.cache_dir.cleanup()
+
+  def _get_runner(self, tables):
+    cdr_fixtures.write_parquet_tables(self.connection, self.tmpdir.name, tables)
+    engine = query_runner.DuckDBEngine.from_parquet(self.tmpdir.name, CDR)
+    return QueryRunner(engine=engine, cache_dir=self.cache_dir.name)
+
+  def _assert_rows_equal(self, actual, expected):
+    self.assertEqual(len(actual), len(expected))
+    for actual_row, expected_row in zip(actual, expected):
+      self.assertEqual(len(actual_row), len(expected_row))
+      for actual_value, expected_value in zip(actual_row, expected_row):
+        if isinstance(expected_value, float):
+          self.assertAlmostEqual(actual_value, expected_value)
+        else:
+          self.assertEqual(actual_value, expected_value)
+
+  def test_measurement_of_interest(self):
+    runner = self._get_runner(cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    df = runner.run(cdr_fixtures.read_sql_snippet('measurement_of_interest.sql'), CDR=CDR, COHORT_QUERY=COHORT_QUERY,
+                    MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    birth_1001 = datetime.datetime(1990, 12, 31, tzinfo=datetime.timezone.utc)
+    birth_1002 = datetime.datetime(1950, 8, 1, tzinfo=datetime.timezone.utc)
+    # The expected values of measurement_of_interest_test.py.
+    self._assert_rows_equal(_to_rows(df), [
+        (1001, birth_1001, 'MALE', 'EHR site1', 123, datetime.date(2005, 12, 31),
+         datetime.datetime(2005, 12, 31, 10, 30, tzinfo=datetime.timezone.utc), None, None, 42.0, None, 456, 0, 999),
+        (1001, birth_1001, 'MALE', 'EHR site1', 123, datetime.date(2007, 9, 11),
+         datetime.datetime(2007, 9, 11, 8, 0, tzinfo=datetime.timezone.utc), None, None, 13.5, None, 456, 0, 999),
+        (1001, birth_1001, 'MALE', 'PPI/PM', 123, datetime.date(2007, 9, 11),
+         datetime.datetime(2007, 9, 11, 20, 59, tzinfo=datetime.timezone.utc), None, None, None, 100, 456, 0, 999),
+        (1002, birth_1002, 'FEMALE', 'EHR site2', 123, datetime.date(2008, 2, 10),
+         datetime.datetime(2008, 2, 10, 23, 30, tzinfo=datetime.timezone.utc), None, None, None, None, 456, 0, 999),
+        (1002, birth_1002, 'FEMALE', 'EHR site2', 123, datetime.date(2008, 2, 10),
+         datetime.datetime(2008, 2, 10, 23, 30, tzinfo=datetime.timezone.utc), None, 789, 7.2, None, 456, 0, 999),
+    ])
+
+  def test_most_recent_measurement_of_interest(self):
+    runner = self._get_runner(cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    df = runner.run(cdr_fixtures.read_sql_snippet('most_recent_measurement_of_interest.sql'), CDR=CDR,
+                    COHORT_QUERY=COHORT_QUERY, MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    # The expected values of most_recent_measurement_of_interest_test.py.
+    self._assert_rows_equal(_to_rows(df), [
+        (1001, datetime.datetime(1990, 12, 31, tzinfo=datetime.timezone.utc), 'MALE', 'PPI/PM', 123, 456,
+         datetime.date(2007, 9, 11), datetime.datetime(2007, 9, 11, 20, 59, tzinfo=datetime.timezone.utc),
+         None, None, None, 100, 0, 999),
+        (1002, datetime.datetime(1950, 8, 1, tzinfo=datetime.timezone.utc), 'FEMALE', 'EHR site2', 123, 456,
+         datetime.date(2008, 2, 10), datetime.datetime(2008, 2, 10, 23, 30, tzinfo=datetime.timezone.utc),
+         None, 789, 7.2, None, 0, 999),
+    ])
+
+  def test_measurements_of_interest_summary(self):
+    runner = self._get_runner(cdr_fixtures.MEASUREMENTS_OF_INTEREST_SUMMARY_TABLES)
+    df = runner.run(cdr_fixtures.read_sql_snippet('measurements_of_interest_summary.sql'), CDR=CDR,
+                    COHORT_QUERY=COHORT_QUERY, MEASUREMENT_OF_INTEREST='hemoglobin')
+    # The expected values of measurements_of_interest_summary_test.py.
+    self._assert_rows_equal(_to_rows(df), [
+        ('Hemoglobin', 'gram per deciliter', 5, 1, 7.2, 42.0, 20.9, 18.542653531789888,
+         [7.2, 7.2, 13.5, 42.0, 42.0], 3, 1, 1, 'EHR', 123, 456),
+    ])
+
+  def test_results_are_cached_until_the_files_change(self):
+    runner = self._get_runner(cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    sql = cdr_fixtures.read_sql_snippet('total_number_of_participants.sql')
+    self.assertEqual(runner.run(sql, CDR=CDR, COHORT_QUERY=COHORT_QUERY).iloc[0, 0], 2)
+    self.assertEqual(runner.run(sql, CDR=CDR, COHORT_QUERY=COHORT_QUERY).iloc[0, 0], 2)
+    self.assertEqual(runner.stats.hits, 1)
+    tables = dict(cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES,
+                  person='SELECT 1001::BIGINT AS person_id, NULL::TIMESTAMPTZ AS birth_datetime')
+    runner = self._get_runner(tables)
+    self.assertEqual(runner.run(sql, CDR=CDR, COHORT_QUERY=COHORT_QUERY).iloc[0, 0], 1)
+
+  def test_no_parquet_files(self):
+    with self.assertRaisesRegex(ValueError, 'no Parquet files'):
+      query_runner.DuckDBEngine.from_parquet(self.tmpdir.name, CDR)
+
+
+class RecordingEngine(query_runner.DuckDBEngine):
+  """Record the queries which reach the engine."""
+
+  def __init__(self, connection):
+    super().__init__(connection)
+    self.queries = []
+
+  def execute(self, sql, parameters, batch_size=query_runner.DEFAULT_BATCH_SIZE):
+    self.queries.append(sql)
+    return super().execute(sql, parameters, batch_size=batch_size)
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'DuckDB is not installed.')
+class TestCohort(unittest.TestCase):
+
+  def setUp(self):
+    import duckdb  # pylint: disable=import-outside-toplevel
+
+    connection = duckdb.connect()
+    cdr_fixtures.create_tables(connection, CDR, cdr_fixtures.MEASUREMENT_OF_INTEREST_TABLES)
+    self.engine = RecordingEngine(connection)
+    self.cache_dir = tempfile.TemporaryDirectory()
+    self.runner = QueryRunner(engine=self.engine, cache_dir=self.cache_dir.name, use_cache=False)
+    query_runner.set_query_runner(self.runner)
+
+  def tearDown(self):
+    query_runner.set_query_runner(None)
+    self.cache_dir.cleanup()
+
+  def _run(self, file_name, cohort, **values):
+    return self.runner.run(cdr_fixtures.read_sql_snippet(file_name), CDR=CDR, COHORT_QUERY=cohort, **values)
+
+  def test_create_cohort(self):
+    cohort = query_runner.materialize_cohort(COHORT_QUERY)
+    self.assertEqual(cohort.num_people, 2)
+    self.assertIsNone(cohort.person_ids)
+    self.assertTrue(cohort.table.startswith('extracts.cohort_'))
+    cohort = query_runner.materialize_cohort(cohort, as_array=True)
+    self.assertEqual(cohort.query, COHORT_QUERY)
+    self.assertIsNone(cohort.table)
+    self.assertTupleEqual(cohort.person_ids, (1001, 1002))
+    self.assertListEqual([entry.num_rows for entry in self.runner.query_log], [2, 2])
+
+  def test_snippets_read_the_cohort(self):
+    snippets = [('measurement_of_interest.sql', {'MEASUREMENT_CONCEPT_ID': 123, 'UNIT_CONCEPT_ID': 456}),
+                ('most_recent_measurement_of_interest.sql', {'MEASUREMENT_CONCEPT_ID': 123, 'UNIT_CONCEPT_ID': 456}),
+                ('total_number_of_participants.sql', {}),
+                ('number_of_participants_with_measurements.sql', {})]
+    for as_array in (False, True):
+      cohort = self.runner.create_cohort(COHORT_QUERY, as_array=as_array)
+      for file_name, values in snippets:
+        expected = self._run(file_name, COHORT_QUERY, **values)
+        actual = self._run(file_name, cohort, **values)
+        pd.testing.assert_frame_equal(actual, expected)
+        # The cohort query is not evaluated again.
+        self.assertNotIn('person_id <= 1002', self.engine.queries[-1])
+
+  def test_cohort_shares_the_cache_of_its_query(self):
+    sql = cdr_fixtures.read_sql_snippet('total_number_of_participants.sql')
+    expected = self.runner.run(sql, use_cache=True, CDR=CDR, COHORT_QUERY=COHORT_QUERY)
+    for as_array in (False, True):
+      cohort = self.runner.create_cohort(COHORT_QUERY, as_array=as_array)
+      pd.testing.assert_frame_equal(self.runner.run(sql, use_cache=True, CDR=CDR, COHORT_QUERY=cohort), expected)
+      self.assertTrue(self.runner.query_log[-1].from_cache)
+
+  def test_extract_for_cohort(self):
+    cohort = self.runner.create_cohort(COHORT_QUERY)
+    extract = query_runner.extract_measurements_of_interest(CDR=CDR, COHORT_QUERY=cohort,
+                                                            MEASUREMENT_OF_INTEREST='hemo')
+    df = self._run('measurement_of_interest.sql', cohort, MEASUREMENT_CONCEPT_ID=123, UNIT_CONCEPT_ID=456)
+    self.assertEqual(self.runner.query_log[-1].extract, extract.table)
+    self.assertListEqual(df['person_id'].tolist(), [1001, 1001, 1001, 1002, 1002])
+
+
+if __name__ == '__main__':
+  unittest.main()
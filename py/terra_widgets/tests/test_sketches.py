@@ -0,0 +1,56 @@
+"""Tests for the distinct count and quantile sketches."""
+
+import unittest
+
+import numpy as np
+from terra_widgets import sketches
+
+
+class TestDistinctCounts(unittest.TestCase):
+
+  def test_estimate(self):
+    rng = np.random.default_rng(0)
+    registers = sketches.new_registers(3)
+    for sketch_id, num_values in enumerate([10, 5000, 200000]):
+      values = rng.permutation(np.repeat(np.arange(num_values, dtype=np.uint64), 3))
+      hashes = values * np.uint64(0x9E3779B97F4A7C15)
+      hashes ^= hashes >> np.uint64(29)
+      hashes *= np.uint64(0xBF58476D1CE4E5B9)
+      hashes ^= hashes >> np.uint64(32)
+      sketches.update_registers(registers, hashes, np.full(len(values), sketch_id))
+    estimates = sketches.estimate_cardinality(registers)
+    self.assertEqual(round(estimates[0]), 10)
+    np.testing.assert_allclose(estimates[1:], [5000, 200000], rtol=0.03)
+
+  def test_empty(self):
+    np.testing.assert_array_equal(sketches.estimate_cardinality(sketches.new_registers(2)), [0, 0])
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+  def test_quantiles(self):
+    rng = np.random.default_rng(0)
+    values = rng.exponential(10, 500000)
+    sketch = sketches.QuantileSketch()
+    # Sorted chunks of different sizes are the hardest case for an evenly spaced sample.
+    for chunk in np.array_split(np.sort(values), [1000, 100000, 101000, 300000]):
+      sketch.update(chunk.copy())
+    probabilities = [0, 0.05, 0.25, 0.5, 0.75, 0.95, 1]
+    estimates = sketch.quantiles(probabilities)
+    # The rank of each estimate is within 1/1000 of the rank it should have.
+    ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+    np.testing.assert_allclose(ranks, probabilities, atol=1 / sketches.QUANTILE_RESOLUTION)
+    self.assertEqual(sketch.count, len(values))
+
+  def test_small(self):
+    sketch = sketches.QuantileSketch()
+    sketch.update(np.array([3.0, 1.0, 2.0]))
+    sketch.update(np.array([4.0]))
+    np.testing.assert_allclose(sketch.quantiles([0.5]), np.quantile([1.0, 2.0, 3.0, 4.0], [0.5]))
+
+  def test_empty(self):
+    self.assertTrue(np.isnan(sketches.QuantileSketch().quantiles([0.5])).all())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,115 @@
+"""Tests for the SnapshotIndex class."""
+
+import os
+import tempfile
+import unittest
+
+from terra_widgets.snapshot_index import SnapshotIndex
+from terra_widgets.snapshot_manifest import SnapshotManifest
+from terra_widgets.storage import InMemoryBackend
+from terra_widgets.workspace_paths import WorkspacePaths
+
+REPORTS = 'gs://fc-fake-bucket/reports'
+
+
+class CountingBackend(InMemoryBackend):
+  """Count the number of listings performed."""
+
+  def __init__(self):
+    super().__init__()
+    self.num_listings = 0
+
+  def list_objects(self, prefix, start_offset=None):
+    self.num_listings += 1
+    return super().list_objects(prefix, start_offset=start_offset)
+
+
+class TestSnapshotIndex(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 0.0
+    self.backend = CountingBackend()
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.local_file = os.path.join(self.tmpdir.name, 'file')
+    with open(self.local_file, 'w') as f:
+      f.write('contents')
+    for path in [f'{REPORTS}/a@x.org/20200701/120000/test1.html',
+                 f'{REPORTS}/a@x.org/20200701/120000/test1.comment.txt',
+                 f'{REPORTS}/a@x.org/20200701/130000/test2.html',
+                 f'{REPORTS}/a@x.org/20200702/090000/test1.html',
+                 f'{REPORTS}/b@x.org/20200601/100000/test3.html',
+                 # These do not match the layout of the HTML snapshots folder.
+                 f'{REPORTS}/README.txt',
+                 f'{REPORTS}/a@x.org/notes/test1.html',
+                 'gs://fc-fake-bucket/notebooks/test1.ipynb']:
+      self._add(path)
+    manifest = SnapshotManifest(workspace_paths=WorkspacePaths(workspace_bucket='fc-fake-bucket'),
+                                backend=self.backend,
+                                cache_dir=os.path.join(self.tmpdir.name, 'cache'))
+    self.index = SnapshotIndex(manifest=manifest,
+                               ttl_seconds=60,
+                               clock=lambda: self.now)
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _add(self, path):
+    self.backend.upload_file(self.local_file, path, content_type='text/plain')
+
+  def test_tree(self):
+    self.assertDictEqual(self.index.get_users(), {'a@x.org': f'{REPORTS}/a@x.org', 'b@x.org': f'{REPORTS}/b@x.org'})
+    self.assertListEqual(list(self.index.get_dates(f'{REPORTS}/a@x.org').items()),
+                         [('20200702', f'{REPORTS}/a@x.org/20200702'), ('20200701', f'{REPORTS}/a@x.org/20200701')])
+    self.assertListEqual(list(self.index.get_times(f'{REPORTS}/a@x.org/20200701').keys()), ['130000', '120000'])
+    self.assertDictEqual(self.index.get_files(f'{REPORTS}/a@x.org/20200701/120000'),
+                         {'test1.html': f'{REPORTS}/a@x.org/20200701/120000/test1.html'})
+    self.assertDictEqual(self.index.get_files(f'{REPORTS}/a@x.org/20200701/120000',
+                                              suffix=WorkspacePaths.COMMENT_FILE_SUFFIX),
+                         {'test1.comment.txt': f'{REPORTS}/a@x.org/20200701/120000/test1.comment.txt'})
+    self.assertDictEqual(self.index.get_dates(f'{REPORTS}/c@x.org'), {})
+    with self.assertRaisesRegex(ValueError, 'is neither'):
+      self.index.get_files(f'{REPORTS}/a@x.org/20200701/120000', suffix='.ipynb')
+    self.assertEqual(self.backend.num_listings, 1)
+
+  def test_all_files_and_generations(self):
+    self.assertListEqual(self.index.get_all_files(), [f'{REPORTS}/a@x.org/20200701/120000/test1.comment.txt'])
+    self.assertEqual(len(self.index.get_all_files(suffix=WorkspacePaths.HTML_FILE_SUFFIX)), 4)
+    self.assertEqual(self.index.get_generation(f'{REPORTS}/a@x.org/20200701/120000/test1.html'),
+                     self.backend.generations[f'{REPORTS}/a@x.org/20200701/120000/test1.html'])
+    self.assertEqual(self.index.get_generation(f'{REPORTS}/a@x.org/20200701/120000/test1.comment.txt'),
+                     self.backend.generations[f'{REPORTS}/a@x.org/20200701/120000/test1.comment.txt'])
+    self.assertIsNone(self.index.get_generation(f'{REPORTS}/a@x.org/20200701/130000/test2.comment.txt'))
+    self.assertIsNone(self.index.get_generation('gs://fc-fake-bucket/notebooks/test1.ipynb'))
+
+  def test_wrong_folder(self):
+    with self.assertRaisesRegex(ValueError, 'is not a folder 2 level'):
+      self.index.get_times(f'{REPORTS}/a@x.org')
+    with self.assertRaisesRegex(ValueError, 'is not a folder 1 level'):
+      self.index.get_dates('gs://fc-fake-bucket/notebooks')
+
+  def test_ttl(self):
+    self.index.get_users()
+    self._add(f'{REPORTS}/c@x.org/20200801/100000/test4.html')
+    self.now = 59
+    self.assertNotIn('c@x.org', self.index.get_users())
+    self.now = 61
+    self.assertIn('c@x.org', self.index.get_users())
+    # One listing of the whole folder, then one of the user folders and one per user.
+    self.assertEqual(self.backend.num_listings, 1 + 1 + 3)
+
+  def test_refresh_and_invalidate(self):
+    self.index.get_users()
+    self._add(f'{REPORTS}/c@x.org/20200801/100000/test4.html')
+    self.index.refresh()
+    self.assertIn('c@x.org', self.index.get_users())
+    self._add(f'{REPORTS}/d@x.org/20200801/100000/test5.html')
+    self.index.invalidate()
+    self.assertIn('d@x.org', self.index.get_users())
+    self.assertEqual(self.backend.num_listings, 1 + (1 + 3) + (1 + 4))
+    # A full refresh lists the whole folder once.
+    self.index.refresh(full=True)
+    self.assertEqual(self.backend.num_listings, 1 + (1 + 3) + (1 + 4) + 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,109 @@
+"""Tests for the SnapshotManifest class."""
+
+import os
+import tempfile
+import unittest
+
+from terra_widgets.snapshot_manifest import SnapshotEntry
+from terra_widgets.snapshot_manifest import SnapshotManifest
+from terra_widgets.storage import InMemoryBackend
+from terra_widgets.workspace_paths import WorkspacePaths
+
+REPORTS = 'gs://fc-fake-bucket/reports'
+
+
+class RecordingBackend(InMemoryBackend):
+  """Record the listings performed and the number of objects returned by them."""
+
+  def __init__(self):
+    super().__init__()
+    self.listings = []
+
+  def list_objects(self, prefix, start_offset=None):
+    infos = list(super().list_objects(prefix, start_offset=start_offset))
+    self.listings.append((prefix, start_offset, len(infos)))
+    return iter(infos)
+
+
+class TestSnapshotManifest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+    self.backend = RecordingBackend()
+    self.workspace_paths = WorkspacePaths(workspace_bucket='fc-fake-bucket')
+    self._add_snapshot('a@x.org', '20200701', '120000', 'test1')
+    self._add_snapshot('a@x.org', '20200702', '090000', 'test1')
+    self._add_snapshot('b@x.org', '20200601', '100000', 'test2')
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _add_snapshot(self, user, date, time, notebook):
+    folder = f'{REPORTS}/{user}/{date}/{time}'
+    self.backend.upload_data(b'<html></html>', f'{folder}/{notebook}.html', content_type='text/html')
+    self.backend.upload_data(b'a comment', f'{folder}/{notebook}.comment.txt', content_type='text/plain')
+
+  def _manifest(self, cache_dir=None, store_in_bucket=False):
+    return SnapshotManifest(workspace_paths=self.workspace_paths,
+                            backend=self.backend,
+                            cache_dir=cache_dir or self.cache_dir,
+                            store_in_bucket=store_in_bucket)
+
+  def test_first_refresh_is_a_single_listing(self):
+    manifest = self._manifest()
+    self.assertEqual(manifest.refresh(), 3)
+    self.assertListEqual(self.backend.listings, [(f'{REPORTS}/', None, 6)])
+    entry = manifest.entries[0]
+    self.assertEqual(entry, SnapshotEntry(user='a@x.org', date='20200701', time='120000', notebook='test1',
+                                          html_size=13, html_generation=1, comment_size=9, comment_generation=2))
+    self.assertTrue(os.path.isfile(manifest.local_file))
+
+  def test_incremental_refresh(self):
+    self._manifest().refresh()
+    self.backend.listings = []
+    self._add_snapshot('a@x.org', '20200703', '080000', 'test1')
+    self._add_snapshot('c@x.org', '20200801', '100000', 'test3')
+
+    # A new kernel loads the cached manifest and then only lists what is new.
+    manifest = self._manifest()
+    self.assertEqual(manifest.refresh(), 2)
+    self.assertEqual(len(manifest.entries), 5)
+    offsets = {prefix: (start_offset, num_objects) for prefix, start_offset, num_objects in self.backend.listings
+               if start_offset or prefix != f'{REPORTS}/'}
+    self.assertDictEqual(offsets, {
+        f'{REPORTS}/a@x.org/': (f'{REPORTS}/a@x.org/20200702/090000/', 4),
+        f'{REPORTS}/b@x.org/': (f'{REPORTS}/b@x.org/20200601/100000/', 2),
+        f'{REPORTS}/c@x.org/': (None, 2)})
+
+  def test_full_refresh_notices_deletions(self):
+    manifest = self._manifest()
+    manifest.refresh()
+    del self.backend.objects[f'{REPORTS}/b@x.org/20200601/100000/test2.html']
+    del self.backend.objects[f'{REPORTS}/b@x.org/20200601/100000/test2.comment.txt']
+    manifest.refresh()
+    self.assertEqual(len(manifest.entries), 3)
+    manifest.refresh(full=True)
+    self.assertEqual(len(manifest.entries), 2)
+
+  def test_corrupt_cache(self):
+    manifest = self._manifest()
+    os.makedirs(self.cache_dir)
+    with open(manifest.local_file, 'w') as f:
+      f.write('{"this is not')
+    self.assertFalse(manifest.load())
+    self.assertEqual(manifest.refresh(), 3)
+
+  def test_store_in_bucket(self):
+    self._manifest(store_in_bucket=True).refresh()
+    self.assertIn(f'{REPORTS}/.snapshot_manifest.json', self.backend.objects)
+
+    # Someone else using the workspace starts from the manifest in the bucket.
+    manifest = self._manifest(cache_dir=os.path.join(self.tmpdir.name, 'other_cache'), store_in_bucket=True)
+    self.assertTrue(manifest.load())
+    self.assertEqual(len(manifest.entries), 3)
+    self.assertEqual(manifest.refresh(), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
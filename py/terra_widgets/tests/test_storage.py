@@ -0,0 +1,112 @@
+"""Tests for the storage backends."""
+
+import os
+import tempfile
+import unittest
+
+from terra_widgets import storage
+
+
+class TestStorageBackends(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.local_dir = os.path.join(self.tmpdir.name, 'local')
+    self.html_file = self._write_file('test1.html', '<html>one</html>')
+    self.comment_file = self._write_file('test1.comment.txt', 'a comment')
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _write_file(self, name, contents):
+    path = os.path.join(self.tmpdir.name, name)
+    with open(path, 'w') as f:
+      f.write(contents)
+    return path
+
+  def _uploads(self):
+    return [storage.ObjectUpload(source_file=self.html_file,
+                                 destination='gs://fc-fake-bucket/reports/u@x.org/20200701/120000/test1.html',
+                                 content_type='text/html'),
+            storage.ObjectUpload(source_file=self.comment_file,
+                                 destination='gs://fc-fake-bucket/reports/u@x.org/20200701/120000/test1.comment.txt',
+                                 content_type='text/plain')]
+
+  def test_split_gcs_path(self):
+    self.assertEqual(storage.split_gcs_path('gs://fc-fake-bucket/reports/a/b.html'),
+                     ('fc-fake-bucket', 'reports/a/b.html'))
+    with self.assertRaisesRegex(ValueError, 'is not a Cloud Storage path'):
+      storage.split_gcs_path('/tmp/reports/a/b.html')
+
+  def test_incomplete_backend(self):
+
+    class ListOnlyBackend(storage.StorageBackend):
+
+      def list_objects(self, prefix, start_offset=None):
+        return iter([])
+
+    with self.assertRaises(TypeError):
+      ListOnlyBackend()
+
+  def test_in_memory_upload_files(self):
+    backend = storage.InMemoryBackend()
+    results = list(backend.upload_files(self._uploads()))
+    self.assertListEqual([r.status for r in results], [storage.UPLOADED] * 2)
+    comment = 'gs://fc-fake-bucket/reports/u@x.org/20200701/120000/test1.comment.txt'
+    self.assertEqual(backend.objects[comment], b'a comment')
+    self.assertEqual(backend.content_types[comment], 'text/plain')
+
+  def test_in_memory_no_clobber(self):
+    backend = storage.InMemoryBackend()
+    first = {r.destination: r for r in backend.upload_files(self._uploads())}
+    second = list(backend.upload_files(self._uploads()))
+    self.assertListEqual([r.status for r in second], [storage.SKIPPED] * 2)
+    third = list(backend.upload_files(self._uploads(), overwrite=True))
+    for result in third:
+      self.assertEqual(result.status, storage.UPLOADED)
+      self.assertGreater(result.generation, first[result.destination].generation)
+
+  def test_local_upload_files(self):
+    backend = storage.LocalBackend(root=self.local_dir)
+    results = list(backend.upload_files(self._uploads()))
+    self.assertListEqual([r.status for r in results], [storage.UPLOADED] * 2)
+    with open(os.path.join(self.local_dir, 'fc-fake-bucket/reports/u@x.org/20200701/120000/test1.html')) as f:
+      self.assertEqual(f.read(), '<html>one</html>')
+    self.assertListEqual([r.status for r in backend.upload_files(self._uploads())], [storage.SKIPPED] * 2)
+
+  def test_upload_failure(self):
+    backend = storage.InMemoryBackend()
+    results = list(backend.upload_files([storage.ObjectUpload(source_file=os.path.join(self.tmpdir.name, 'missing'),
+                                                              destination='gs://fc-fake-bucket/missing',
+                                                              content_type='text/plain')]))
+    self.assertEqual(results[0].status, storage.FAILED)
+    self.assertIn('FileNotFoundError', results[0].error)
+
+  def test_glob(self):
+    for backend in [storage.InMemoryBackend(), storage.LocalBackend(root=self.local_dir)]:
+      for path in ['gs://fc-fake-bucket/notebooks/test1.ipynb',
+                   'gs://fc-fake-bucket/notebooks/test2.ipynb',
+                   'gs://fc-fake-bucket/notebooks/subfolder/test3.ipynb',
+                   'gs://fc-fake-bucket/notebooks/test1.ipynb.bak',
+                   'gs://fc-other-bucket/notebooks/test4.ipynb']:
+        backend.upload_file(self.comment_file, path, content_type='application/x-ipynb+json')
+      self.assertListEqual(backend.glob('gs://fc-fake-bucket/notebooks/*.ipynb'),
+                           ['gs://fc-fake-bucket/notebooks/test1.ipynb', 'gs://fc-fake-bucket/notebooks/test2.ipynb'])
+      self.assertListEqual(backend.glob('gs://fc-fake-bucket/notebooks/*/test[0-9].ipynb'),
+                           ['gs://fc-fake-bucket/notebooks/subfolder/test3.ipynb'])
+      self.assertListEqual(backend.glob('gs://fc-fake-bucket/notebooks/test2.ipynb'),
+                           ['gs://fc-fake-bucket/notebooks/test2.ipynb'])
+
+  def test_download_file(self):
+    for backend in [storage.InMemoryBackend(), storage.LocalBackend(root=self.local_dir)]:
+      backend.upload_file(self.html_file, 'gs://fc-fake-bucket/notebooks/test1.ipynb', content_type='text/plain')
+      local_file = os.path.join(self.tmpdir.name, 'downloaded.ipynb')
+      backend.download_file('gs://fc-fake-bucket/notebooks/test1.ipynb', local_file)
+      with open(local_file) as f:
+        self.assertEqual(f.read(), '<html>one</html>')
+      with self.assertRaises(FileNotFoundError):
+        backend.download_file('gs://fc-fake-bucket/notebooks/missing.ipynb', local_file)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,172 @@
+"""Tests for summarizing the participant counts of a survey dataframe."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from terra_widgets import survey_summary
+
+
+def summarize_a_module(df, module=None, denominator=None):
+  """The previous implementation of summarize_a_survey_module.py."""
+  if module:
+    df = df[df['survey'].str.lower() == module.lower()].copy()
+  data = (df.groupby(['survey', 'question_concept_id', 'question'])['person_id'].nunique()
+          .reset_index()
+          .rename(columns={'person_id': 'n_participant'}))
+  if denominator:
+    data['response_rate'] = round(100*data['n_participant']/denominator, 2)
+  return data
+
+
+def summarize_a_question_concept_id(df, question_concept_id, denominator=None):
+  """The previous implementation of summarize_a_survey_by_question_concept_id.py, without the display."""
+  df = df.loc[df['question_concept_id'] == question_concept_id].copy()
+  new_df = (df.groupby(['answer_concept_id', 'answer'])['person_id']
+            .nunique()
+            .reset_index()
+            .rename(columns=dict(person_id='n_participant'))
+            .assign(answer_concept_id=lambda x: np.int32(x.answer_concept_id)))
+  if denominator:
+    new_df['response_rate'] = round(100*new_df['n_participant']/denominator, 2)
+  return df['question'].unique()[0], new_df
+
+
+def make_survey_df(num_rows, seed=0):
+  """Make a survey dataframe with repeated answers and some missing values."""
+  rng = np.random.default_rng(seed)
+  question_concept_ids = rng.integers(0, 12, num_rows)
+  answer_concept_ids = question_concept_ids * 10 + rng.integers(0, 4, num_rows)
+  answers = np.array([f'Answer {i}' for i in answer_concept_ids], dtype=object)
+  answers[rng.random(num_rows) < 0.05] = None
+  return pd.DataFrame({
+      'person_id': rng.integers(0, num_rows // 5, num_rows),
+      'survey': np.array(['The Basics', 'Lifestyle', 'Overall Health'], dtype=object)[question_concept_ids % 3],
+      'question_concept_id': question_concept_ids + 1585000,
+      'question': np.array([f'Question {i}?' for i in question_concept_ids], dtype=object),
+      'answer_concept_id': answer_concept_ids + 1586000,
+      'answer': answers,
+  })
+
+
+class TestSurveySummary(unittest.TestCase):
+
+  def setUp(self):
+    self.survey_df = make_survey_df(5000)
+
+  def test_summarize_module(self):
+    summarizer = survey_summary.SurveySummarizer(self.survey_df)
+    for module in (None, 'the basics', 'LIFESTYLE', 'No such module'):
+      for denominator in (None, 2000):
+        pd.testing.assert_frame_equal(summarizer.summarize_module(module, denominator),
+                                      summarize_a_module(self.survey_df, module, denominator))
+
+  def test_summarize_question(self):
+    summarizer = survey_summary.SurveySummarizer(self.survey_df)
+    for question_concept_id in self.survey_df['question_concept_id'].unique():
+      for denominator in (None, 2000):
+        question, actual = summarizer.summarize_question(question_concept_id, denominator)
+        expected_question, expected = summarize_a_question_concept_id(self.survey_df, question_concept_id,
+                                                                      denominator)
+        self.assertEqual(question, expected_question)
+        pd.testing.assert_frame_equal(actual, expected)
+
+  def test_no_such_question(self):
+    question, data = survey_summary.SurveySummarizer(self.survey_df).summarize_question(1)
+    self.assertIsNone(question)
+    self.assertEqual(len(data), 0)
+
+  def test_categorical_columns(self):
+    survey_df = self.survey_df.astype({'survey': 'category', 'question': 'category', 'answer': 'category'})
+    pd.testing.assert_frame_equal(survey_summary.SurveySummarizer(survey_df).summarize_module('Lifestyle'),
+                                  survey_summary.SurveySummarizer(self.survey_df).summarize_module('Lifestyle'))
+
+  def test_summarizer_is_reused(self):
+    summarizer = survey_summary.get_survey_summarizer(self.survey_df)
+    survey_summary.summarize_survey_module(self.survey_df, 'The Basics')
+    self.assertIs(survey_summary.get_survey_summarizer(self.survey_df), summarizer)
+    self.assertIsNot(survey_summary.get_survey_summarizer(self.survey_df.copy()), summarizer)
+
+  def test_summarizer_of_modified_dataframe(self):
+    summarizer = survey_summary.get_survey_summarizer(self.survey_df)
+    # Modified in place, as notebooks often do.
+    self.survey_df.drop(index=self.survey_df.index[self.survey_df['survey'] == 'Lifestyle'], inplace=True)
+    self.assertIsNot(survey_summary.get_survey_summarizer(self.survey_df), summarizer)
+    self.assertEqual(len(survey_summary.summarize_survey_module(self.survey_df, 'Lifestyle')), 0)
+    summarizer = survey_summary.get_survey_summarizer(self.survey_df)
+    self.survey_df.loc[self.survey_df.index[0], 'person_id'] = -1
+    self.assertIsNot(survey_summary.get_survey_summarizer(self.survey_df), summarizer)
+    pd.testing.assert_frame_equal(survey_summary.summarize_survey_module(self.survey_df),
+                                  summarize_a_module(self.survey_df))
+    summarizer = survey_summary.get_survey_summarizer(self.survey_df)
+    self.assertIs(survey_summary.get_survey_summarizer(self.survey_df), summarizer)
+    self.assertIsNot(survey_summary.get_survey_summarizer(self.survey_df, refresh=True), summarizer)
+
+
+class TestSurveySummaryFromFiles(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.survey_df = make_survey_df(20000)
+    self.survey_df.loc[::97, 'person_id'] = None
+    self.expected = survey_summary.SurveySummarizer(self.survey_df)
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _assert_counts_equal(self, summarizer):
+    pd.testing.assert_frame_equal(summarizer.question_counts, self.expected.question_counts, check_dtype=False)
+    pd.testing.assert_frame_equal(summarizer.answer_counts, self.expected.answer_counts, check_dtype=False)
+
+  def test_parquet(self):
+    path = os.path.join(self.tmpdir.name, 'survey.parquet')
+    self.survey_df.to_parquet(path)
+    self._assert_counts_equal(survey_summary.SurveySummarizer(path, batch_size=1500))
+
+  def test_csv_directory(self):
+    directory = os.path.join(self.tmpdir.name, 'survey.csv')
+    os.mkdir(directory)
+    for i, start in enumerate(range(0, len(self.survey_df), 7000)):
+      self.survey_df.iloc[start:start + 7000].to_csv(os.path.join(directory, f'{i}.csv'), index=False)
+    self._assert_counts_equal(survey_summary.SurveySummarizer(directory, batch_size=3000))
+
+  def test_csv_export_directory(self):
+    # Laid out like a BigQuery export of CSV shards to a folder in the workspace bucket.
+    directory = os.path.join(self.tmpdir.name, 'survey_export')
+    os.mkdir(directory)
+    for i, start in enumerate(range(0, len(self.survey_df), 7000)):
+      suffix = '.csv.gz' if i % 2 else '.csv'
+      self.survey_df.iloc[start:start + 7000].to_csv(os.path.join(directory, f'survey-{i:012d}{suffix}'),
+                                                     index=False)
+    open(os.path.join(directory, '_SUCCESS'), 'w').close()
+    self._assert_counts_equal(survey_summary.SurveySummarizer(directory + '/', batch_size=3000))
+
+  def test_sketch(self):
+    path = os.path.join(self.tmpdir.name, 'survey.parquet')
+    self.survey_df.to_parquet(path)
+    summarizer = survey_summary.SurveySummarizer(path, exact=False, batch_size=1500)
+    pd.testing.assert_frame_equal(summarizer.question_counts.drop(columns='n_participant'),
+                                  self.expected.question_counts.drop(columns='n_participant'), check_dtype=False)
+    np.testing.assert_allclose(summarizer.question_counts['n_participant'],
+                               self.expected.question_counts['n_participant'], rtol=0.03)
+    np.testing.assert_allclose(summarizer.answer_counts['n_participant'],
+                               self.expected.answer_counts['n_participant'], rtol=0.03)
+
+  def test_summarize_path(self):
+    path = os.path.join(self.tmpdir.name, 'survey.parquet')
+    self.survey_df.to_parquet(path)
+    pd.testing.assert_frame_equal(survey_summary.summarize_survey_module(path, 'Lifestyle'),
+                                  self.expected.summarize_module('Lifestyle'), check_dtype=False)
+    self.assertIs(survey_summary.get_survey_summarizer(path), survey_summary.get_survey_summarizer(path))
+
+  def test_person_id_out_of_range(self):
+    path = os.path.join(self.tmpdir.name, 'survey.parquet')
+    self.survey_df.assign(person_id=-1).to_parquet(path)
+    with self.assertRaisesRegex(ValueError, 'exact=False'):
+      survey_summary.SurveySummarizer(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,150 @@
+"""Tests for the WorkspaceMetadata class."""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from terra_widgets.workspace_metadata import WorkspaceMetadata
+
+AOU_USER = 'a@researchallofus.org'
+TERRA_USER = 'a@x.org'
+AOU_API = 'http://localhost/v1/workspaces'
+
+TERRA_WORKSPACES = [
+    {'accessLevel': 'OWNER', 'public': False,
+     'workspace': {'name': 'aou-rw-1', 'workspaceId': 'uuid-1', 'bucketName': 'fc-1', 'attributes': {}}},
+    {'accessLevel': 'READER', 'public': False,
+     'workspace': {'name': 'aou-rw-2', 'workspaceId': 'uuid-2', 'bucketName': 'fc-2', 'attributes': {}}},
+    {'accessLevel': 'READER', 'public': True,
+     'workspace': {'name': 'aou-rw-3', 'workspaceId': 'uuid-3', 'bucketName': 'fc-3', 'attributes': {}}},
+]
+
+AOU_WORKSPACES = [
+    {'accessLevel': 'WRITER', 'workspace': {'name': 'My study', 'id': 'aou-rw-1', 'published': False}},
+    {'accessLevel': 'READER', 'workspace': {'name': 'Shared study', 'id': 'aou-rw-2', 'published': False}},
+    {'accessLevel': 'READER', 'workspace': {'name': 'Featured study', 'id': 'aou-rw-3', 'published': True}},
+]
+
+
+class StubApis:
+  """Local stand-ins for the Terra and All of Us workspace APIs, which count their calls."""
+
+  def __init__(self):
+    self.terra_calls = 0
+    self.aou_calls = []
+    self.release = threading.Event()
+    self.release.set()
+
+  def fetch_terra_workspaces(self):
+    self.release.wait()
+    self.terra_calls += 1
+    return TERRA_WORKSPACES
+
+  def fetch_aou_workspaces(self, aou_api):
+    self.release.wait()
+    self.aou_calls.append(aou_api)
+    return AOU_WORKSPACES
+
+
+class TestWorkspaceMetadata(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.cache_file = os.path.join(self.tmpdir.name, 'workspace_metadata.json')
+    self.apis = StubApis()
+    self.now = 1000.0
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def _create(self, user, **kwargs):
+    return WorkspaceMetadata(user=user,
+                             aou_api=AOU_API,
+                             fetch_terra_workspaces_fn=self.apis.fetch_terra_workspaces,
+                             fetch_aou_workspaces_fn=self.apis.fetch_aou_workspaces,
+                             cache_file=self.cache_file,
+                             ttl_seconds=60,
+                             clock=lambda: self.now,
+                             **kwargs)
+
+  def test_terra_mappings(self):
+    ws_meta = self._create(TERRA_USER)
+    self.assertEqual(self.apis.aou_calls, [])
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'aou-rw-1': 'uuid-1'})
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(include_private_readonly=True),
+                         {'aou-rw-1': 'uuid-1', 'aou-rw-2': 'uuid-2'})
+    self.assertDictEqual(ws_meta.get_workspace_name_to_bucket_mapping(include_all=True),
+                         {'aou-rw-1': 'fc-1', 'aou-rw-2': 'fc-2', 'aou-rw-3': 'fc-3'})
+    self.assertDictEqual(ws_meta.get_workspace_id_to_bucket_mapping(include_private_readonly=True),
+                         {'uuid-1': 'fc-1', 'uuid-2': 'fc-2'})
+
+  def test_aou_mappings(self):
+    ws_meta = self._create(AOU_USER)
+    self.assertEqual(self.apis.aou_calls, [AOU_API])
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'My study': 'aou-rw-1'})
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(include_private_readonly=True),
+                         {'My study': 'aou-rw-1', 'Shared study': 'aou-rw-2'})
+    # For All of Us workspaces, the Terra workspace names are the AoU workspace ids.
+    self.assertDictEqual(ws_meta.get_workspace_name_to_bucket_mapping(include_all=True),
+                         {'aou-rw-1': 'fc-1', 'aou-rw-2': 'fc-2', 'aou-rw-3': 'fc-3'})
+    self.assertDictEqual(ws_meta.get_workspace_id_to_bucket_mapping(include_private_readonly=True),
+                         {'aou-rw-1': 'fc-1', 'aou-rw-2': 'fc-2'})
+
+  def test_mappings_are_copies(self):
+    ws_meta = self._create(TERRA_USER)
+    ws_meta.get_workspace_name_to_id_mapping().clear()
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'aou-rw-1': 'uuid-1'})
+
+  def test_cache_is_reused_until_it_expires(self):
+    self._create(AOU_USER)
+    ws_meta = self._create(AOU_USER)
+    self.assertEqual((self.apis.terra_calls, len(self.apis.aou_calls)), (1, 1))
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'My study': 'aou-rw-1'})
+    self.now += 61
+    self._create(AOU_USER)
+    self.assertEqual((self.apis.terra_calls, len(self.apis.aou_calls)), (2, 2))
+
+  def test_cache_is_per_user(self):
+    self._create(AOU_USER)
+    ws_meta = self._create(TERRA_USER)
+    self.assertEqual(self.apis.terra_calls, 2)
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'aou-rw-1': 'uuid-1'})
+
+  def test_refresh_ignores_cache(self):
+    ws_meta = self._create(TERRA_USER)
+    ws_meta.refresh()
+    self.assertEqual(self.apis.terra_calls, 2)
+
+  def test_corrupt_cache(self):
+    with open(self.cache_file, 'w') as f:
+      f.write('{not json')
+    ws_meta = self._create(TERRA_USER)
+    self.assertEqual(self.apis.terra_calls, 1)
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'aou-rw-1': 'uuid-1'})
+
+  def test_background_load(self):
+    self.apis.release.clear()
+    loaded = []
+    callback_called = threading.Event()
+    ws_meta = self._create(AOU_USER, background=True)
+    ws_meta.add_done_callback(lambda m: (loaded.append(m), callback_called.set()))
+    self.assertFalse(ws_meta.ready)
+    self.apis.release.set()
+    self.assertDictEqual(ws_meta.get_workspace_name_to_id_mapping(), {'My study': 'aou-rw-1'})
+    self.assertTrue(ws_meta.ready)
+    self.assertTrue(callback_called.wait(timeout=10))
+    self.assertListEqual(loaded, [ws_meta])
+
+  def test_background_error(self):
+    def fail():
+      raise ConnectionError('Terra is unavailable')
+    ws_meta = WorkspaceMetadata(background=True, user=TERRA_USER, fetch_terra_workspaces_fn=fail, cache_file=None)
+    with self.assertRaisesRegex(ConnectionError, 'Terra is unavailable'):
+      ws_meta.wait(timeout=10)
+    with self.assertRaises(ConnectionError):
+      ws_meta.get_workspace_name_to_id_mapping()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -75,6 +75,23 @@ class TestWorkspacePaths(unittest.TestCase):
     with self.assertRaisesRegex(ValueError, '"gs://fc-fake-bucket/notebooks/test1.ipynb" does not match'):
       self.wp.add_html_glob_to_path('gs://fc-fake-bucket/notebooks/test1.ipynb')
 
+  def test_parse_snapshot_path(self):
+    parts = self.wp.parse_snapshot_path(
+        'gs://fc-fake-bucket/reports/test@researchallofus.org/20200701/120000/test1.html.comment.txt')
+    self.assertEqual(parts.user, 'test@researchallofus.org')
+    self.assertEqual(parts.date, '20200701')
+    self.assertEqual(parts.time, '120000')
+    self.assertEqual(parts.file, 'test1.html.comment.txt')
+
+  def test_parse_snapshot_path_wrong_layout(self):
+    for path in ['gs://fc-fake-bucket/notebooks/test1.ipynb',
+                 'gs://fc-other-bucket/reports/test@researchallofus.org/20200701/120000/test1.html',
+                 'gs://fc-fake-bucket/reports/test@researchallofus.org/20200701/test1.html',
+                 'gs://fc-fake-bucket/reports/test@researchallofus.org/2020071/120000/test1.html',
+                 'gs://fc-fake-bucket/reports/test@researchallofus.org/20200701/120000/extra/test1.html',
+                 'gs://fc-fake-bucket/reports/not-a-user/20200701/120000/test1.html']:
+      self.assertIsNone(self.wp.parse_snapshot_path(path), path)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -1,35 +1,273 @@
-"""Methods to obtain workspace metadata for the current user in various formats."""
+"""Methods to obtain workspace metadata for the current user in various formats.
 
+The workspace lists from Terra and, for All of Us users, from the All of Us API are fetched
+concurrently, optionally in the background so that a user interface can be displayed before
+they arrive. They are cached on local disk for a short while so that a new Jupyter kernel
+does not need to fetch them again.
+"""
+
+import concurrent.futures
 import json
 import os
+import threading
+import time
+from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from terra_widgets.auth import authorized_get
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'terra_widgets', 'workspace_metadata.json')
+# Workspaces are created and shared rarely, so a few minutes of staleness is fine.
+DEFAULT_TTL_SECONDS = 900
+DEFAULT_TIMEOUT_SECONDS = 60
+
+# Only these fields are used, so only these are requested from Terra and kept in the cache.
+TERRA_FIELDS = 'accessLevel,public,workspace.name,workspace.workspaceId,workspace.bucketName'
+
+# The three levels of access by which the mappings can be filtered: editable workspaces,
+# editable and private read-only workspaces, and all workspaces visible to the user.
+_EDITABLE, _PRIVATE_READONLY, _ALL = range(3)
+
+
+def fetch_terra_workspaces() -> List[Dict[str, Any]]:
+  """Retrieve the list of Terra workspaces visible to the current user."""
+  # This is slow to import, so only import it when the metadata is needed.
+  import firecloud.api as fapi
+
+  response = fapi.list_workspaces(fields=TERRA_FIELDS)
+  response.raise_for_status()
+  return response.json()
+
+
+def fetch_aou_workspaces(aou_api: str) -> List[Dict[str, Any]]:
+  """Retrieve the list of All of Us workspaces visible to the current user.
+
+  Args:
+    aou_api: The URL of the workspaces endpoint of the All of Us API.
+  Returns:
+    The list of workspaces.
+  """
+  response = authorized_get(aou_api, headers={'Content-Type': 'application/json'}, timeout=DEFAULT_TIMEOUT_SECONDS)
+  response.raise_for_status()
+  return response.json()['items']
+
 
-import firecloud.api as fapi
-from IPython import get_ipython
+def _trim_terra_workspace(ws: Dict[str, Any]) -> Dict[str, Any]:
+  return {'accessLevel': ws['accessLevel'],
+          'public': ws.get('public', False),
+          'workspace': {k: ws['workspace'][k] for k in ('name', 'workspaceId', 'bucketName')}}
+
+
+def _trim_aou_workspace(ws: Dict[str, Any]) -> Dict[str, Any]:
+  return {'accessLevel': ws['accessLevel'],
+          'workspace': {k: ws['workspace'][k] for k in ('name', 'id', 'published')}}
 
 
 class WorkspaceMetadata:
-  """Encapsulate all logic for obtaining workspace metadata."""
+  """Encapsulate all logic for obtaining workspace metadata.
+
+  The mappings are computed once, when the metadata arrives. If the metadata is loaded in the
+  background, the mapping methods block until it has arrived.
+  """
 
   AOU_DOMAIN = '@researchallofus.org'
   EDIT_ACCESS_LEVELS = ['WRITER', 'OWNER', 'PROJECT_OWNER']
   AOU_PROD_API = 'https://api.workbench.researchallofus.org/v1/workspaces'
 
-  def __init__(self):
-    self.user = os.getenv('OWNER_EMAIL')
-    self.terra_workspaces = fapi.list_workspaces().json()
-    if self.user.endswith(self.AOU_DOMAIN):
-      aou_api = os.getenv('RW_API_BASE_URL')
-      if not aou_api:
-        aou_api = self.AOU_PROD_API
+  def __init__(self,
+               background: bool = False,
+               user: Optional[str] = None,
+               aou_api: Optional[str] = None,
+               fetch_terra_workspaces_fn: Callable[[], List[Dict[str, Any]]] = fetch_terra_workspaces,
+               fetch_aou_workspaces_fn: Callable[[str], List[Dict[str, Any]]] = fetch_aou_workspaces,
+               cache_file: Optional[str] = DEFAULT_CACHE_FILE,
+               ttl_seconds: float = DEFAULT_TTL_SECONDS,
+               clock: Callable[[], float] = time.time):
+    """Initialize the metadata and start loading it.
+
+    Args:
+      background: Whether to load the metadata in a background thread instead of waiting for it.
+      user: The email address of the current user. Defaults to the OWNER_EMAIL environment variable.
+      aou_api: The workspaces endpoint of the All of Us API. Defaults to the RW_API_BASE_URL environment
+               variable, or else to the production API.
+      fetch_terra_workspaces_fn: The function used to retrieve the Terra workspaces.
+      fetch_aou_workspaces_fn: The function used to retrieve the All of Us workspaces, given the endpoint.
+      cache_file: The local file in which to cache the metadata, or None to not cache it.
+      ttl_seconds: How long the cached metadata may be used before it is fetched again.
+      clock: The function used to obtain the current time, in seconds since the epoch.
+    """
+    self.user = user or os.getenv('OWNER_EMAIL')
+    self.aou_api = aou_api or os.getenv('RW_API_BASE_URL') or self.AOU_PROD_API
+    self.cache_file = cache_file
+    self.ttl_seconds = ttl_seconds
+    self._fetch_terra_workspaces = fetch_terra_workspaces_fn
+    self._fetch_aou_workspaces = fetch_aou_workspaces_fn
+    self._clock = clock
+    self._terra_workspaces: List[Dict[str, Any]] = []
+    self._aou_workspaces: Optional[List[Dict[str, Any]]] = None
+    self._mappings: Dict[Tuple[str, int], Dict[str, str]] = {}
+    self._lock = threading.Lock()
+    self._future: Optional[concurrent.futures.Future] = None
+    self.refresh(background=background, use_cache=True)
+
+  @property
+  def is_aou_user(self) -> bool:
+    return bool(self.user) and self.user.endswith(self.AOU_DOMAIN)
+
+  @property
+  def ready(self) -> bool:
+    """Whether the metadata has finished loading, successfully or not."""
+    return self._future.done()
+
+  def wait(self, timeout: Optional[float] = None):
+    """Wait for the metadata to finish loading.
+
+    Args:
+      timeout: The maximum number of seconds to wait, or None to wait indefinitely.
+    Raises:
+      concurrent.futures.TimeoutError: The metadata did not finish loading in time.
+      Exception: Whatever error occurred while fetching the metadata.
+    """
+    self._future.result(timeout=timeout)
+
+  def add_done_callback(self, fn: Callable[['WorkspaceMetadata'], None]):
+    """Call the function, with this object, once the metadata has finished loading.
+
+    If loading has already finished, the function is called immediately. Otherwise it is called from
+    the background thread. Call wait() within the function to check whether loading succeeded.
+    """
+    self._future.add_done_callback(lambda _: fn(self))
+
+  @property
+  def terra_workspaces(self) -> List[Dict[str, Any]]:
+    self.wait()
+    return self._terra_workspaces
+
+  @property
+  def aou_workspaces(self) -> Optional[List[Dict[str, Any]]]:
+    self.wait()
+    return self._aou_workspaces
+
+  def refresh(self, background: bool = False, use_cache: bool = False):
+    """Load the metadata again.
+
+    Args:
+      background: Whether to load the metadata in a background thread instead of waiting for it.
+      use_cache: Whether to use the cached metadata if it has not yet expired.
+    """
+    with self._lock:
+      # If a load is already in progress, let it finish instead of starting another.
+      start = self._future is None or self._future.done()
+      if start:
+        self._future = concurrent.futures.Future()
+      future = self._future
+    if start and background:
+      threading.Thread(target=self._load, args=(future, use_cache), name='terra_widgets_metadata', daemon=True).start()
+    elif start:
+      self._load(future, use_cache)
+    if not background:
+      self.wait()
+
+  def _load(self, future: concurrent.futures.Future, use_cache: bool):
+    try:
+      cached = self._read_cache() if use_cache else None
+      if cached:
+        terra_workspaces, aou_workspaces = cached
+      else:
+        terra_workspaces, aou_workspaces = self._fetch()
+        self._write_cache(terra_workspaces, aou_workspaces)
+      self._index(terra_workspaces, aou_workspaces)
+    except Exception as e:  # pylint: disable=broad-except
+      future.set_exception(e)
+    else:
+      future.set_result(None)
+
+  def _fetch(self) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Fetch the Terra and All of Us workspace lists concurrently."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+      terra_future = executor.submit(self._fetch_terra_workspaces)
       # Use the All of Us API to get the human-readable workspace names. For All of Us workspaces,
-      # the Terra workspace metadata the workspace names are actually the AoU workspace ids.
-      aou_response = get_ipython().getoutput(f'''curl -H "Content-Type: application/json" \
-          -H "Authorization: Bearer $(gcloud auth print-access-token)" \
-          "{aou_api}" 2>/dev/null | jq .''')
-      self.aou_workspaces = json.loads(''.join(aou_response))['items']
+      # in the Terra workspace metadata the workspace names are actually the AoU workspace ids.
+      aou_future = executor.submit(self._fetch_aou_workspaces, self.aou_api) if self.is_aou_user else None
+      terra_workspaces = [_trim_terra_workspace(ws) for ws in terra_future.result()]
+      aou_workspaces = [_trim_aou_workspace(ws) for ws in aou_future.result()] if aou_future else None
+    return terra_workspaces, aou_workspaces
+
+  def _read_cache(self) -> Optional[Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]]:
+    if not self.cache_file:
+      return None
+    try:
+      with open(self.cache_file, 'r') as f:
+        cached = json.load(f)
+      if (cached.get('version') != CACHE_VERSION
+          or cached.get('user') != self.user
+          or cached.get('aou_api') != self.aou_api
+          or self._clock() - cached['fetched_at'] > self.ttl_seconds):
+        return None
+      return cached['terra_workspaces'], cached['aou_workspaces']
+    except (OSError, ValueError, TypeError, KeyError):
+      return None  # A missing or corrupt cache is the same as no cache.
+
+  def _write_cache(self, terra_workspaces: List[Dict[str, Any]], aou_workspaces: Optional[List[Dict[str, Any]]]):
+    if not self.cache_file:
+      return
+    try:
+      os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+      temp_file = f'{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+      with open(temp_file, 'w') as f:
+        json.dump({'version': CACHE_VERSION,
+                   'user': self.user,
+                   'aou_api': self.aou_api,
+                   'fetched_at': self._clock(),
+                   'terra_workspaces': terra_workspaces,
+                   'aou_workspaces': aou_workspaces},
+                  f, separators=(',', ':'))
+      os.replace(temp_file, self.cache_file)
+    except OSError:
+      pass  # The metadata is still usable, it just will not be reused by the next kernel.
+
+  def _index(self, terra_workspaces: List[Dict[str, Any]], aou_workspaces: Optional[List[Dict[str, Any]]]):
+    """Compute every mapping once, so that retrieving one is a dictionary copy rather than a scan."""
+    if aou_workspaces:
+      # Tuples of name, id, whether it is private and whether the user can edit it.
+      workspaces = [(ws['workspace']['name'], ws['workspace']['id'], not ws['workspace']['published'],
+                     ws['accessLevel'] in self.EDIT_ACCESS_LEVELS) for ws in aou_workspaces]
     else:
-      self.aou_workspaces = None
+      workspaces = [(ws['workspace']['name'], ws['workspace']['workspaceId'], not ws['public'],
+                     ws['accessLevel'] in self.EDIT_ACCESS_LEVELS) for ws in terra_workspaces]
+    terra_name_to_bucket = {ws['workspace']['name']: ws['workspace']['bucketName'] for ws in terra_workspaces}
+    terra_id_to_bucket = {ws['workspace']['workspaceId']: ws['workspace']['bucketName'] for ws in terra_workspaces}
+
+    mappings = {}
+    for access in (_EDITABLE, _PRIVATE_READONLY, _ALL):
+      name_to_id = {name: ws_id for name, ws_id, private, editable in workspaces
+                    if access == _ALL or (access == _PRIVATE_READONLY and private) or editable}
+      if aou_workspaces:
+        # For All of Us workspaces, in the Terra workspace metadata the workspace names are actually
+        # the AoU workspace ids.
+        name_to_bucket = {ws_id: terra_name_to_bucket[ws_id] for ws_id in name_to_id.values()
+                          if ws_id in terra_name_to_bucket}
+        id_to_bucket = name_to_bucket
+      else:
+        name_to_bucket = {name: terra_name_to_bucket[name] for name in name_to_id}
+        id_to_bucket = {ws_id: terra_id_to_bucket[ws_id] for ws_id in name_to_id.values()}
+      mappings[('name_to_id', access)] = name_to_id
+      mappings[('name_to_bucket', access)] = name_to_bucket
+      mappings[('id_to_bucket', access)] = id_to_bucket
+
+    self._terra_workspaces = terra_workspaces
+    self._aou_workspaces = aou_workspaces
+    self._mappings = mappings
+
+  def _get_mapping(self, kind: str, include_private_readonly: bool, include_all: bool) -> Dict[str, str]:
+    self.wait()
+    access = _ALL if include_all else _PRIVATE_READONLY if include_private_readonly else _EDITABLE
+    return dict(self._mappings[(kind, access)])
 
   def get_workspace_name_to_id_mapping(self, include_private_readonly: bool = False, include_all: bool = False) -> Dict[str, str]:
     """Retrieve a mapping of workspace names to ids.
@@ -40,16 +278,7 @@ class WorkspaceMetadata:
     Returns:
       A dictionary of workspace names to workspace ids.
     """
-    if self.aou_workspaces:
-      return {ws['workspace']['name']: ws['workspace']['id'] for ws in self.aou_workspaces
-              if include_all
-              or (include_private_readonly and not ws['workspace']['published'])
-              or ws['accessLevel'] in self.EDIT_ACCESS_LEVELS}
-    else:
-      return {ws['workspace']['name']: ws['workspace']['workspaceId'] for ws in self.terra_workspaces
-              if include_all
-              or (include_private_readonly and not ws['public'])
-              or ws['accessLevel'] in self.EDIT_ACCESS_LEVELS}
+    return self._get_mapping('name_to_id', include_private_readonly=include_private_readonly, include_all=include_all)
 
   def get_workspace_name_to_bucket_mapping(self, include_private_readonly: bool = False, include_all: bool = False) -> Dict[str, str]:
     """Retrieve a mapping of workspace names to Cloud Storage bucket names.
@@ -60,16 +289,8 @@ class WorkspaceMetadata:
     Returns:
       A dictionary of workspace names to workspace bucket names.
     """
-    ws_mapping = self.get_workspace_name_to_id_mapping(include_private_readonly=include_private_readonly,
-                                                       include_all=include_all)
-    if self.aou_workspaces:
-      # For All of Us workspaces, in the Terra workspace metadata the workspace names are actually
-      # the AoU workspace ids.
-      terra_ws_names = ws_mapping.values()
-    else:
-      terra_ws_names = ws_mapping.keys()
-    return {ws['workspace']['name']: ws['workspace']['bucketName'] for ws in self.terra_workspaces
-            if ws['workspace']['name'] in terra_ws_names}
+    return self._get_mapping('name_to_bucket', include_private_readonly=include_private_readonly,
+                             include_all=include_all)
 
   def get_workspace_id_to_bucket_mapping(self, include_private_readonly: bool = False, include_all: bool = False) -> Dict[str, str]:
     """Retrieve a mapping of workspace ids to Cloud Storage bucket names.
@@ -80,13 +301,5 @@ class WorkspaceMetadata:
     Returns:
       A dictionary of workspace names to workspace bucket names.
     """
-    ws_mapping = self.get_workspace_name_to_id_mapping(include_private_readonly=include_private_readonly,
-                                                       include_all=include_all)
-    if self.aou_workspaces:
-      # For All of Us workspaces, in the Terra workspace metadata the workspace names are actually
-      # the AoU workspace ids.
-      terra_metadata_key = 'name'
-    else:
-      terra_metadata_key = 'workspaceId'
-    return {ws['workspace'][terra_metadata_key]: ws['workspace']['bucketName'] for ws in self.terra_workspaces
-            if ws['workspace'][terra_metadata_key] in ws_mapping.values()}
+    return self._get_mapping('id_to_bucket', include_private_readonly=include_private_readonly,
+                             include_all=include_all)
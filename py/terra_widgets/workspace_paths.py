@@ -6,9 +6,11 @@ import os
 from typing import Dict
 from typing import List
 from typing import NamedTuple
+from typing import Optional
 
 
 WorkspaceDestination = NamedTuple('WorkspaceDestination', [('html_file', str), ('comment_file', str)])
+SnapshotPathParts = NamedTuple('SnapshotPathParts', [('user', str), ('date', str), ('time', str), ('file', str)])
 
 
 class WorkspacePaths:
@@ -98,6 +100,28 @@ class WorkspacePaths:
     self._check_path_matches_glob(path, self.get_time_glob())
     return os.path.join(path, '*' + self.HTML_FILE_SUFFIX)
 
+  def parse_snapshot_path(self, path: str) -> Optional[SnapshotPathParts]:
+    """Split the path to a file within the HTML snapshots folder into its user, date, time and file name.
+
+    Args:
+      path: The full path to a file, such as an HTML snapshot or its comment file.
+    Returns:
+      The parts of the path, or None if the path does not match the layout of the HTML snapshots folder.
+    """
+    prefix = self.get_subfolder() + '/'
+    if not path.startswith(prefix):
+      return None
+    parts = path[len(prefix):].split('/')
+    if len(parts) != 4:
+      return None
+    user, date, time, file = parts
+    if not (fnmatch.fnmatch(user, self.USER_GLOB)
+            and fnmatch.fnmatch(date, self.DATE_GLOB)
+            and fnmatch.fnmatch(time, self.TIME_GLOB)
+            and file):
+      return None
+    return SnapshotPathParts(user=user, date=date, time=time, file=file)
+
   @staticmethod
   def _check_path_matches_glob(path: str, glob_to_match: str):
     if not fnmatch.fnmatch(path, glob_to_match):
@@ -0,0 +1,5 @@
+# Evaluate the cohort query once, holding the person_ids of our cohort in a temporary table. The
+# snippets which follow then read that table instead of each evaluating COHORT_QUERY again, which
+# matters for complex cohorts from Cohort Builder. For small cohorts, as_array=True instead holds
+# the sorted person_ids locally and passes them to each query as a query parameter.
+COHORT_QUERY = materialize_cohort(COHORT_QUERY)
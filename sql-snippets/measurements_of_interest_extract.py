@@ -0,0 +1,9 @@
+# Extract the measurements of interest for our cohort into a temporary table, with one scan of
+# the measurement table. The measurement snippets which follow then read this small extract
+# instead of scanning the whole measurement table again, as long as MEASUREMENT_OF_INTEREST
+# and COHORT_QUERY are unchanged and MEASUREMENT_CONCEPT_ID is one of the measurements of
+# interest. Use query_log.py to compare the bytes processed by each query.
+measurements_of_interest_extract = extract_measurements_of_interest(
+  CDR=CDR,
+  COHORT_QUERY=COHORT_QUERY,
+  MEASUREMENT_OF_INTEREST=MEASUREMENT_OF_INTEREST)
@@ -0,0 +1,5 @@
+# Review the queries run so far, with the bytes each one processed, whether its result came from
+# the local cache, and which extract it read, if any.
+query_log_df = get_query_log()
+
+query_log_df
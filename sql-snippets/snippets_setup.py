@@ -8,6 +8,42 @@ from plotnine import *  # Provides a ggplot-like interface to matplotlib.
 # Get the BigQuery curated dataset for the current workspace context.
 CDR = os.environ['WORKSPACE_CDR']
 
+try:
+  # Run queries with query parameters, caching their results locally so that rerunning a cell is fast.
+  from terra_widgets.query_runner import extract_measurements_of_interest
+  from terra_widgets.query_runner import get_query_log
+  from terra_widgets.query_runner import materialize_cohort
+  from terra_widgets.query_runner import run_query
+except ImportError:
+  def run_query(query, **values):
+    """Run the query after formatting the values of its placeholders into it."""
+    return pd.io.gbq.read_gbq(query.format(**values), dialect='standard')
+
+  def extract_measurements_of_interest(**values):
+    print('The terra_widgets package is not installed, so queries will read the whole measurement table.')
+
+  def get_query_log():
+    return pd.DataFrame()
+
+  def materialize_cohort(cohort_query, as_array=False):
+    print('The terra_widgets package is not installed, so each query will evaluate the cohort query again.')
+    return cohort_query
+
+try:
+  # Compute exact ages from the year, month and day of each date, for whole columns at once.
+  from terra_widgets.age import age_in_years
+except ImportError:
+  def age_in_years(birth_datetime, as_of=None):
+    """Compute the age in whole years of each participant, as of today or of the time of an event."""
+    birth = pd.to_datetime(birth_datetime)
+    if isinstance(as_of, pd.Series):
+      as_of = pd.to_datetime(as_of)
+      year, month, day = as_of.dt.year, as_of.dt.month, as_of.dt.day
+    else:
+      as_of = pd.Timestamp('today') if as_of is None else pd.Timestamp(as_of)
+      year, month, day = as_of.year, as_of.month, as_of.day
+    return (year - birth.dt.year) - ((month * 100 + day) < (birth.dt.month * 100 + birth.dt.day))
+
 ## Plot setup.
 theme_set(theme_bw(base_size = 11)) # Default theme for plots.
 